@@ -0,0 +1,808 @@
+import io
+import os
+import sys
+import mmap
+import struct
+import random
+import socket
+import argparse
+import contextlib
+import tempfile
+import threading
+import time
+
+from dma_utils import RegisterBank, SgRing, SgStandInDevice, SG_DESCRIPTOR_SIZE, LENGTH_HEADER, send_framed, CompressionPool, decompress_blocks, FileSink, HexTextSink, StagedFileSink, MappedFileSink, SpscRing, RegionAllocator, Doorbell
+
+# Register Offsets (same as the drivers, duplicated so this script runs without the hardware)
+S2MM_CONTROL_REGISTER     = 0x30
+S2MM_STATUS_REGISTER      = 0x34
+S2MM_DST_ADDRESS_REGISTER = 0x48
+S2MM_BUFF_LENGTH_REGISTER = 0x58
+
+
+def open_stand_in(size):
+    """File-backed mmap used as a stand-in for /dev/axi_mem."""
+    stand_in_file = tempfile.TemporaryFile()
+    stand_in_file.truncate(size)
+    return stand_in_file, mmap.mmap(stand_in_file.fileno(), size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+
+@contextlib.contextmanager
+def stand_in_output(size, output_dir=None):
+    """open_stand_in(size) and an empty temporary output file, yields (virtual_addr, output path) and removes both."""
+    stand_in_file, virtual_addr = open_stand_in(size)
+    output = tempfile.NamedTemporaryFile(dir=output_dir, delete=False)
+    output.close()
+    try:
+        yield virtual_addr, output.name
+    finally:
+        os.unlink(output.name)
+        virtual_addr.close()
+        stand_in_file.close()
+
+
+def legacy_write_dma(virtual_addr, offset, value):
+    virtual_addr.seek(offset)
+    virtual_addr.write((value).to_bytes(4, byteorder='little'))
+
+def legacy_read_dma(virtual_addr, offset):
+    virtual_addr.seek(offset)
+    data = virtual_addr.read(4)
+    return int.from_bytes(data, byteorder='little')
+
+
+def print_rate(label, calls, elapsed, reference=None):
+    rate = calls/elapsed
+    if reference is None:
+        print(f"{label:<28}: {rate/1e6:8.3f} Mcalls/s | {elapsed/calls*1e9:8.1f} ns/call")
+    else:
+        print(f"{label:<28}: {rate/1e6:8.3f} Mcalls/s | {elapsed/calls*1e9:8.1f} ns/call | x{reference/elapsed:.2f}")
+
+
+def do_register_bank_benchmark(iterations):
+    print("==========================================================")
+    print(f"Register access benchmark | {iterations} calls per test | file-backed stand-in for /dev/axi_mem")
+    stand_in_file, virtual_addr = open_stand_in(65536)
+    bank = RegisterBank(virtual_addr)
+
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        legacy_write_dma(virtual_addr, S2MM_BUFF_LENGTH_REGISTER, i & 0xFFFF)
+    legacy_write = time.perf_counter() - start_time
+    print_rate("legacy write_dma", iterations, legacy_write)
+
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        bank[S2MM_BUFF_LENGTH_REGISTER] = i & 0xFFFF
+    print_rate("RegisterBank set", iterations, time.perf_counter() - start_time, legacy_write)
+
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        legacy_read_dma(virtual_addr, S2MM_STATUS_REGISTER)
+    legacy_read = time.perf_counter() - start_time
+    print_rate("legacy read_dma", iterations, legacy_read)
+
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        bank[S2MM_STATUS_REGISTER]
+    print_rate("RegisterBank get", iterations, time.perf_counter() - start_time, legacy_read)
+
+    # Per-packet sequence of the fill loop: address, length, status poll, length read back
+    start_time = time.perf_counter()
+    for i in range(iterations // 4):
+        legacy_write_dma(virtual_addr, S2MM_DST_ADDRESS_REGISTER, i)
+        legacy_write_dma(virtual_addr, S2MM_BUFF_LENGTH_REGISTER, 65000)
+        legacy_read_dma(virtual_addr, S2MM_STATUS_REGISTER)
+        legacy_read_dma(virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
+    legacy_packet = time.perf_counter() - start_time
+    print_rate("legacy packet sequence", iterations, legacy_packet)
+
+    start_time = time.perf_counter()
+    for i in range(iterations // 4):
+        bank.write_many(((S2MM_DST_ADDRESS_REGISTER, i), (S2MM_BUFF_LENGTH_REGISTER, 65000)))
+        bank[S2MM_STATUS_REGISTER]
+        bank[S2MM_BUFF_LENGTH_REGISTER]
+    print_rate("RegisterBank packet sequence", iterations, time.perf_counter() - start_time, legacy_packet)
+
+    bank.close()
+    stand_in_file.close()
+    print("==========================================================")
+
+
+def do_soc_driver_benchmark(iterations, extension_dir, batch):
+    print("==========================================================")
+    print(f"SOC_driver benchmark | {iterations} register reads per test | read_many batches of {batch} | file-backed stand-in for /dev/axi_mem")
+    sys.path.insert(0, extension_dir)
+    try:
+        import SOC_driver
+    except ImportError as error:
+        print(f"SOC_driver not available ({error}), build it with 'make compile' in {extension_dir}")
+        return
+    stand_in_file, virtual_addr = open_stand_in(65536)
+    bank = RegisterBank(virtual_addr)
+    device = SOC_driver.Device(f"/proc/self/fd/{stand_in_file.fileno()}", 0, 65536)
+    offsets = [S2MM_STATUS_REGISTER, S2MM_BUFF_LENGTH_REGISTER] * (batch // 2)
+
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        legacy_read_dma(virtual_addr, S2MM_STATUS_REGISTER)
+    legacy_read = time.perf_counter() - start_time
+    print_rate("legacy read_dma", iterations, legacy_read)
+
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        bank[S2MM_STATUS_REGISTER]
+    print_rate("RegisterBank get", iterations, time.perf_counter() - start_time, legacy_read)
+
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        device.read(S2MM_STATUS_REGISTER)
+    print_rate("Device.read", iterations, time.perf_counter() - start_time, legacy_read)
+
+    start_time = time.perf_counter()
+    for i in range(iterations // len(offsets)):
+        device.read_many(offsets)
+    print_rate("Device.read_many", iterations // len(offsets) * len(offsets), time.perf_counter() - start_time, legacy_read)
+
+    pairs = [(S2MM_DST_ADDRESS_REGISTER, 0x92000000), (S2MM_BUFF_LENGTH_REGISTER, 65000)] * (batch // 2)
+    start_time = time.perf_counter()
+    for i in range(iterations // len(pairs)):
+        device.write_many(pairs)
+    print_rate("Device.write_many", iterations // len(pairs) * len(pairs), time.perf_counter() - start_time, legacy_read)
+
+    device.close()
+    bank.close()
+    stand_in_file.close()
+    print("==========================================================")
+
+
+def do_sg_benchmark(iterations, n_slots, batch):
+    print("==========================================================")
+    print(f"Scatter-gather ring benchmark | {iterations} packets | {n_slots} descriptors | hardware stand-in completes {batch} packets per harvest")
+    slot_size   = 4096
+    memory_phys = 0x02000000
+    desc_offset = n_slots*slot_size
+    memory      = bytearray(desc_offset + n_slots*SG_DESCRIPTOR_SIZE)
+    regs        = RegisterBank(bytearray(0x100))
+    ring        = SgRing(RegisterBank(memory, desc_offset, n_slots*SG_DESCRIPTOR_SIZE), memory_phys + desc_offset, memory_phys, slot_size, n_slots)
+    device      = SgStandInDevice(regs, memory, memory_phys)
+    ring.build()
+    ring.start(regs)
+    packets = [bytes([i & 0xFF]) * (64 + i % 512) for i in range(256)]
+
+    pushed   = 0
+    received = 0
+    harvests = 0
+    errors   = 0
+    elapsed  = 0.0
+    while received < iterations:
+        for i in range(min(batch, iterations - pushed)):
+            if not device.push(packets[(pushed) % len(packets)]):
+                break
+            pushed += 1
+        # Only the software side is timed: descriptor harvest, data check, recycle
+        start_time = time.perf_counter()
+        completed = ring.harvest()
+        for slot, length, status in completed:
+            expected = packets[received % len(packets)]
+            if length != len(expected) or memory[slot*slot_size:slot*slot_size + length] != expected:
+                errors += 1
+            received += 1
+        ring.recycle(len(completed))
+        elapsed += time.perf_counter() - start_time
+        if not completed:
+            raise RuntimeError(f"Descriptor ring stalled after {received} packets")
+        harvests += 1
+
+    print_rate("SG harvest+recycle", received, elapsed)
+    print(f"Harvests: {harvests} | TAILDESC writes/packet: {harvests/received:.3f} (simple mode: 2 register writes + status polls per packet) | Errors: {errors}")
+    print("==========================================================")
+
+
+HANDOFF_IDLE_SLEEP = 10e-6 # the drivers sleep a polling period when there is nothing to do, this keeps single core boards from spinning away the other side's time slice
+
+# Fill -> writer handoff as it was before SpscRing: locked lengths, raw index queue, locked indexes
+def legacy_handoff_producer(data_buffer_array, data_buffer_queue, write_index, read_index, buffer_size, packets):
+    index = 0
+    for i in range(packets):
+        # One slot kept spare: with every slot filled write_index == read_index and the queue reads as empty
+        while data_buffer_array[index] != 0 or (write_index.value + 1) % buffer_size == read_index.value:
+            time.sleep(HANDOFF_IDLE_SLEEP)
+        data_buffer_array[index] = 64 + i % 512
+        data_buffer_queue[write_index.value] = index
+        write_index.value = (write_index.value + 1) % buffer_size
+        index = (index + 1) % buffer_size
+
+def legacy_handoff_consumer(data_buffer_array, data_buffer_queue, write_index, read_index, buffer_size, packets):
+    received = 0
+    while received < packets:
+        if read_index.value == write_index.value:
+            time.sleep(HANDOFF_IDLE_SLEEP)
+            continue
+        index = data_buffer_queue[read_index.value]
+        data_buffer_array[index]
+        read_index.value = (read_index.value + 1) % buffer_size
+        data_buffer_array[index] = 0
+        received += 1
+
+def spsc_handoff_producer(ring, packets, batch):
+    sent = 0
+    while sent < packets:
+        count = min(ring.free(), batch, packets - sent)
+        for i in range(count):
+            ring.put((sent + i) % ring.n_slots * 65536, 64 + (sent + i) % 512)
+        if count:
+            ring.publish()
+        else:
+            time.sleep(HANDOFF_IDLE_SLEEP)
+        sent += count
+
+def spsc_handoff_consumer(ring, packets, batch):
+    received = 0
+    errors   = 0
+    while received < packets:
+        descriptors = ring.peek(batch)
+        for offset, length, sequence, timestamp in descriptors:
+            if length != 64 + received % 512:
+                errors += 1
+            received += 1
+        if descriptors:
+            ring.release(len(descriptors))
+        else:
+            time.sleep(HANDOFF_IDLE_SLEEP)
+    if errors:
+        print(f"SpscRing consumer: {errors} descriptors out of order")
+
+
+def do_spsc_benchmark(iterations, buffer_size, batch):
+    print("==========================================================")
+    print(f"Fill -> writer handoff benchmark | {iterations} packets | {buffer_size} slots | producer and consumer processes")
+    from multiprocessing import Process, Array, Value, RawArray
+
+    def run(producer, consumer):
+        processes = [Process(target=producer[0], args=producer[1]), Process(target=consumer[0], args=consumer[1])]
+        start_time = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return time.perf_counter() - start_time
+
+    data_buffer_array = Array('i', buffer_size)
+    data_buffer_queue = RawArray('i', buffer_size)
+    write_index       = Value('i', 0)
+    read_index        = Value('i', 0)
+    legacy = run((legacy_handoff_producer, (data_buffer_array, data_buffer_queue, write_index, read_index, buffer_size, iterations)),
+                 (legacy_handoff_consumer, (data_buffer_array, data_buffer_queue, write_index, read_index, buffer_size, iterations)))
+    print_rate("Array/RawArray/Value", iterations, legacy)
+
+    for label, ring_batch in (("SpscRing, 1 per publish", 1), (f"SpscRing, {batch} per publish", batch)):
+        ring = SpscRing(buffer_size)
+        elapsed = run((spsc_handoff_producer, (ring, iterations, ring_batch)), (spsc_handoff_consumer, (ring, iterations, ring_batch)))
+        ring.close()
+        print_rate(label, iterations, elapsed, legacy)
+    print("==========================================================")
+
+
+# eclypse acquisition handoff: filled buffer lengths plus the order of the buffers, Manager().list() before SpscRing
+def manager_order_producer(virtual_addr, data_buffer_array, data_buffer_array_order, buffers, buffer_size, packet, packets):
+    for i in range(packets):
+        index = i % buffers
+        while data_buffer_array[index] != 0:
+            time.sleep(HANDOFF_IDLE_SLEEP)
+        virtual_addr[index*buffer_size : index*buffer_size + len(packet)] = packet # stands in for the DMA transfer
+        data_buffer_array[index] = len(packet)
+        data_buffer_array_order.append(index)
+
+def manager_order_consumer(virtual_addr, data_buffer_array, data_buffer_array_order, buffer_size, packets, output):
+    written = 0
+    with open(output, 'ab') as file:
+        while written < packets:
+            if len(data_buffer_array_order) == 0:
+                time.sleep(HANDOFF_IDLE_SLEEP)
+                continue
+            index = data_buffer_array_order[0]
+            file.write(virtual_addr[index*buffer_size : index*buffer_size + data_buffer_array[index]])
+            data_buffer_array[index] = 0
+            data_buffer_array_order.pop(0)
+            written += 1
+
+def ring_order_producer(virtual_addr, ring, buffer_size, packet, packets):
+    for i in range(packets):
+        while not ring.free():
+            time.sleep(HANDOFF_IDLE_SLEEP)
+        offset = ring.next_slot()*buffer_size
+        virtual_addr[offset : offset + len(packet)] = packet
+        ring.push(offset, len(packet))
+
+def ring_order_consumer(virtual_addr, ring, packets, output):
+    written = 0
+    with open(output, 'ab') as file:
+        while written < packets:
+            descriptors = ring.peek()
+            if not descriptors:
+                time.sleep(HANDOFF_IDLE_SLEEP)
+                continue
+            for offset, length, sequence, timestamp in descriptors:
+                file.write(virtual_addr[offset : offset + length])
+            ring.release(len(descriptors))
+            written += len(descriptors)
+
+
+def do_order_queue_benchmark(iterations, buffers, buffer_size, packet_size):
+    print("==========================================================")
+    print(f"Acquisition order queue benchmark | {iterations} buffers of {packet_size} bytes | {buffers} x {buffer_size} byte buffers | file-backed stand-in for the DMA memory, output to a temporary file")
+    from multiprocessing import Process, Array, Manager
+
+    def run(producer, consumer):
+        processes = [Process(target=producer[0], args=producer[1]), Process(target=consumer[0], args=consumer[1])]
+        start_time = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return time.perf_counter() - start_time
+
+    packet = bytes(range(256)) * (packet_size // 256) + bytes(packet_size % 256)
+    with stand_in_output(buffers*buffer_size) as (virtual_addr, output):
+        manager = Manager()
+        data_buffer_array_order = manager.list()
+        data_buffer_array = Array('i', buffers)
+        legacy = run((manager_order_producer, (virtual_addr, data_buffer_array, data_buffer_array_order, buffers, buffer_size, packet, iterations)),
+                     (manager_order_consumer, (virtual_addr, data_buffer_array, data_buffer_array_order, buffer_size, iterations, output)))
+        manager.shutdown()
+        legacy_size = os.path.getsize(output)
+        print(f"{'Manager().list order':<28}: {legacy_size/legacy/1e6:8.2f} MB/s | {iterations/legacy:10.1f} buffers/s")
+
+        os.truncate(output, 0)
+        ring = SpscRing(buffers)
+        elapsed = run((ring_order_producer, (virtual_addr, ring, buffer_size, packet, iterations)), (ring_order_consumer, (virtual_addr, ring, iterations, output)))
+        ring.close()
+        ring_size = os.path.getsize(output)
+        print(f"{'SpscRing order':<28}: {ring_size/elapsed/1e6:8.2f} MB/s | {iterations/elapsed:10.1f} buffers/s | x{legacy/elapsed:.2f}")
+        if ring_size != legacy_size:
+            print(f"***  ERROR  *** | Output sizes differ: {legacy_size} and {ring_size} bytes")
+
+    print("==========================================================")
+
+
+def drain_socket(sock):
+    while sock.recv_into(bytearray(1 << 20)):
+        pass
+
+
+# zynq --pipeline: fill (RegionAllocator + SpscRing) and writer stages on a file-backed stand-in, as processes or threads
+def pipeline_fill(virtual_addr, ring, packet, packets):
+    allocator = RegionAllocator(len(virtual_addr), len(packet))
+    reclaimed = ring.consumed()
+    sent = 0
+    while sent < packets:
+        released = (ring.consumed() - reclaimed) % (1 << 32)
+        allocator.reclaim(released)
+        reclaimed = (reclaimed + released) % (1 << 32)
+        offset = allocator.reserve() if ring.free() else None
+        if offset is None:
+            time.sleep(HANDOFF_IDLE_SLEEP)
+            continue
+        virtual_addr[offset : offset + len(packet)] = packet # stands in for the DMA transfer
+        allocator.commit(len(packet))
+        ring.push(offset, len(packet))
+        sent += 1
+
+def pipeline_writer(virtual_addr, ring, packets, output):
+    written = 0
+    with open(output, 'ab') as file:
+        while written < packets:
+            descriptors = ring.peek()
+            if not descriptors:
+                time.sleep(HANDOFF_IDLE_SLEEP)
+                continue
+            for offset, length, sequence, timestamp in descriptors:
+                file.write(virtual_addr[offset : offset + length])
+            ring.release(len(descriptors))
+            written += len(descriptors)
+
+
+def do_pipeline_benchmark(iterations, packet_size):
+    print("==========================================================")
+    print(f"Pipeline mode benchmark | {iterations} packets of {packet_size} bytes | fill and writer stages, 16 MB file-backed stand-in, output to a temporary file")
+    from multiprocessing import Process
+
+    with stand_in_output(16*1024*1024) as (virtual_addr, output):
+        packet = bytes(range(256)) * (packet_size // 256) + bytes(packet_size % 256)
+        for label, Worker in (("process", Process), ("thread", threading.Thread)):
+            os.truncate(output, 0)
+            ring = SpscRing(4096)
+            cpu_start  = os.times()
+            start_time = time.perf_counter()
+            workers = [Worker(target=pipeline_fill, args=(virtual_addr, ring, packet, iterations)), Worker(target=pipeline_writer, args=(virtual_addr, ring, iterations, output))]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed  = time.perf_counter() - start_time
+            cpu_time = sum(os.times()[:4]) - sum(cpu_start[:4]) # waited children included
+            ring.close()
+            written = os.path.getsize(output)
+            print(f"{label:<28}: {written/elapsed/1e6:8.2f} MB/s | {iterations/elapsed:10.0f} packets/s | CPU {cpu_time:.2f} s, {cpu_time/(written/1e9):.2f} CPU-s/GB")
+    print("==========================================================")
+
+
+def fanout_consumer(ring, consumer, packets, batch):
+    spsc_handoff_consumer(ring.attach(consumer), packets, batch)
+
+
+def do_fanout_benchmark(iterations, buffer_size, batch):
+    print("==========================================================")
+    print(f"Fan-out benchmark | {iterations} packets | {buffer_size} slots | {batch} per publish | one producer, every consumer sees every packet")
+    from multiprocessing import Process
+
+    reference = None
+    for consumers in (1, 2, 3):
+        ring = SpscRing(buffer_size, consumers=consumers)
+        processes = [Process(target=spsc_handoff_producer, args=(ring, iterations, batch))]
+        processes += [Process(target=fanout_consumer, args=(ring, consumer, iterations, batch)) for consumer in range(consumers)]
+        start_time = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start_time
+        ring.close()
+        print_rate(f"SpscRing, {consumers} consumer(s)", iterations, elapsed, reference)
+        reference = reference or elapsed
+    print("==========================================================")
+
+
+# Writer wake up: sleeping one polling period on an empty ring against a Doorbell kicked by the fill process
+def doorbell_producer(ring, doorbell, packets, period):
+    next_time = time.perf_counter()
+    for i in range(packets):
+        next_time += period
+        while time.perf_counter() < next_time:
+            time.sleep(max(0, next_time - time.perf_counter()))
+        while not ring.push(i % ring.n_slots * 65536, 64):
+            time.sleep(HANDOFF_IDLE_SLEEP)
+        if doorbell is not None:
+            doorbell.kick()
+
+def doorbell_consumer(ring, doorbell, packets, polling_period, results):
+    received    = 0
+    latency_sum = 0.0
+    latency_max = 0.0
+    wakeups     = 0
+    cpu_start   = time.process_time()
+    while received < packets:
+        descriptors = ring.peek()
+        if not descriptors:
+            wakeups += 1
+            if doorbell is None:
+                time.sleep(polling_period/10000)
+            else:
+                doorbell.wait(ring.available, 100)
+            continue
+        now = time.monotonic()
+        for offset, length, sequence, timestamp in descriptors:
+            latency_sum += now - timestamp
+            latency_max  = max(latency_max, now - timestamp)
+        ring.release(len(descriptors))
+        received += len(descriptors)
+    results[:] = [latency_sum/packets, latency_max, time.process_time() - cpu_start, wakeups]
+
+
+def do_doorbell_benchmark(iterations, packet_period_us, polling_period):
+    print("==========================================================")
+    print(f"Writer wake up benchmark | {iterations} packets, one every {packet_period_us} us | poll sleeps {polling_period/10} ms per empty ring | producer and consumer processes")
+    from multiprocessing import Process, Array
+
+    for label, doorbell in (("poll", None), ("event", Doorbell())):
+        ring    = SpscRing(256)
+        results = Array('d', 4)
+        processes = [Process(target=doorbell_producer, args=(ring, doorbell, iterations, packet_period_us*1e-6)),
+                     Process(target=doorbell_consumer, args=(ring, doorbell, iterations, polling_period, results))]
+        start_time = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start_time
+        latency, latency_max, cpu_time, wakeups = results[:]
+        print(f"{label:<28}: AVG latency {latency*1e6:9.1f} us | MAX {latency_max*1e6:9.1f} us | consumer CPU {cpu_time/elapsed*100:5.1f} % | {wakeups/elapsed:8.0f} wake ups/s")
+        ring.close()
+        if doorbell is not None:
+            doorbell.close()
+    print("==========================================================")
+
+
+def do_allocator_benchmark(iterations, packet_size, max_packet_size):
+    print("==========================================================")
+    region_size = 16*1024*1024 # S2MM slice of a DMA channel
+    slot_size   = 64*1024
+    print(f"S2MM buffer layout benchmark | {region_size} byte region | packets of 64 to {2*packet_size} bytes, {packet_size} on average | max packet size {max_packet_size} bytes")
+    generator = random.Random(0)
+    lengths = [min(generator.randint(64, 2*packet_size), max_packet_size) for i in range(4096)]
+
+    # Packets held before the writer has to release one
+    fixed_packets = min(240, region_size // slot_size) if max_packet_size <= slot_size else 0
+    fixed_bytes   = sum(lengths[i % len(lengths)] for i in range(fixed_packets))
+    allocator = RegionAllocator(region_size, max_packet_size)
+    while allocator.reserve() is not None:
+        allocator.commit(lengths[allocator.packets % len(lengths)])
+    print(f"{'Fixed 64 KB slots':<28}: {fixed_packets:8d} packets | {fixed_packets/(region_size/1e6):8.1f} packets/MB | {fixed_bytes/region_size*100:5.1f} % of the region holds data")
+    print(f"{'RegionAllocator':<28}: {allocator.packets:8d} packets | {allocator.packets/(region_size/1e6):8.1f} packets/MB | {allocator.bytes/region_size*100:5.1f} % of the region holds data")
+
+    # Bookkeeping cost in the fill loop: one reserve/commit per packet, reclaim in writer sized batches
+    allocator = RegionAllocator(region_size, max_packet_size)
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        if allocator.reserve() is None:
+            allocator.reclaim(32)
+            allocator.reserve()
+        allocator.commit(lengths[i % len(lengths)])
+    elapsed = time.perf_counter() - start_time
+    print_rate("reserve + commit", iterations, elapsed)
+    print(allocator.report("Benchmark"))
+    print("==========================================================")
+
+
+def write_syscalls():
+    with open('/proc/self/io') as io:
+        return next(int(line.split()[1]) for line in io if line.startswith('syscw'))
+
+def do_file_sink_benchmark(iterations, packet_size, batch):
+    print("==========================================================")
+    print(f"Recording file sink benchmark | {iterations} packets of {packet_size} bytes | writer batches of {batch} descriptors, 16 MB file-backed stand-in, output to a temporary file")
+    with stand_in_output(16*1024*1024) as (virtual_addr, output):
+        slots = 16*1024*1024 // packet_size
+        view  = memoryview(virtual_addr)
+
+        def per_packet():
+            # save_mem_to_file_bin: open, slice copy, write and close for every packet
+            for i in range(iterations):
+                offset = (i % slots)*packet_size
+                with open(output, 'ab') as file:
+                    file.write(virtual_addr[offset : offset + packet_size])
+            return iterations
+
+        def per_batch():
+            # Ring writer before FileSink: the file is reopened for every peeked batch
+            for first in range(0, iterations, batch):
+                with open(output, 'ab') as file:
+                    for i in range(first, min(first + batch, iterations)):
+                        offset = (i % slots)*packet_size
+                        file.write(virtual_addr[offset : offset + packet_size])
+            return -(-iterations // batch)
+
+        def file_sink():
+            sink = FileSink(output)
+            for first in range(0, iterations, batch):
+                sink.write([view[(i % slots)*packet_size : (i % slots + 1)*packet_size] for i in range(first, min(first + batch, iterations))])
+            sink.close()
+            return 1
+
+        def mapped_file_sink():
+            # --file_type m: 64 MB extents so a run of a few hundred MB crosses several of them
+            sink = MappedFileSink(output, 64*1024*1024)
+            for first in range(0, iterations, batch):
+                sink.write([view[(i % slots)*packet_size : (i % slots + 1)*packet_size] for i in range(first, min(first + batch, iterations))])
+            sink.close()
+            return 1
+
+        reference = None
+        for label, writer in (("open + write per packet", per_packet), ("open per batch", per_batch), ("FileSink writev", file_sink), ("MappedFileSink, file_type m", mapped_file_sink)):
+            os.truncate(output, 0)
+            syscalls_start = write_syscalls()
+            start_time = time.perf_counter()
+            opens   = writer()
+            elapsed = time.perf_counter() - start_time
+            writes  = write_syscalls() - syscalls_start
+            megabytes = os.path.getsize(output) / 1e6
+            reference = reference or elapsed
+            print(f"{label:<28}: {megabytes/elapsed:8.1f} MB/s | {writes/megabytes:8.2f} write syscalls/MB | {opens/megabytes:8.2f} opens/MB | x{reference/elapsed:.2f}")
+        view.release()
+    print("==========================================================")
+
+
+def do_disk_writer_benchmark(iterations, packet_size, batch, output_dir):
+    print("==========================================================")
+    print(f"Disk writer benchmark | {iterations} packets of {packet_size} bytes | writer batches of {batch} descriptors, output in {output_dir}")
+    print("Writer call: time the ring consumer spends in write() for one batch, i.e. how long the slots stay held")
+    with stand_in_output(16*1024*1024, output_dir) as (virtual_addr, output):
+        slots = 16*1024*1024 // packet_size
+        view  = memoryview(virtual_addr)
+        writers = (("direct FileSink", lambda: FileSink(output)),
+                   ("async, fsync none", lambda: StagedFileSink(output, fsync='none')),
+                   ("async, fsync periodic 0.1 s", lambda: StagedFileSink(output, fsync='periodic', fsync_interval=0.1)),
+                   ("async, fsync every 16 MB", lambda: StagedFileSink(output, fsync='bytes', fsync_bytes=16*1024*1024)),
+                   ("direct + fsync every batch", lambda: FileSink(output)))
+        for label, make_sink in writers:
+            os.truncate(output, 0)
+            sink = make_sink()
+            calls = []
+            start_time = time.perf_counter()
+            for first in range(0, iterations, batch):
+                call_start = time.perf_counter()
+                sink.write([view[(i % slots)*packet_size : (i % slots + 1)*packet_size] for i in range(first, min(first + batch, iterations))])
+                if label.startswith("direct +"):
+                    os.fsync(sink.fd)
+                calls.append(time.perf_counter() - call_start)
+            sink.close()
+            elapsed = time.perf_counter() - start_time
+            calls.sort()
+            megabytes = os.path.getsize(output) / 1e6
+            print(f"{label:<28}: {megabytes/elapsed:8.1f} MB/s | writer call P50 {calls[len(calls)//2]*1e6:8.1f} us | P99 {calls[len(calls)*99//100]*1e6:8.1f} us | MAX {calls[-1]*1e6:8.1f} us")
+        view.release()
+    print("==========================================================")
+
+
+def legacy_save_mem_to_file_hex(virtual_address, offset, byte_count, file_path):
+    data = virtual_address[offset: (offset + byte_count)]
+    with open(file_path, 'a') as file:
+        for i in range(byte_count):
+            file.write(f"{data[i]:02X}")
+            if i % 4 == 3:
+                file.write(" ")
+        file.write("\n")
+
+def do_hex_export_benchmark(iterations, packet_size, batch):
+    print("==========================================================")
+    print(f"Text export benchmark | {iterations} packets of {packet_size} bytes | writer batches of {batch} descriptors, 16 MB file-backed stand-in, output to a temporary file")
+    with stand_in_output(16*1024*1024) as (virtual_addr, output):
+        virtual_addr.write(os.urandom(16*1024*1024))
+        slots = 16*1024*1024 // packet_size
+        view  = memoryview(virtual_addr)
+
+        os.truncate(output, 0)
+        start_time = time.perf_counter()
+        for i in range(iterations):
+            legacy_save_mem_to_file_hex(virtual_addr, (i % slots)*packet_size, packet_size, output)
+        reference = time.perf_counter() - start_time
+        with open(output, 'rb') as file:
+            legacy_text = file.read()
+        print(f"{'f-string per byte':<28}: {iterations*packet_size/reference/1e6:8.2f} MB/s of packet data | {iterations/reference:10.0f} packets/s")
+
+        os.truncate(output, 0)
+        start_time = time.perf_counter()
+        sink = HexTextSink(output)
+        for first in range(0, iterations, batch):
+            sink.write([view[(i % slots)*packet_size : (i % slots + 1)*packet_size] for i in range(first, min(first + batch, iterations))])
+        sink.close()
+        elapsed = time.perf_counter() - start_time
+        with open(output, 'rb') as file:
+            identical = file.read() == legacy_text
+        print(f"{'HexTextSink':<28}: {iterations*packet_size/elapsed/1e6:8.2f} MB/s of packet data | {iterations/elapsed:10.0f} packets/s | x{reference/elapsed:.1f} | same text: {identical}")
+        view.release()
+    print("==========================================================")
+
+
+def do_compression_benchmark(iterations, packet_size, batch):
+    print("==========================================================")
+    print(f"Compression stage benchmark | {iterations} packets of {packet_size} bytes | writer batches of {batch} descriptors, 1 MB blocks")
+    print("Stand-in data: 32-bit little-endian words with 12 significant bits, like ADC samples")
+    generator = random.Random(0)
+    words     = 16*1024*1024 // 4
+    stand_in  = struct.pack(f"<{words}I", *(generator.getrandbits(12) for i in range(words)))
+    slots     = len(stand_in) // packet_size
+    view      = memoryview(stand_in)
+    for codec, level in (('zlib', 1), ('zlib', 6), ('lzma', 0)):
+        for pool, workers in (('thread', 1), ('thread', 2), ('process', 2)):
+            compressor = CompressionPool(codec, level, workers, pool, 1024*1024)
+            frames = []
+            start_time = time.perf_counter()
+            for first in range(0, iterations, batch):
+                compressor.write(0, [view[(i % slots)*packet_size : (i % slots + 1)*packet_size] for i in range(first, min(first + batch, iterations))])
+                frames.extend(frame for channel, frame in compressor.ready())
+            frames.extend(frame for channel, frame in compressor.drain())
+            elapsed = time.perf_counter() - start_time
+            compressor.close()
+            raw = iterations*packet_size
+            compressed = sum(len(frame) for frame in frames)
+            restored = sum(len(block) for block in decompress_blocks(io.BytesIO(b"".join(frames))))
+            print(f"{codec + ' ' + str(level) + ', ' + str(workers) + ' ' + pool + ' workers':<28}: {raw/elapsed/1e6:8.1f} MB/s in | {compressed/elapsed/1e6:8.1f} MB/s out | ratio {raw/compressed:5.2f} | round trip {'ok' if restored == raw else 'FAILED'}")
+    print("==========================================================")
+
+
+def do_header_benchmark(iterations, packet_size):
+    print("==========================================================")
+    print(f"Framed send benchmark | {iterations} packets of {packet_size} bytes | socketpair, file-backed stand-in for the S2MM region")
+    start_time = time.perf_counter()
+    header_cache = {size: struct.pack("!I", size) for size in range(1, 65536)}
+    print(f"{'header_cache build':<28}: {(time.perf_counter() - start_time)*1000:8.2f} ms")
+
+    stand_in_file, virtual_addr = open_stand_in(64*1024*16)
+    results = []
+    for label in ("header_cache + slice", "pack_into + sendmsg"):
+        sender, receiver = socket.socketpair()
+        drain = threading.Thread(target=drain_socket, args=(receiver,))
+        drain.start()
+        header = bytearray(LENGTH_HEADER.size)
+        view = memoryview(virtual_addr)
+        start_time = time.perf_counter()
+        for i in range(iterations):
+            offset = (i % 16)*64*1024
+            if label == "header_cache + slice":
+                sender.sendall(header_cache[packet_size] + virtual_addr[offset : offset + packet_size])
+            else:
+                LENGTH_HEADER.pack_into(header, 0, packet_size)
+                send_framed(sender, header, view[offset : offset + packet_size])
+        elapsed = time.perf_counter() - start_time
+        view.release()
+        sender.close()
+        drain.join()
+        receiver.close()
+        print_rate(label, iterations, elapsed, results[0] if results else None)
+        results.append(elapsed)
+    virtual_addr.close()
+    stand_in_file.close()
+    print("==========================================================")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the AXI DMA python drivers. They run on file-backed stand-ins and do not need the hardware.")
+    parser.add_argument('--register_bank', action='store_true', help='Compare RegisterBank against the seek/read/write register access')
+    parser.add_argument('--sg', action='store_true', help='Measure the software side of the scatter-gather descriptor ring')
+    parser.add_argument('--sg_slots', type=int, default=64, help='Number of descriptors in the scatter-gather ring - default=64')
+    parser.add_argument('--sg_batch', type=int, default=16, help='Packets completed by the stand-in between two harvests - default=16')
+    parser.add_argument('--header', action='store_true', help='Compare the cached header + slice concatenation against pack_into + sendmsg for the TCP sender')
+    parser.add_argument('--packet_size', type=int, default=50000, help='Packet size for --header and --order_queue, average packet size for --allocator - default=50000')
+    parser.add_argument('--soc_driver', action='store_true', help='Compare the SOC_driver.Device C extension against read_dma and RegisterBank')
+    parser.add_argument('--soc_driver_dir', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kernel_module'), help='Directory holding SOC_driver.so - default=kernel_module')
+    parser.add_argument('--soc_driver_batch', type=int, default=64, help='Registers per read_many/write_many call for --soc_driver - default=64')
+    parser.add_argument('--spsc', action='store_true', help='Compare the SpscRing fill -> writer handoff against the Array/RawArray/Value one, packets per second between two processes')
+    parser.add_argument('--spsc_slots', type=int, default=256, help='Ring slots for --spsc and --fanout, a power of two - default=256')
+    parser.add_argument('--spsc_batch', type=int, default=32, help='Descriptors per publish/peek for the batched --spsc run - default=32')
+    parser.add_argument('--order_queue', action='store_true', help='Compare the eclypse acquisition handoff through Manager().list() against SpscRing, writing the buffers to a temporary file')
+    parser.add_argument('--order_buffers', type=int, default=4, help='Buffers for --order_queue, a power of two - default=4')
+    parser.add_argument('--order_buffer_size', type=int, default=4*1024*1024, help='Buffer size in bytes for --order_queue - default=4194304')
+    parser.add_argument('--allocator', action='store_true', help='Compare the fixed 64 KB S2MM slots against the RegionAllocator packed layout, packets held per MB and bookkeeping cost')
+    parser.add_argument('--max_packet_size', type=int, default=65000, help='Max transfer size for --allocator - default=65000')
+    parser.add_argument('--doorbell', action='store_true', help='Compare the writer sleeping one polling period on an empty ring against a Doorbell wake up, latency and consumer CPU. Example usage: --doorbell --iterations 2000')
+    parser.add_argument('--packet_period_us', type=int, default=1000, help='Time between two packets for --doorbell - default=1000')
+    parser.add_argument('--polling_period', type=int, default=20, help='Writer polling period for --doorbell, in 0.1 ms as in the drivers - default=20')
+    parser.add_argument('--fanout', action='store_true', help='SpscRing handoff rate with 1, 2 and 3 consumers each reading every packet, uses --spsc_slots and --spsc_batch')
+    parser.add_argument('--pipeline', action='store_true', help='Compare the zynq fill -> writer pipeline as processes and as threads on a file-backed stand-in, throughput and CPU. Example usage: --pipeline --iterations 20000 --packet_size 4096')
+    parser.add_argument('--file_sink', action='store_true', help='Compare the recording writers: open per packet, open per batch, the persistent FileSink with writev and the preallocated MappedFileSink, uses --packet_size and --spsc_batch. Example usage: --file_sink --iterations 20000 --packet_size 4096')
+    parser.add_argument('--disk_writer', action='store_true', help='Compare the direct FileSink against the async StagedFileSink with each fsync policy, throughput and time the ring consumer is held per batch. Example usage: --disk_writer --iterations 20000 --packet_size 16384 --output_dir /media/sd')
+    parser.add_argument('--output_dir', type=str, default=tempfile.gettempdir(), help='Directory of the --disk_writer output file, put it on the disk to measure - default=system temporary directory')
+    parser.add_argument('--hex_export', action='store_true', help='Compare the per-byte f-string text export against HexTextSink, uses --packet_size and --spsc_batch. Example usage: --hex_export --iterations 200 --packet_size 65536')
+    parser.add_argument('--compression', action='store_true', help='Throughput and ratio of the CompressionPool stage for each codec and pool, uses --packet_size and --spsc_batch. Example usage: --compression --iterations 2000 --packet_size 65536')
+    parser.add_argument('--iterations', type=int, default=1000000, help='Number of calls per test - default=1000000')
+    args = parser.parse_args()
+    if any(slots < 1 or slots & (slots - 1) for slots in (args.spsc_slots, args.order_buffers)):
+        parser.error("--spsc_slots and --order_buffers size a SpscRing, they must be powers of two")
+
+    if args.register_bank:
+        do_register_bank_benchmark(args.iterations)
+    elif args.header:
+        do_header_benchmark(args.iterations, args.packet_size)
+    elif args.sg:
+        do_sg_benchmark(args.iterations, args.sg_slots, args.sg_batch)
+    elif args.disk_writer:
+        do_disk_writer_benchmark(args.iterations, args.packet_size, args.spsc_batch, args.output_dir)
+    elif args.compression:
+        do_compression_benchmark(args.iterations, args.packet_size, args.spsc_batch)
+    elif args.hex_export:
+        do_hex_export_benchmark(args.iterations, args.packet_size, args.spsc_batch)
+    elif args.file_sink:
+        do_file_sink_benchmark(args.iterations, args.packet_size, args.spsc_batch)
+    elif args.pipeline:
+        do_pipeline_benchmark(args.iterations, args.packet_size)
+    elif args.fanout:
+        do_fanout_benchmark(args.iterations, args.spsc_slots, args.spsc_batch)
+    elif args.doorbell:
+        do_doorbell_benchmark(args.iterations, args.packet_period_us, args.polling_period)
+    elif args.allocator:
+        do_allocator_benchmark(args.iterations, args.packet_size, args.max_packet_size)
+    elif args.order_queue:
+        do_order_queue_benchmark(args.iterations, args.order_buffers, args.order_buffer_size, args.packet_size)
+    elif args.spsc:
+        do_spsc_benchmark(args.iterations, args.spsc_slots, args.spsc_batch)
+    elif args.soc_driver:
+        do_soc_driver_benchmark(args.iterations, args.soc_driver_dir, args.soc_driver_batch)
+    else :
+        print("Please provide an argument or call --help")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1612 @@
+import os
+import mmap
+import errno
+import fcntl
+import struct
+import time
+import _thread
+from collections import deque
+
+
+class RegisterBank:
+    """32-bit register window over an mmap, indexed by byte offset.
+
+    Accesses go through a memoryview cast to 'I', so there is no shared file
+    position and no temporary bytes object per access: the bank can be used
+    from any process that inherited the mapping. 'I' is native endian, which
+    matches the little-endian AXI registers on the Zynq ARM cores.
+    """
+
+    def __init__(self, virtual_addr, offset=0, length=None):
+        if length is None:
+            length = len(virtual_addr) - offset
+        length &= ~0x3 # memoryview.cast needs a multiple of the item size (65535 byte maps)
+        self.virtual_addr = virtual_addr
+        self.regs = memoryview(virtual_addr)[offset:offset + length].cast('I')
+
+    def __getitem__(self, offset):
+        return self.regs[offset >> 2]
+
+    def __setitem__(self, offset, value):
+        self.regs[offset >> 2] = value
+
+    def read(self, offset):
+        return self.regs[offset >> 2]
+
+    def write(self, offset, value):
+        self.regs[offset >> 2] = value
+
+    def read_many(self, offsets):
+        regs = self.regs
+        return [regs[offset >> 2] for offset in offsets]
+
+    def write_many(self, pairs):
+        """Write a sequence of (offset, value) pairs in order."""
+        regs = self.regs
+        for offset, value in pairs:
+            regs[offset >> 2] = value
+
+    def release(self):
+        # The view must be released before the underlying mmap can be closed
+        self.regs.release()
+
+    def close(self):
+        self.release()
+        if isinstance(self.virtual_addr, mmap.mmap):
+            self.virtual_addr.close()
+
+
+class HardwareMap:
+    """Memory device mappings created on first use.
+
+    regions maps an attribute name to (offset, length, register_bank); the
+    device is opened and each region mapped the first time the attribute is
+    read, so a command only pays for the regions it touches. Regions mapped
+    before a fork are shared with the child, the others are mapped by each
+    process on its own. Threads of one process share a single mapping per
+    region. timings records (name, seconds) per mapping.
+    """
+
+    def __init__(self, device_path, regions):
+        self.device_path = device_path
+        self.regions     = regions
+        self.fd          = None
+        self.mapped      = []
+        self.timings     = []
+        self.map_lock    = _thread.allocate_lock() # the threading module would double the import time of a status read
+
+    def __getattr__(self, name):
+        # Only reached while the region is not mapped yet
+        try:
+            offset, length, register_bank = self.__dict__['regions'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+        with self.__dict__['map_lock']:
+            if name in self.__dict__: # mapped by another thread meanwhile
+                return self.__dict__[name]
+            return self._map(name, offset, length, register_bank)
+
+    def _map(self, name, offset, length, register_bank):
+        start_time = time.perf_counter()
+        mapping = mmap.mmap(self.device_fd(), length, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=offset)
+        if register_bank:
+            mapping = RegisterBank(mapping)
+        setattr(self, name, mapping)
+        self.mapped.append(name)
+        self.timings.append((name, time.perf_counter() - start_time))
+        return mapping
+
+    def device_fd(self):
+        if self.fd is None:
+            self.fd = os.open(self.device_path, os.O_RDWR | os.O_SYNC)
+        return self.fd
+
+    def close(self):
+        for name in self.mapped:
+            self.__dict__.pop(name).close()
+        self.mapped = []
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+# ioctls of /dev/axi_mem, see kernel_module/axi_mem_ioctl.h
+AXI_MEM_SYNC     = struct.Struct("QQ") # struct axi_mem_sync: offset, length
+AXI_MEM_IOC_INVALIDATE = (1 << 30) | (AXI_MEM_SYNC.size << 16) | (ord('x') << 8) | 1 # _IOW('x', 1, struct axi_mem_sync)
+AXI_MEM_IOC_FLUSH      = (1 << 30) | (AXI_MEM_SYNC.size << 16) | (ord('x') << 8) | 2 # _IOW('x', 2, struct axi_mem_sync)
+
+
+class CacheSync:
+    """Cache maintenance of cached axi_mem buffer mappings.
+
+    Offsets are mmap offsets of /dev/axi_mem without the cache alias bits.
+    invalidate() after the DMA wrote a range and before the CPU reads it,
+    flush() after the CPU wrote a range and before the DMA reads it.
+    """
+
+    def __init__(self, hw):
+        self.hw   = hw
+        self.args = bytearray(AXI_MEM_SYNC.size)
+
+    def _sync(self, request, offset, length):
+        AXI_MEM_SYNC.pack_into(self.args, 0, offset, length)
+        fcntl.ioctl(self.hw.device_fd(), request, self.args)
+
+    def invalidate(self, offset, length):
+        self._sync(AXI_MEM_IOC_INVALIDATE, offset, length)
+
+    def flush(self, offset, length):
+        self._sync(AXI_MEM_IOC_FLUSH, offset, length)
+
+
+AXI_MEM_REG_OP    = struct.Struct("IIII") # struct axi_mem_reg_op: offset, value, op, reserved
+AXI_MEM_REG_BATCH = struct.Struct("QII")  # struct axi_mem_reg_batch: ops pointer, count, reserved
+AXI_MEM_IOC_REG_BATCH = (3 << 30) | (AXI_MEM_REG_BATCH.size << 16) | (ord('x') << 8) | 3 # _IOWR('x', 3, struct axi_mem_reg_batch)
+AXI_MEM_OP_WRITE = 0
+AXI_MEM_OP_READ  = 1
+AXI_MEM_OP_DELAY = 2
+AXI_MEM_BATCH_MAX = 256
+
+
+class RegisterBatch:
+    """Register writes, reads and delays on one region of a HardwareMap, run in order.
+
+    run() sends the whole sequence to axi_mem in a single ioctl and returns
+    the values read, in order. If the device has no batch ioctl (an older
+    module, or /dev/mem) the same sequence runs on the mmap'ed RegisterBank.
+    Offsets are relative to the region, like the RegisterBank ones.
+    """
+
+    def __init__(self, hw, name):
+        self.hw   = hw
+        self.name = name
+        self.base = hw.regions[name][0]
+        self.ops  = []
+
+    def write(self, offset, value):
+        self.ops.append((AXI_MEM_OP_WRITE, offset, value))
+        return self
+
+    def write_many(self, pairs):
+        for offset, value in pairs:
+            self.ops.append((AXI_MEM_OP_WRITE, offset, value))
+        return self
+
+    def read(self, offset):
+        self.ops.append((AXI_MEM_OP_READ, offset, 0))
+        return self
+
+    def delay(self, seconds):
+        self.ops.append((AXI_MEM_OP_DELAY, 0, int(seconds*1e6)))
+        return self
+
+    def run(self):
+        ops, self.ops = self.ops, []
+        if not ops:
+            return []
+        try:
+            return self._run_ioctl(ops)
+        except OSError as error:
+            if error.errno != errno.ENOTTY:
+                raise
+        return self._run_mmap(ops)
+
+    def _run_ioctl(self, ops):
+        if len(ops) > AXI_MEM_BATCH_MAX:
+            raise ValueError(f"A register batch holds at most {AXI_MEM_BATCH_MAX} operations")
+        buffer = bytearray(len(ops)*AXI_MEM_REG_OP.size)
+        for index, (op, offset, value) in enumerate(ops):
+            AXI_MEM_REG_OP.pack_into(buffer, index*AXI_MEM_REG_OP.size, 0 if op == AXI_MEM_OP_DELAY else self.base + offset, value, op, 0)
+        import ctypes
+
+        address = ctypes.addressof((ctypes.c_char*len(buffer)).from_buffer(buffer))
+        fcntl.ioctl(self.hw.device_fd(), AXI_MEM_IOC_REG_BATCH, AXI_MEM_REG_BATCH.pack(address, len(ops), 0))
+        return [AXI_MEM_REG_OP.unpack_from(buffer, index*AXI_MEM_REG_OP.size)[1] for index, (op, offset, value) in enumerate(ops) if op == AXI_MEM_OP_READ]
+
+    def _run_mmap(self, ops):
+        bank = getattr(self.hw, self.name)
+        values = []
+        for op, offset, value in ops:
+            if op == AXI_MEM_OP_WRITE:
+                bank.write(offset, value)
+            elif op == AXI_MEM_OP_READ:
+                values.append(bank.read(offset))
+            else:
+                time.sleep(value/1e6)
+        return values
+
+
+LENGTH_HEADER = struct.Struct("!I")
+
+def send_framed(sock, header, payload):
+    """Send header and payload with one gather write, without concatenating them.
+
+    payload should be a memoryview slice of the DMA buffer so no copy is
+    made in user space; partial writes are finished with sendall.
+    """
+    sent = sock.sendmsg((header, payload))
+    header_length = len(header)
+    if sent < header_length:
+        sock.sendall(memoryview(header)[sent:])
+        sent = header_length
+    if sent - header_length < len(payload):
+        sock.sendall(payload[sent - header_length:])
+
+
+IOV_MAX = os.sysconf('SC_IOV_MAX') if 'SC_IOV_MAX' in os.sysconf_names else 1024
+
+def send_gathered(sock, buffers):
+    """Send buffers in order with as few gather writes as IOV_MAX allows, partial writes are resumed."""
+    for first in range(0, len(buffers), IOV_MAX):
+        chunk = deque(memoryview(buffer).cast('B') for buffer in buffers[first : first + IOV_MAX])
+        while chunk:
+            sent = sock.sendmsg(chunk)
+            while chunk and sent >= len(chunk[0]):
+                sent -= len(chunk[0])
+                chunk.popleft()
+            if chunk:
+                chunk[0] = chunk[0][sent:]
+
+class FileSink:
+    """Output file opened once for the run and written with gathered writev calls.
+
+    write() takes the buffers of every ready descriptor (memoryview slices of
+    the DMA buffer, no copy) and hands them to the kernel in as few writev
+    calls as IOV_MAX allows; partial writes are resumed. The caller releases
+    the descriptors only after write() returned.
+    """
+
+    def __init__(self, path):
+        self.path  = path
+        self.fd    = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.calls = 0
+        self.bytes = 0
+        self.write_time = 0.0
+
+    def write(self, buffers):
+        start = time.perf_counter()
+        for first in range(0, len(buffers), IOV_MAX):
+            chunk = [memoryview(buffer).cast('B') for buffer in buffers[first : first + IOV_MAX]]
+            remaining = sum(len(view) for view in chunk)
+            while remaining:
+                written = os.writev(self.fd, chunk)
+                self.calls += 1
+                self.bytes += written
+                remaining  -= written
+                while chunk and written >= len(chunk[0]):
+                    written -= len(chunk[0])
+                    chunk.pop(0)
+                if chunk:
+                    chunk[0] = chunk[0][written:]
+        self.write_time += time.perf_counter() - start
+
+    def flush(self):
+        pass # nothing is held back, write() returns once the kernel has the data
+
+    def report(self, label):
+        megabytes = self.bytes / 1e6
+        return (f"- {label} info --> File sink {self.path}: {self.calls} writev calls | {self.calls/megabytes if megabytes else 0:.2f} syscalls/MB | "
+                f"{megabytes/self.write_time if self.write_time else 0:.1f} MB/s while writing")
+
+    def close(self):
+        os.close(self.fd)
+
+
+def hex_line(data):
+    """One packet in the --file_type t format: uppercase hex, a space after every 4 bytes, then a newline."""
+    text = memoryview(data).hex(' ', -4).upper()
+    return text + (' \n' if len(text) and len(data) % 4 == 0 else '\n')
+
+
+class HexTextSink:
+    """--file_type t output: one hex_line per buffer, converted in bulk and written in large chunks.
+
+    Lines are collected until chunk_size characters are pending and then go
+    out in a single FileSink write; flush() writes what is pending.
+    """
+
+    def __init__(self, path, chunk_size=4*1024*1024):
+        self.sink       = FileSink(path)
+        self.chunk_size = chunk_size
+        self.pending    = []
+        self.pending_size = 0
+        self.lines      = 0
+
+    def write(self, buffers):
+        for buffer in buffers:
+            line = hex_line(buffer)
+            self.pending.append(line)
+            self.pending_size += len(line)
+            self.lines        += 1
+        if self.pending_size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.sink.write((''.join(self.pending).encode('ascii'),))
+            self.pending      = []
+            self.pending_size = 0
+
+    def report(self, label):
+        return self.sink.report(label) + f" | {self.lines} text lines"
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+
+def convert_to_text(input_path, output_path, line_bytes=65536, framed=False, chunk_size=4*1024*1024):
+    """Write a binary recording in the --file_type t format, return (bytes, lines).
+
+    Raw recordings carry no packet boundaries, so each line holds line_bytes
+    bytes; framed input (LENGTH_HEADER before every packet, as in the spool
+    files and the TCP stream) gets one line per packet.
+    """
+    sink = HexTextSink(output_path, chunk_size)
+    converted = 0
+    with open(input_path, 'rb') as source:
+        if framed:
+            while True:
+                header = source.read(LENGTH_HEADER.size)
+                if len(header) < LENGTH_HEADER.size:
+                    break
+                length, = LENGTH_HEADER.unpack(header)
+                data = source.read(length)
+                sink.write((data,))
+                converted += len(data)
+        else:
+            block_size = max(1, chunk_size // line_bytes) * line_bytes
+            while True:
+                data = source.read(block_size)
+                if not data:
+                    break
+                view = memoryview(data)
+                sink.write([view[start : start + line_bytes] for start in range(0, len(data), line_bytes)])
+                converted += len(data)
+    sink.close()
+    return converted, sink.lines
+
+
+class MappedFileSink:
+    """Output file preallocated in large extents and written through a shared mapping.
+
+    Each extent is reserved with posix_fallocate, so the filesystem
+    allocates its blocks once instead of during the run, and mapped; write()
+    copies the buffers into the mapping, with no system call until the next
+    extent is needed. close() trims the file to the bytes written. Data
+    already in the file is kept, like the append mode of the other sinks.
+    """
+
+    def __init__(self, path, extent=256*1024*1024):
+        self.path     = path
+        self.extent   = extent
+        self.fd       = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.position = os.fstat(self.fd).st_size # file offset of the next byte
+        self.map      = None
+        self.map_base = 0 # file offset of the current mapping
+        self.map_end  = self.position # nothing mapped yet
+        self.extents  = 0
+        self.bytes    = 0
+        self.allocate_time = 0.0
+        self.write_time    = 0.0
+
+    def _next_extent(self):
+        start = time.perf_counter()
+        if self.map is not None:
+            self.map.close()
+        # Mappings start on an allocation granularity boundary, the first one may begin before position
+        self.map_base = self.position - self.position % mmap.ALLOCATIONGRANULARITY
+        self.map_end  = self.position + self.extent
+        os.posix_fallocate(self.fd, self.map_base, self.map_end - self.map_base)
+        self.map = mmap.mmap(self.fd, self.map_end - self.map_base, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=self.map_base)
+        self.extents += 1
+        self.allocate_time += time.perf_counter() - start
+
+    def write(self, buffers):
+        start = time.perf_counter()
+        for buffer in buffers:
+            view = memoryview(buffer).cast('B')
+            while len(view):
+                if self.position == self.map_end:
+                    self._next_extent()
+                count = min(len(view), self.map_end - self.position)
+                self.map[self.position - self.map_base : self.position - self.map_base + count] = view[:count]
+                self.position += count
+                self.bytes    += count
+                view = view[count:]
+        self.write_time += time.perf_counter() - start
+
+    def flush(self):
+        pass # the data is in the page cache as soon as it is copied
+
+    def report(self, label):
+        megabytes = self.bytes / 1e6
+        return (f"- {label} info --> Mapped file sink {self.path}: {self.extents} extents of {self.extent} bytes | fallocate + mmap {self.allocate_time:.3f} s | "
+                f"{megabytes/self.write_time if self.write_time else 0:.1f} MB/s while writing")
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        os.ftruncate(self.fd, self.position) # drop the preallocated tail
+        os.close(self.fd)
+
+
+FSYNC_POLICIES = ('none', 'periodic', 'bytes')
+
+class StagedFileSink:
+    """FileSink behind staging buffers written by a background thread.
+
+    write() copies the buffers into the current staging buffer, so the
+    caller can release its ring slots at once; a full staging buffer is
+    queued for the writer thread and the next free one is taken. The caller
+    only waits (a stall) when every staging buffer is queued, i.e. when the
+    disk is slower than the stream for longer than the staging can absorb.
+    flush() queues a partly filled buffer, e.g. when the ring is idle.
+
+    fsync 'none' leaves write back to the kernel, 'periodic' syncs at most
+    every fsync_interval seconds, 'bytes' once fsync_bytes were written
+    since the last sync. A sync covers every buffer written before it, so
+    buffers queued while it runs are committed together by the next one.
+    """
+
+    def __init__(self, path, buffer_size=4*1024*1024, buffers=2, fsync='none', fsync_interval=1.0, fsync_bytes=64*1024*1024):
+        import queue
+        import threading
+
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.sink  = FileSink(path)
+        self.path  = path
+        self.buffer_size    = buffer_size
+        self.buffers        = buffers
+        self.fsync          = fsync
+        self.fsync_interval = fsync_interval
+        self.fsync_bytes    = fsync_bytes
+        self.free   = queue.Queue()
+        self.queued = queue.Queue()
+        for i in range(buffers):
+            self.free.put(bytearray(buffer_size))
+        self.current = self.free.get()
+        self.used    = 0
+        self.error   = None
+        # Producer side
+        self.stalls     = 0
+        self.stall_time = 0.0
+        # Writer thread side
+        self.unsynced   = 0
+        self.last_sync  = time.monotonic()
+        self.syncs      = 0
+        self.sync_time  = 0.0
+        self.max_sync   = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, buffers):
+        for buffer in buffers:
+            view = memoryview(buffer).cast('B')
+            while len(view):
+                if self.used == self.buffer_size:
+                    self._hand_off()
+                count = min(len(view), self.buffer_size - self.used)
+                self.current[self.used : self.used + count] = view[:count]
+                self.used += count
+                view = view[count:]
+
+    def flush(self):
+        if self.used:
+            self._hand_off()
+
+    def _hand_off(self):
+        if self.error is not None:
+            raise self.error
+        self.queued.put((self.current, self.used))
+        # Only this thread takes from free, a buffer seen there cannot be gone at get()
+        stalled = self.free.empty()
+        start = time.perf_counter()
+        self.current = self.free.get()
+        if stalled:
+            self.stalls     += 1
+            self.stall_time += time.perf_counter() - start
+        self.used = 0
+
+    def _run(self):
+        import queue
+
+        timeout = self.fsync_interval if self.fsync == 'periodic' else None
+        while True:
+            try:
+                item = self.queued.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                return
+            if item:
+                buffer, used = item
+                try:
+                    self.sink.write((memoryview(buffer)[:used],))
+                except OSError as error:
+                    self.error = error
+                self.unsynced += used
+                self.free.put(buffer)
+            if self.unsynced and self.error is None and (
+                    (self.fsync == 'periodic' and time.monotonic() - self.last_sync >= self.fsync_interval) or
+                    (self.fsync == 'bytes' and self.unsynced >= self.fsync_bytes)):
+                try:
+                    self._sync()
+                except OSError as error:
+                    self.error = error
+
+    def _sync(self):
+        start = time.perf_counter()
+        os.fsync(self.sink.fd)
+        elapsed = time.perf_counter() - start
+        self.syncs     += 1
+        self.sync_time += elapsed
+        self.max_sync   = max(self.max_sync, elapsed)
+        self.unsynced   = 0
+        self.last_sync  = time.monotonic()
+
+    def report(self, label):
+        return (self.sink.report(label) + "\n" +
+                f"- {label} info --> Staging {self.buffers} x {self.buffer_size} bytes | Producer stalls {self.stalls} ({self.stall_time:.3f} s) | "
+                f"fsync {self.fsync}: {self.syncs} calls, AVG {self.sync_time/self.syncs*1e3 if self.syncs else 0:.2f} ms, MAX {self.max_sync*1e3:.2f} ms")
+
+    def close(self):
+        # The thread is stopped and the file closed even when a write failed, the error is raised after
+        try:
+            if self.error is None:
+                self.flush()
+        finally:
+            self.queued.put(None)
+            self.thread.join()
+            try:
+                if self.fsync != 'none' and self.unsynced and self.error is None:
+                    self._sync()
+            finally:
+                self.sink.close()
+        if self.error is not None:
+            raise self.error
+
+
+COMPRESSION_CODECS = ('none', 'zlib', 'lzma')
+COMPRESSED_HEADER  = struct.Struct("!BII") # codec (index in COMPRESSION_CODECS), raw length, compressed length of the block that follows
+CODEC_MODULES      = {} # codec -> zlib/lzma module, filled on first use so commands that never compress do not import them
+
+def codec_module(codec):
+    """Module of codec, imported once per process. ImportError for lzma on a Python built without liblzma."""
+    module = CODEC_MODULES.get(codec)
+    if module is None:
+        module = CODEC_MODULES[codec] = __import__(codec)
+    return module
+
+def compress_block(codec, level, data):
+    """Frame of one compressed block and the CPU time spent on it, run by the pool workers."""
+    start = time.thread_time()
+    if codec == 'zlib':
+        compressed = codec_module('zlib').compress(data, level)
+    else:
+        compressed = codec_module('lzma').compress(data, preset=None if level < 0 else level)
+    return COMPRESSED_HEADER.pack(COMPRESSION_CODECS.index(codec), len(data), len(compressed)) + compressed, time.thread_time() - start
+
+def decompress_blocks(source):
+    """Yield the raw blocks of a compressed file or stream (any object with read())."""
+    while True:
+        header = source.read(COMPRESSED_HEADER.size)
+        if len(header) < COMPRESSED_HEADER.size:
+            return
+        codec, raw_length, length = COMPRESSED_HEADER.unpack(header)
+        compressed = source.read(length)
+        try:
+            module = codec_module(COMPRESSION_CODECS[codec]) if 0 < codec < len(COMPRESSION_CODECS) else None
+        except ImportError:
+            module = None
+        if module is None:
+            raise ValueError(f"compressed block with unknown or unavailable codec {codec}")
+        data = module.decompress(compressed)
+        if len(data) != raw_length:
+            raise ValueError(f"compressed block expands to {len(data)} bytes instead of {raw_length}")
+        yield data
+
+
+class CompressionPool:
+    """Compression stage between a ring consumer and its file or socket.
+
+    write() copies the buffers of a channel into its pending block, so the
+    ring slots can be released at once; a block of block_size bytes (or any
+    pending data on flush()) is compressed by a thread or process pool.
+    ready() yields (channel, frame) in submission order, as soon as the
+    oldest blocks are done; with more than 2 x workers blocks in flight it
+    waits for the oldest one, bounding the memory held by the stage. Each
+    frame is COMPRESSED_HEADER followed by the compressed block.
+    """
+
+    def __init__(self, codec='zlib', level=-1, workers=2, pool='thread', block_size=1024*1024, channels=1):
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+        if codec not in COMPRESSION_CODECS[1:]:
+            raise ValueError(f"codec must be one of {COMPRESSION_CODECS[1:]}")
+        try:
+            codec_module(codec)
+        except ImportError:
+            raise ValueError(f"codec {codec} needs a Python built with the {codec} module") from None
+        self.codec      = codec
+        self.level      = level
+        self.workers    = workers
+        self.pool       = pool
+        self.block_size = block_size
+        # zlib and lzma release the GIL while they compress, threads already run them in parallel
+        self.executor   = (ProcessPoolExecutor if pool == 'process' else ThreadPoolExecutor)(max_workers=workers)
+        self.pending    = [bytearray() for channel in range(channels)]
+        self.in_flight  = deque()
+        self.blocks     = 0
+        self.raw_bytes  = 0
+        self.frame_bytes = 0
+        self.cpu_time   = 0.0
+        self.wait_time  = 0.0
+        self.start_time = time.perf_counter()
+
+    def write(self, channel, buffers):
+        pending = self.pending[channel]
+        for buffer in buffers:
+            pending += buffer
+        if len(pending) >= self.block_size:
+            self._submit(channel)
+
+    def flush(self):
+        for channel, pending in enumerate(self.pending):
+            if pending:
+                self._submit(channel)
+
+    def _submit(self, channel):
+        data = bytes(self.pending[channel])
+        self.pending[channel].clear()
+        self.in_flight.append((channel, self.executor.submit(compress_block, self.codec, self.level, data)))
+        self.raw_bytes += len(data)
+
+    def ready(self, wait_all=False):
+        while self.in_flight:
+            channel, future = self.in_flight[0]
+            if not future.done():
+                if not wait_all and len(self.in_flight) <= 2*self.workers:
+                    return
+                start = time.perf_counter()
+                future.result()
+                self.wait_time += time.perf_counter() - start
+            self.in_flight.popleft()
+            frame, cpu_time = future.result()
+            self.blocks      += 1
+            self.frame_bytes += len(frame)
+            self.cpu_time    += cpu_time
+            yield channel, frame
+
+    def drain(self):
+        """flush() and yield every remaining frame, in order."""
+        self.flush()
+        yield from self.ready(wait_all=True)
+
+    def report(self, label):
+        elapsed = time.perf_counter() - self.start_time
+        return (f"- {label} info --> Compression {self.codec} level {self.level} | {self.pool} pool of {self.workers} | {self.blocks} blocks | "
+                f"{self.raw_bytes} -> {self.frame_bytes} bytes, ratio {self.raw_bytes/self.frame_bytes if self.frame_bytes else 0:.2f} | "
+                f"{self.raw_bytes/self.cpu_time/1e6 if self.cpu_time else 0:.1f} MB/s per worker | {self.raw_bytes/elapsed/1e6:.1f} MB/s over the run | consumer waited {self.wait_time:.3f} s")
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class IrqWaiter:
+    """Blocking completion wait on an axi_mem event channel (/dev/axi_mem_s2mm or /dev/axi_mem_mm2s).
+
+    The kernel module acknowledges the DMA interrupt and counts completions;
+    wait() sleeps in poll() until a completion newer than the last consumed
+    one is available. Each process must open its own waiter.
+    """
+
+    def __init__(self, device_path):
+        import select
+
+        self.fd = os.open(device_path, os.O_RDONLY | os.O_NONBLOCK)
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLIN)
+
+    def wait(self, timeout_ms=None):
+        """Return True once a completion was consumed, False on timeout."""
+        if not self.poller.poll(timeout_ms):
+            return False
+        os.read(self.fd, 4)
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+WAIT_MODES = ('spin', 'backoff', 'irq')
+
+class WaitStrategy:
+    """How a process waits for a DMA transfer to complete.
+
+    spin    -> read the status register in a tight loop
+    backoff -> spin spin_count times, then sleep with exponential backoff up to sleep_max seconds
+    irq     -> sleep on the axi_mem completion channel given by irq_device
+
+    timeout_ms (None or 0 for no deadline) bounds every wait in all modes; wait()
+    returns False when it expires. The counters are cumulative over the run.
+    """
+
+    def __init__(self, mode='spin', spin_count=1000, sleep_max=1e-3, timeout_ms=None, irq_device=None, sleep_min=10e-6):
+        if mode not in WAIT_MODES:
+            raise ValueError(f"Unknown wait mode {mode}, choose one of {WAIT_MODES}")
+        self.mode       = mode
+        self.spin_count = max(1, spin_count)
+        self.sleep_min  = min(sleep_min, sleep_max)
+        self.sleep_max  = sleep_max
+        self.timeout_ms = timeout_ms if timeout_ms else None
+        self.irq_waiter = IrqWaiter(irq_device) if mode == 'irq' else None
+        self.waits      = 0
+        self.spins      = 0
+        self.sleeps     = 0
+        self.timeouts   = 0
+        self.wait_time  = 0.0
+        self.max_wait   = 0.0
+
+    def wait(self, regs, status_register, done_mask):
+        start_time = time.perf_counter()
+        if self.irq_waiter is not None:
+            done = self.irq_waiter.wait(self.timeout_ms)
+        else:
+            done = self._poll(regs, status_register, done_mask, start_time)
+        elapsed = time.perf_counter() - start_time
+        self.waits     += 1
+        self.wait_time += elapsed
+        if elapsed > self.max_wait:
+            self.max_wait = elapsed
+        if not done:
+            self.timeouts += 1
+        return done
+
+    def _poll(self, regs, status_register, done_mask, start_time):
+        status_index = status_register >> 2
+        registers    = regs.regs
+        spin_count   = self.spin_count
+        deadline     = None if self.timeout_ms is None else start_time + self.timeout_ms / 1000
+        sleep_time   = self.sleep_min
+        spins        = 0
+        while True:
+            # Tight inner loop, the clock is only read once every spin_count reads
+            for _ in range(spin_count):
+                spins += 1
+                if (registers[status_index] & done_mask) == done_mask:
+                    self.spins += spins
+                    return True
+            if deadline is not None and time.perf_counter() > deadline:
+                self.spins += spins
+                return False
+            if self.mode == 'backoff':
+                time.sleep(sleep_time)
+                self.sleeps += 1
+                sleep_time = min(sleep_time * 2, self.sleep_max)
+                spin_count = 1 # once sleeping, check the status once per wake up
+
+    def report(self, label):
+        waits = self.waits if self.waits else 1
+        return (f"- {label} info --> Wait mode: {self.mode} | Waits {self.waits} | Timeouts {self.timeouts} | "
+                f"AVG spins/packet {self.spins/waits:.1f} | AVG sleeps/packet {self.sleeps/waits:.2f} | "
+                f"AVG wait/packet {self.wait_time/waits*1e6:.1f} us | MAX wait {self.max_wait*1e6:.1f} us")
+
+    def close(self):
+        if self.irq_waiter is not None:
+            self.irq_waiter.close()
+
+
+# Scatter-gather registers of the S2MM channel (PG021)
+S2MM_CONTROL_REGISTER      = 0x30
+S2MM_STATUS_REGISTER       = 0x34
+S2MM_CURDESC_REGISTER      = 0x38
+S2MM_CURDESC_MSB_REGISTER  = 0x3C
+S2MM_TAILDESC_REGISTER     = 0x40
+S2MM_TAILDESC_MSB_REGISTER = 0x44
+
+# Buffer descriptor layout, descriptors are 0x40 aligned
+SG_DESCRIPTOR_SIZE    = 0x40
+SG_NXTDESC            = 0x00
+SG_NXTDESC_MSB        = 0x04
+SG_BUFFER_ADDRESS     = 0x08
+SG_BUFFER_ADDRESS_MSB = 0x0C
+SG_CONTROL            = 0x18
+SG_STATUS             = 0x1C
+
+SG_LENGTH_MASK        = 0x03FFFFFF
+SG_STATUS_RXEOF       = 1 << 26
+SG_STATUS_RXSOF       = 1 << 27
+SG_STATUS_INTERNAL_ERR = 1 << 28
+SG_STATUS_SLAVE_ERR   = 1 << 29
+SG_STATUS_DECODE_ERR  = 1 << 30
+SG_STATUS_CMPLT       = 1 << 31
+SG_STATUS_ERRORS      = SG_STATUS_INTERNAL_ERR | SG_STATUS_SLAVE_ERR | SG_STATUS_DECODE_ERR
+
+SG_RUN_DMA            = 0x00000001
+SG_ENABLE_ALL_IRQ     = 0x00007000
+SG_STATUS_IDLE        = 0x00000002
+SG_STATUS_IOC_IRQ     = 0x00001000
+
+
+class SgRing:
+    """Circular buffer descriptor ring for the S2MM channel in scatter-gather mode.
+
+    Descriptor i points to slot i of the buffer region (slot_size bytes each),
+    and the last descriptor links back to the first. The hardware fills
+    descriptors up to TAILDESC without CPU intervention; harvest() collects
+    every completed descriptor in order and recycle() hands consumed slots
+    back by clearing their status and moving TAILDESC. Tail-pointer mode is
+    used instead of the engine's cyclic mode so that a slow consumer causes
+    backpressure rather than overwritten slots.
+
+    desc_bank is a RegisterBank over the descriptor memory, desc_phys and
+    buffer_phys are the matching physical addresses seen by the DMA.
+    buffer_length (default slot_size) is the transfer length of each descriptor.
+    """
+
+    def __init__(self, desc_bank, desc_phys, buffer_phys, slot_size, n_slots, buffer_length=None):
+        if buffer_length is None:
+            buffer_length = slot_size
+        if desc_phys % SG_DESCRIPTOR_SIZE:
+            raise ValueError(f"Descriptor ring at 0x{desc_phys:x} is not {SG_DESCRIPTOR_SIZE} byte aligned")
+        if buffer_length > slot_size or buffer_length > SG_LENGTH_MASK:
+            raise ValueError(f"Descriptor length {buffer_length} exceeds the slot size or the descriptor length field")
+        self.desc_bank    = desc_bank
+        self.desc_phys    = desc_phys
+        self.buffer_phys  = buffer_phys
+        self.slot_size    = slot_size
+        self.buffer_length = buffer_length
+        self.n_slots      = n_slots
+        self.head         = 0 # next descriptor to harvest
+        self.recycle_slot = 0 # next harvested descriptor to give back to the hardware
+        self.outstanding  = 0 # harvested but not yet recycled
+        self.regs         = None
+
+    def descriptor_phys(self, slot):
+        return self.desc_phys + slot * SG_DESCRIPTOR_SIZE
+
+    def build(self):
+        desc_bank = self.desc_bank
+        for slot in range(self.n_slots):
+            base = slot * SG_DESCRIPTOR_SIZE
+            desc_bank.write_many((
+                (base + SG_NXTDESC           , self.descriptor_phys((slot + 1) % self.n_slots)),
+                (base + SG_NXTDESC_MSB       , 0),
+                (base + SG_BUFFER_ADDRESS    , self.buffer_phys + slot * self.slot_size),
+                (base + SG_BUFFER_ADDRESS_MSB, 0),
+                (base + SG_CONTROL           , self.buffer_length),
+                (base + SG_STATUS            , 0),
+            ))
+        self.head         = 0
+        self.recycle_slot = 0
+        self.outstanding  = 0
+
+    def start(self, regs):
+        """Point a reset, halted S2MM channel at the ring and arm every descriptor."""
+        self.regs = regs
+        regs.write_many((
+            (S2MM_CURDESC_REGISTER     , self.descriptor_phys(0)),
+            (S2MM_CURDESC_MSB_REGISTER , 0),
+            (S2MM_CONTROL_REGISTER     , SG_RUN_DMA | SG_ENABLE_ALL_IRQ),
+            (S2MM_TAILDESC_MSB_REGISTER, 0),
+            (S2MM_TAILDESC_REGISTER    , self.descriptor_phys(self.n_slots - 1)),
+        ))
+
+    def harvest(self, max_count=None):
+        """Return [(slot, length, status)] for the completed descriptors, oldest first."""
+        completed = []
+        desc_regs = self.desc_bank.regs
+        status_index = SG_STATUS >> 2
+        stride = SG_DESCRIPTOR_SIZE >> 2
+        limit = self.n_slots - self.outstanding
+        if max_count is not None:
+            limit = min(limit, max_count)
+        while len(completed) < limit:
+            status = desc_regs[self.head * stride + status_index]
+            if not status & SG_STATUS_CMPLT:
+                break
+            completed.append((self.head, status & SG_LENGTH_MASK, status))
+            self.head = (self.head + 1) % self.n_slots
+        self.outstanding += len(completed)
+        return completed
+
+    def recycle(self, count=1):
+        """Give the oldest count harvested slots back to the hardware."""
+        if count > self.outstanding:
+            raise ValueError(f"Cannot recycle {count} slots, only {self.outstanding} are outstanding")
+        desc_bank = self.desc_bank
+        for _ in range(count):
+            desc_bank[self.recycle_slot * SG_DESCRIPTOR_SIZE + SG_STATUS] = 0
+            tail = self.recycle_slot
+            self.recycle_slot = (self.recycle_slot + 1) % self.n_slots
+        self.outstanding -= count
+        if count and self.regs is not None:
+            self.regs[S2MM_TAILDESC_REGISTER] = self.descriptor_phys(tail)
+
+
+class SgStandInDevice:
+    """Register-level stand-in for an S2MM channel in scatter-gather mode.
+
+    It follows the descriptor chain from CURDESC exactly like the engine:
+    push() writes a packet into the buffer of the current descriptor, fills
+    in its status word and moves on, stopping once the TAILDESC descriptor is
+    done until software moves TAILDESC again. regs is a RegisterBank standing
+    in for the control registers and memory a writable buffer standing in for
+    the DDR region that starts at physical address memory_phys.
+    """
+
+    def __init__(self, regs, memory, memory_phys):
+        self.regs        = regs
+        self.memory      = memoryview(memory)
+        self.memory_phys = memory_phys
+        self.current     = None
+        self.last_filled = None
+
+    def _word(self, phys):
+        offset = phys - self.memory_phys
+        return int.from_bytes(self.memory[offset:offset + 4], 'little')
+
+    def _set_word(self, phys, value):
+        offset = phys - self.memory_phys
+        self.memory[offset:offset + 4] = value.to_bytes(4, 'little')
+
+    def push(self, packet):
+        """Complete one descriptor with packet; return False when the ring is exhausted."""
+        regs = self.regs
+        if not regs[S2MM_CONTROL_REGISTER] & SG_RUN_DMA:
+            return False
+        if self.current is None:
+            self.current = regs[S2MM_CURDESC_REGISTER]
+        desc = self.current
+        if self.last_filled == regs[S2MM_TAILDESC_REGISTER] and self._word(desc + SG_STATUS) & SG_STATUS_CMPLT:
+            return False # idle at the tail until software recycles and moves it
+        if self._word(desc + SG_STATUS) & SG_STATUS_CMPLT:
+            raise RuntimeError(f"Descriptor 0x{desc:x} fetched with Cmplt set, software recycled it late")
+        buffer_length = self._word(desc + SG_CONTROL) & SG_LENGTH_MASK
+        length = min(len(packet), buffer_length)
+        offset = self._word(desc + SG_BUFFER_ADDRESS) - self.memory_phys
+        self.memory[offset:offset + length] = packet[:length]
+        self._set_word(desc + SG_STATUS, SG_STATUS_CMPLT | SG_STATUS_RXSOF | SG_STATUS_RXEOF | length)
+        self.last_filled = desc
+        self.current = self._word(desc + SG_NXTDESC)
+        regs[S2MM_CURDESC_REGISTER] = desc
+        status = regs[S2MM_STATUS_REGISTER] | SG_STATUS_IOC_IRQ
+        if desc == regs[S2MM_TAILDESC_REGISTER]:
+            status |= SG_STATUS_IDLE
+        regs[S2MM_STATUS_REGISTER] = status
+        return True
+
+
+SPSC_LINE        = 64                      # head and tail counters each own a cache line
+SPSC_HEADER_SIZE = 2 * SPSC_LINE           # head and one tail, each further consumer adds a line
+SPSC_SLOT        = struct.Struct("=QId")   # offset, length, timestamp; the sequence word follows
+SPSC_SLOT_SIZE   = 32
+SPSC_SEQ_WORD    = 5                       # sequence word index inside a slot, in 32-bit words
+SPSC_WRAP        = 1 << 32
+
+
+class SpscRing:
+    """Single-producer/single-consumer ring of packet descriptors in shared memory.
+
+    Each slot holds (offset, length, sequence, timestamp). head and tail are
+    free running 32-bit counters on separate cache lines, written only by the
+    producer and the consumer respectively, so no lock is needed. The
+    sequence word of a slot is written after the rest of the descriptor and
+    a consumer only accepts a slot whose sequence matches its position.
+
+    The producer calls put() for each packet and publish() once per batch
+    (push() does both); the consumer reads with peek() and hands the slots
+    back with release(). The producer and consumer cursors are separate, so
+    the same object can be used from two threads, or inherited by two forked
+    processes. Only the creating process unlinks the memory in close().
+
+    With consumers > 1 every consumer has its own tail and sees every
+    descriptor; a consumer process selects its tail with attach() and a slot
+    is only reused once all of them released it.
+
+    n_slots must be a power of two, so that position % n_slots stays the same
+    slot when the 32-bit counters wrap.
+    """
+
+    def __init__(self, n_slots, name=None, consumers=1):
+        from multiprocessing import shared_memory
+
+        if n_slots < 1 or n_slots & (n_slots - 1):
+            raise ValueError(f"SpscRing needs a power of two number of slots, got {n_slots}")
+        self.n_slots     = n_slots
+        self.consumers   = consumers
+        self.header_size = SPSC_HEADER_SIZE + (consumers - 1)*SPSC_LINE
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=self.header_size + n_slots*SPSC_SLOT_SIZE)
+        self.owner = os.getpid() if create else None # forked children never unlink
+        self.words = self.shm.buf.cast('I')
+        self.head_word  = 0
+        self.tail_words = tuple((1 + consumer)*SPSC_LINE >> 2 for consumer in range(consumers))
+        self.tail_word  = self.tail_words[0]
+        if create:
+            self.shm.buf[:self.header_size + n_slots*SPSC_SLOT_SIZE] = bytes(self.header_size + n_slots*SPSC_SLOT_SIZE)
+            for slot in range(n_slots):
+                self.words[self._seq_index(slot)] = SPSC_WRAP - 1 # never a valid sequence for the first lap
+        self.write_position = self.words[self.head_word] # producer cursor
+        self.read_position  = self.words[self.tail_word] # consumer cursor
+
+    def _seq_index(self, slot):
+        return (self.header_size + slot*SPSC_SLOT_SIZE >> 2) + SPSC_SEQ_WORD
+
+    def _slowest_tail(self):
+        if self.consumers == 1:
+            return self.words[self.tail_word]
+        head = self.words[self.head_word]
+        return max((self.words[tail_word] for tail_word in self.tail_words), key=lambda tail: (head - tail) % SPSC_WRAP)
+
+    def attach(self, consumer):
+        """Use the tail of consumer (0 to consumers-1) for available/peek/release, call once in the consumer process."""
+        self.tail_word     = self.tail_words[consumer]
+        self.read_position = self.words[self.tail_word]
+        return self
+
+    def lag(self, consumer):
+        """Published descriptors consumer has not released yet."""
+        return (self.words[self.head_word] - self.words[self.tail_words[consumer]]) % SPSC_WRAP
+
+    # Producer
+
+    def free(self):
+        """Slots the producer can fill without overwriting unreleased ones."""
+        return self.n_slots - (self.write_position - self._slowest_tail()) % SPSC_WRAP
+
+    def next_slot(self):
+        """Slot index the next put() fills, for producers that lay their buffers out per slot."""
+        return self.write_position % self.n_slots
+
+    def put(self, offset, length, timestamp=None):
+        """Write the next descriptor without making it visible, the caller checked free()."""
+        slot = self.write_position % self.n_slots
+        SPSC_SLOT.pack_into(self.shm.buf, self.header_size + slot*SPSC_SLOT_SIZE, offset, length, time.monotonic() if timestamp is None else timestamp)
+        self.words[self._seq_index(slot)] = self.write_position
+        self.write_position = (self.write_position + 1) % SPSC_WRAP
+
+    def publish(self):
+        """Make every put() descriptor visible to the consumer with a single store."""
+        self.words[self.head_word] = self.write_position
+
+    def push(self, offset, length, timestamp=None):
+        if not self.free():
+            return False
+        self.put(offset, length, timestamp)
+        self.publish()
+        return True
+
+    def consumed(self):
+        """Tail counter: number of descriptors released by the consumer (the slowest one) so far, modulo 2**32."""
+        return self._slowest_tail()
+
+    # Consumer
+
+    def available(self):
+        return (self.words[self.head_word] - self.read_position) % SPSC_WRAP
+
+    def peek(self, max_count=None):
+        """Return [(offset, length, sequence, timestamp)] of the published descriptors, oldest first."""
+        count = self.available()
+        if max_count is not None:
+            count = min(count, max_count)
+        descriptors = []
+        position = self.read_position
+        for i in range(count):
+            slot = position % self.n_slots
+            sequence = self.words[self._seq_index(slot)]
+            if sequence != position:
+                break # descriptor not visible yet
+            offset, length, timestamp = SPSC_SLOT.unpack_from(self.shm.buf, self.header_size + slot*SPSC_SLOT_SIZE)
+            descriptors.append((offset, length, sequence, timestamp))
+            position = (position + 1) % SPSC_WRAP
+        return descriptors
+
+    def release(self, count):
+        """Give count peeked slots back to the producer."""
+        self.read_position = (self.read_position + count) % SPSC_WRAP
+        self.words[self.tail_word] = self.read_position
+
+    def pending(self):
+        """Published descriptors not released yet by every consumer, as seen from either side."""
+        return (self.words[self.head_word] - self._slowest_tail()) % SPSC_WRAP
+
+    def close(self):
+        self.words.release()
+        self.shm.close()
+        if self.owner == os.getpid():
+            self.shm.unlink()
+
+
+class RegionAllocator:
+    """Contiguous ring allocator of DMA transfer buffers over a memory region.
+
+    Each transfer is placed right after the previous one, aligned to align
+    bytes. reserve() returns room for a whole max_transfer, which the DMA may
+    fill completely, and commit() shrinks it to the received length, so the
+    next transfer starts right after the data. When max_transfer does not fit
+    before the end of the region the allocator wraps to offset 0, provided the
+    oldest buffer in use starts far enough from it.
+
+    Buffers are given back with reclaim() in the order they were committed,
+    which is the order the consumer releases the descriptors of a SpscRing.
+    Used from the producer side only, so there is no shared state.
+    """
+
+    def __init__(self, size, max_transfer, align=64):
+        self.align        = align
+        self.size         = size - size % align
+        self.max_transfer = self._aligned(max_transfer)
+        if self.max_transfer > self.size // 2:
+            raise ValueError(f"Transfers of {max_transfer} bytes do not fit twice in a {size} byte region")
+        self.entries  = deque() # (offset, span) of the committed buffers, oldest first
+        self.head     = 0
+        self.reserved = None
+        # Statistics
+        self.packets   = 0
+        self.bytes     = 0
+        self.peak_used = 0
+        self.wraps     = 0
+        self.full      = 0
+
+    def _aligned(self, length):
+        return max(self.align, -(-length // self.align) * self.align)
+
+    def used(self):
+        """Bytes from the oldest buffer in use to the next free byte, including the skipped end of the region after a wrap."""
+        if not self.entries:
+            return 0
+        tail = self.entries[0][0]
+        if self.entries[-1][0] >= tail:
+            return self.head - tail
+        return self.size - tail + self.head
+
+    def occupancy(self):
+        return self.used() / self.size
+
+    def reserve(self):
+        """Offset of room for max_transfer bytes, or None while the region is full."""
+        if not self.entries:
+            self.head = 0 # empty, start again from the beginning of the region
+            offset = 0
+        else:
+            tail = self.entries[0][0]
+            if self.entries[-1][0] >= tail: # free space after head, and before tail once wrapped
+                if self.head + self.max_transfer <= self.size:
+                    offset = self.head
+                elif self.max_transfer <= tail:
+                    offset = 0
+                    self.wraps += 1
+                else:
+                    offset = None
+            else:
+                offset = self.head if self.head + self.max_transfer <= tail else None
+        if offset is None:
+            self.full += 1
+        self.reserved = offset
+        return offset
+
+    def commit(self, length):
+        """Keep length bytes of the last reserve(), the rest is free for the next transfer."""
+        offset = self.reserved
+        span = self._aligned(length)
+        self.entries.append((offset, span))
+        self.head = offset + span
+        self.reserved = None
+        self.packets += 1
+        self.bytes += length
+        self.peak_used = max(self.peak_used, self.used())
+        return offset
+
+    def mark(self):
+        """Empty entry for a descriptor queued without a buffer, keeps reclaim() counts in step with the ring."""
+        self.entries.append((self.head, 0))
+
+    def reclaim(self, count):
+        """Free the count oldest committed buffers."""
+        for i in range(min(count, len(self.entries))):
+            self.entries.popleft()
+
+    def report(self, label):
+        packets = self.packets if self.packets else 1
+        return (f"- {label} info --> Ring allocator {self.size} bytes | Packets {self.packets} | AVG packet {self.bytes/packets:.0f} bytes | "
+                f"Occupancy {self.occupancy()*100:.1f} % | Peak occupancy {self.peak_used/self.size*100:.1f} % | Wraps {self.wraps} | Full {self.full}")
+
+
+NOTIFY_MODES = ('poll', 'event')
+
+class Doorbell:
+    """Wakes a consumer blocked on empty SpscRing(s) when a producer publishes.
+
+    The kick goes through an eventfd (a pipe where eventfd is not available)
+    that the consumer waits on with poll(). Kicks are coalesced through a
+    waiting flag in shared memory: the consumer raises it before sleeping and
+    a producer only does the write syscall when the flag is up, so a busy
+    consumer costs the producers nothing. There is no memory barrier between
+    the flag and the ring head, so a wake up can in rare cases be missed; the
+    wait timeout bounds the extra latency of such a miss.
+
+    With consumers > 1 each consumer has its own fd and flag, selected with
+    attach() in its process, and a kick wakes every waiting one.
+
+    Create it before forking the producers and the consumer. The counters are
+    per process, each side reports its own.
+    """
+
+    def __init__(self, consumers=1):
+        self.channels = [self._open() for consumer in range(consumers)] # (read fd, write fd)
+        self.kind     = 'eventfd' if hasattr(os, 'eventfd') else 'pipe'
+        self.signal   = struct.pack("=Q", 1) if self.kind == 'eventfd' else b"\x01"
+        self.flag_map = mmap.mmap(-1, mmap.PAGESIZE) # anonymous shared mapping, inherited by forked processes
+        self.flag     = memoryview(self.flag_map).cast('I')
+        self.flag_words = tuple(consumer*SPSC_LINE >> 2 for consumer in range(consumers)) # one cache line per consumer
+        self.attach(0)
+        # Producer side
+        self.kicks     = 0
+        self.coalesced = 0
+        # Consumer side
+        self.waits    = 0
+        self.wakeups  = 0
+        self.timeouts = 0
+
+    def _open(self):
+        if hasattr(os, 'eventfd'):
+            fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            return fd, fd
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        return read_fd, write_fd
+
+    def attach(self, consumer):
+        """Wait on the fd and flag of consumer (0 to consumers-1), call once in the consumer process."""
+        import select
+
+        self.read_fd   = self.channels[consumer][0]
+        self.flag_word = self.flag_words[consumer]
+        self.poller    = select.poll()
+        self.poller.register(self.read_fd, select.POLLIN)
+        return self
+
+    def _signal(self, write_fd):
+        try:
+            os.write(write_fd, self.signal)
+        except BlockingIOError:
+            pass # a wake up is already pending
+
+    def kick(self):
+        """Producer: call after publish(), wakes the consumers that are waiting."""
+        for flag_word, (read_fd, write_fd) in zip(self.flag_words, self.channels):
+            if self.flag[flag_word]:
+                self.flag[flag_word] = 0
+                self._signal(write_fd)
+                self.kicks += 1
+            else:
+                self.coalesced += 1
+
+    def ring(self):
+        """Unconditional wake up of every consumer, e.g. after setting a stop flag."""
+        for read_fd, write_fd in self.channels:
+            self._signal(write_fd)
+
+    def wait(self, ready, timeout_ms):
+        """Consumer: block until ready() is true, a kick arrives or timeout_ms expires. True when woken up."""
+        self.flag[self.flag_word] = 1
+        if ready(): # published before the flag was raised, the producer did not kick
+            self.flag[self.flag_word] = 0
+            return True
+        self.waits += 1
+        events = self.poller.poll(timeout_ms)
+        self.flag[self.flag_word] = 0
+        if not events:
+            self.timeouts += 1
+            return False
+        try:
+            os.read(self.read_fd, 4096)
+        except BlockingIOError:
+            pass
+        self.wakeups += 1
+        return True
+
+    def report(self, label):
+        if self.waits:
+            return f"- {label} info --> Notify: {self.kind} | Waits {self.waits} | Wake ups {self.wakeups} | Timeouts {self.timeouts}"
+        sent = self.kicks + self.coalesced
+        return f"- {label} info --> Notify: {self.kind} | Kicks {self.kicks} | Coalesced {self.coalesced} | {100*self.coalesced/sent if sent else 0:.1f} % without syscall"
+
+    def close(self):
+        self.flag.release()
+        self.flag_map.close()
+        for read_fd, write_fd in self.channels:
+            os.close(read_fd)
+            if write_fd != read_fd:
+                os.close(write_fd)
+
+
+BACKPRESSURE_POLICIES = ('block', 'drop', 'spill')
+SPOOL_FLAG = 1 << 63 # set in the SpscRing offset of a spool segment descriptor, the other bits hold the segment size
+
+# Aggregated descriptor (--fill_process_type buffered): every packet starts on a FRAMED_ALIGN boundary, as the
+# DMA and the cache maintenance need, with its LENGTH_HEADER in the bytes right before it, so header and packet
+# are one contiguous record a single channel TCP sender can pass on as it is; bits 32-61 of the offset hold the
+# packet count, the SpscRing length the packet bytes
+FRAMED_FLAG  = 1 << 62
+FRAMED_SHIFT = 32
+FRAMED_MASK  = (1 << 30) - 1
+FRAMED_ALIGN = 64
+
+def framed_data_offset(position):
+    """Offset of the next packet of an aggregated descriptor, when the previous one ends at position."""
+    return -(-(position + LENGTH_HEADER.size) // FRAMED_ALIGN) * FRAMED_ALIGN
+
+def framed_descriptor(offset, count):
+    return FRAMED_FLAG | count << FRAMED_SHIFT | offset
+
+def framed_count(offset):
+    return offset >> FRAMED_SHIFT & FRAMED_MASK
+
+def framed_base(offset):
+    return offset & ((1 << FRAMED_SHIFT) - 1)
+
+def framed_packets(view, offset):
+    """Yield a view of each packet of an aggregated descriptor, oldest first."""
+    position = framed_base(offset)
+    for i in range(framed_count(offset)):
+        position = framed_data_offset(position)
+        length, = LENGTH_HEADER.unpack_from(view, position - LENGTH_HEADER.size)
+        yield view[position : position + length]
+        position += length
+
+def framed_records(view, offset):
+    """Yield a view of each LENGTH_HEADER and packet of an aggregated descriptor, the TCP framing of a single channel."""
+    position = framed_base(offset)
+    for i in range(framed_count(offset)):
+        position = framed_data_offset(position)
+        length, = LENGTH_HEADER.unpack_from(view, position - LENGTH_HEADER.size)
+        yield view[position - LENGTH_HEADER.size : position + length]
+        position += length
+
+
+class SpillSpool:
+    """Packets a fill process could not queue, kept in a local file until the consumer catches up.
+
+    The fill process appends each overflow packet with a LENGTH_HEADER and,
+    once the ring has room again, ends the segment and pushes a descriptor
+    with offset SPOOL_FLAG | segment bytes in the packet's place, so the
+    consumer replays the segment in order with the rest of the stream.
+    The two sides open the file separately; create the object before forking.
+    """
+
+    def __init__(self, path):
+        self.path   = path
+        self.writer = None
+        self.reader = None
+        self.segment_bytes = 0
+        # Fill side
+        self.packets  = 0
+        self.bytes    = 0
+        self.segments = 0
+        # Consumer side
+        self.replayed_packets = 0
+        self.replayed_bytes   = 0
+        self.catchups         = 0
+        self.catchup_time     = 0.0
+        self.catchup_max      = 0.0
+
+    def append(self, data):
+        if self.writer is None:
+            self.writer = open(self.path, 'ab')
+        self.writer.write(LENGTH_HEADER.pack(len(data)))
+        self.writer.write(data)
+        self.segment_bytes += LENGTH_HEADER.size + len(data)
+        self.packets += 1
+        self.bytes   += len(data)
+
+    def end_segment(self):
+        """Flush the packets appended since the last call, returns the offset of the segment descriptor."""
+        self.writer.flush()
+        segment_bytes = self.segment_bytes
+        self.segment_bytes = 0
+        self.segments += 1
+        return SPOOL_FLAG | segment_bytes
+
+    def replay(self, offset):
+        """Yield the packets of the segment of a SPOOL_FLAG descriptor, oldest first."""
+        if self.reader is None:
+            self.reader = open(self.path, 'rb')
+        remaining = offset & ~SPOOL_FLAG
+        while remaining:
+            length, = LENGTH_HEADER.unpack(self.reader.read(LENGTH_HEADER.size))
+            data = self.reader.read(length)
+            remaining -= LENGTH_HEADER.size + length
+            self.replayed_packets += 1
+            self.replayed_bytes   += length
+            yield data
+
+    def caught_up(self, spill_start):
+        """Record the time from the first spilled packet of a segment (descriptor timestamp) to the end of its replay."""
+        elapsed = time.monotonic() - spill_start
+        self.catchups     += 1
+        self.catchup_time += elapsed
+        self.catchup_max   = max(self.catchup_max, elapsed)
+
+    def report(self, label):
+        if self.catchups:
+            return (f"- {label} info --> Spool replayed {self.replayed_packets} packets / {self.replayed_bytes} bytes in {self.catchups} segments | "
+                    f"AVG catch-up {self.catchup_time/self.catchups*1000:.1f} ms | MAX catch-up {self.catchup_max*1000:.1f} ms")
+        return f"- {label} info --> Spool {self.path} | Spilled {self.packets} packets / {self.bytes} bytes in {self.segments} segments"
+
+    def close(self):
+        for file in (self.writer, self.reader):
+            if file is not None:
+                file.close()
+        self.writer = self.reader = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class JitterStats:
+    """Intervals between occurrences of a periodic event, e.g. packet arrivals or MM2S sends.
+
+    tick() at every occurrence; the report gives mean, standard deviation,
+    percentiles and maximum of the intervals, so runs with different
+    scheduling settings can be compared. Percentiles use the first
+    max_samples intervals.
+    """
+
+    def __init__(self, max_samples=100000):
+        from array import array
+
+        self.max_samples = max_samples
+        self.samples = array('d')
+        self.last    = None
+        self.count   = 0
+        self.total   = 0.0
+        self.squares = 0.0
+        self.max     = 0.0
+
+    def tick(self, now=None):
+        now = time.perf_counter() if now is None else now
+        if self.last is not None:
+            interval = now - self.last
+            self.count   += 1
+            self.total   += interval
+            self.squares += interval*interval
+            self.max      = max(self.max, interval)
+            if len(self.samples) < self.max_samples:
+                self.samples.append(interval)
+        self.last = now
+
+    def report(self, label, name):
+        if not self.count:
+            return f"- {label} info --> {name} intervals: none"
+        mean = self.total / self.count
+        std  = max(0.0, self.squares / self.count - mean*mean) ** 0.5
+        ordered = sorted(self.samples)
+        p50 = ordered[len(ordered) // 2]
+        p99 = ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)]
+        return (f"- {label} info --> {name} intervals {self.count} | AVG {mean*1e6:.1f} us | STD {std*1e6:.1f} us ({100*std/mean if mean else 0:.1f} %) | "
+                f"P50 {p50*1e6:.1f} us | P99 {p99*1e6:.1f} us | MAX {self.max*1e6:.1f} us")
+
+
+STATS_FIELDS = ('bytes', 'packets', 'drops', 'backpressure', 'waits')
+STATS_LINE   = 64 # one writer per cache line: its sequence word followed by its counters
+STATS_READ_RETRIES = 10000 # consistent copy attempts of read() before it falls back to the last snapshot
+
+class StatsBlock:
+    """64-bit run counters of every pipeline stage in shared memory, without locks.
+
+    Each writer (a fill or consumer process) owns one line of STATS_FIELDS
+    counters: it counts in local integers and copies them with publish(),
+    nobody else writes the line. publish() makes the sequence word odd while
+    it stores, read() retries until it sees the same even sequence before and
+    after the copy, so a reader never gets a half written 64-bit value (two
+    stores on the 32-bit Zynq-7000). A writer killed inside publish() leaves
+    its sequence odd: read() gives up after STATS_READ_RETRIES attempts,
+    returns the last snapshot it got for that writer and marks it stale.
+    Only the creating process unlinks the memory in close().
+    """
+
+    def __init__(self, writers, name=None):
+        from multiprocessing import shared_memory
+
+        self.writers = tuple(writers)
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=len(self.writers)*STATS_LINE)
+        self.owner = os.getpid() if create else None # forked children never unlink
+        self.words = self.shm.buf.cast('Q')
+        if create:
+            self.shm.buf[:len(self.writers)*STATS_LINE] = bytes(len(self.writers)*STATS_LINE)
+        self.snapshots = {} # last consistent read of each writer, in this process
+        self.stale     = set()
+
+    def publish(self, writer, *values):
+        """Copy the local counters of writer, in STATS_FIELDS order."""
+        base = writer*STATS_LINE >> 3
+        sequence = self.words[base]
+        self.words[base] = sequence + 1
+        for index, value in enumerate(values):
+            self.words[base + 1 + index] = value
+        self.words[base] = sequence + 2
+
+    def read(self, writer):
+        """Last published counters of writer as a dict of STATS_FIELDS."""
+        base = writer*STATS_LINE >> 3
+        for attempt in range(STATS_READ_RETRIES):
+            sequence = self.words[base]
+            if sequence & 1:
+                continue
+            values = self.words[base + 1 : base + 1 + len(STATS_FIELDS)].tolist()
+            if self.words[base] == sequence:
+                self.snapshots[writer] = dict(zip(STATS_FIELDS, values))
+                self.stale.discard(writer)
+                return self.snapshots[writer]
+        self.stale.add(writer)
+        return self.snapshots.get(writer, dict.fromkeys(STATS_FIELDS, 0))
+
+    def total(self, field, writers=None):
+        """Sum of field over writers (indexes or names, default all)."""
+        writers = range(len(self.writers)) if writers is None else writers
+        return sum(self.read(self.writers.index(writer) if isinstance(writer, str) else writer)[field] for writer in writers)
+
+    def report(self, label):
+        lines = []
+        for writer, name in enumerate(self.writers):
+            values = self.read(writer)
+            lines.append(f"- {label} info --> Stats {name}: " + " | ".join(f"{field} {values[field]}" for field in STATS_FIELDS) + (" | stale, the writer stopped inside publish" if writer in self.stale else ""))
+        return "\n".join(lines)
+
+    def close(self):
+        self.words.release()
+        self.shm.close()
+        if self.owner == os.getpid():
+            self.shm.unlink()
+
+
+MCL_CURRENT = 1
+MCL_FUTURE  = 2
+
+def apply_scheduling(cpus=None, fifo_priority=None, nice=None, mlock=False):
+    """Pin, prioritise and lock the calling thread/process, returns a list of what was applied or failed.
+
+    cpus is a set of CPU numbers for sched_setaffinity, fifo_priority a
+    SCHED_FIFO priority (1-99), nice a nice value for SCHED_OTHER. On Linux
+    all three apply to the calling thread, so they work per stage in both
+    pipeline modes. mlock calls mlockall(MCL_CURRENT | MCL_FUTURE) for the
+    process. Each setting that fails (usually missing privileges) is reported
+    and skipped.
+    """
+    applied = []
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+            applied.append(f"CPUs {','.join(str(cpu) for cpu in sorted(cpus))}")
+        except OSError as error:
+            applied.append(f"CPUs {sorted(cpus)} failed ({error.strerror})")
+    if fifo_priority:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(fifo_priority))
+            applied.append(f"SCHED_FIFO {fifo_priority}")
+        except OSError as error:
+            applied.append(f"SCHED_FIFO {fifo_priority} failed ({error.strerror})")
+    if nice is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, nice)
+            applied.append(f"nice {nice}")
+        except OSError as error:
+            applied.append(f"nice {nice} failed ({error.strerror})")
+    if mlock:
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) == 0:
+            applied.append("mlockall")
+        else:
+            applied.append(f"mlockall failed ({os.strerror(ctypes.get_errno())})")
+    return applied
@@ -1,14 +1,17 @@
+import time
+
+MODULE_LOAD_START = time.perf_counter() # before the other imports, --timing includes them
+
 import os
-import mmap
 import struct
 import argparse
-import time
-import socket
 
 #from multiprocessing import Process, Array, Value, Manager, Queue
 #from queue import Empty
 
-from multiprocessing import Process, Array, Value, RawArray
+# multiprocessing and socket are imported by the commands that need them, they dominate the startup time of a status read
+
+from dma_utils import RegisterBank, HardwareMap, WaitStrategy, LENGTH_HEADER, send_framed, FileSink, HexTextSink, convert_to_text, MappedFileSink, SpscRing
 
 # Register Offsets
 MM2S_CONTROL_REGISTER       = 0x00
@@ -52,27 +55,37 @@ AXIL_OFFSET  = 0x40400000
 MM2S_OFFSET  = 0x0e000000
 S2MM_OFFSET  = 0x0f000000
 
-ddr_memory = os.open("/dev/mem", os.O_RDWR | os.O_SYNC)
-gpio_virtual_addr1 = mmap.mmap(ddr_memory, 65535, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=GPIO1_OFFSET)
-gpio_virtual_addr2 = mmap.mmap(ddr_memory, 65535, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=GPIO2_OFFSET)
-dma_virtual_addr   = mmap.mmap(ddr_memory, 65535, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=AXIL_OFFSET)
+# Acquisition buffers (--acquisition): --buffers buffers of --buffer_size bytes from S2MM_OFFSET, handed to the writer in order
+S2MM_REGION_SIZE     = 0x01000000 # 16 MB reserved for the S2MM transfers
+S2MM_BUFFERS         = 4
+S2MM_BUFFER_SIZE     = 0x00400000
 
-virtual_src_addr   = mmap.mmap(ddr_memory, 16777215, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=MM2S_OFFSET)
-virtual_dst_addr   = mmap.mmap(ddr_memory, 16777215, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=S2MM_OFFSET)
+# --file_type m: output file reserved with posix_fallocate and mapped this many bytes at a time
+FILE_EXTENT          = 256*1024*1024
+
+FILL_WAIT_TIMEOUT_MS = 100 # without --wait_timeout the fill process still checks its stop flag this often
+
+# (completion mode, spins before sleeping, max backoff sleep in us, timeout in ms - 0 for none)
+DEFAULT_WAIT_CONFIG  = ('spin', 1000, 1000, 0)
+
+# Regions of /dev/mem: (offset, length, RegisterBank). Each one is mapped the first time a command touches it (hw.<name>).
+# Control regions are accessed through RegisterBank (see dma_utils) instead of seek/read/write on the mmap
+hw = HardwareMap("/dev/mem", {
+    'gpio_virtual_addr1' : (GPIO1_OFFSET, 65535   , True ),
+    'gpio_virtual_addr2' : (GPIO2_OFFSET, 65535   , True ),
+    'dma_virtual_addr'   : (AXIL_OFFSET , 65535   , True ),
+    'virtual_src_addr'   : (MM2S_OFFSET , 16777215, False),
+    'virtual_dst_addr'   : (S2MM_OFFSET , S2MM_REGION_SIZE, False),
+})
 
 
 
 
 def write_dma(virtual_addr, offset, value):
-    #struct.pack_into('<I', virtual_addr, offset, value)
-    virtual_addr.seek(offset)
-    virtual_addr.write((value).to_bytes(4, byteorder='little'))
+    virtual_addr[offset] = value
 
 def read_dma(virtual_addr, offset):
-    virtual_addr.seek(offset)  # Move to the correct offset
-    data = virtual_addr.read(4)  # Read 4 bytes (assuming 32-bit value)
-    return int.from_bytes(data, byteorder='little')  # Convert bytes to int
-    #return struct.unpack_from('<I', virtual_addr, offset)[0]
+    return virtual_addr[offset]
 
 def read_dma_status(virtual_addr, offset):
     status = read_dma(virtual_addr, offset)
@@ -122,17 +135,25 @@ def dma_mm2s_status(virtual_addr):
     if status & STATUS_ERR_IRQ:
         print(" Error interrupt occurred.")
 
-def dma_mm2s_sync(virtual_addr):
+def dma_mm2s_sync(virtual_addr, waiter=None):
+    if waiter is not None:
+        return waiter.wait(virtual_addr, MM2S_STATUS_REGISTER, IOC_IRQ_FLAG | IDLE_FLAG)
     while True:
         mm2s_status = read_dma(virtual_addr, MM2S_STATUS_REGISTER)
         if (mm2s_status & IOC_IRQ_FLAG) and (mm2s_status & IDLE_FLAG):
-            break
+            return True
 
-def dma_s2mm_sync(virtual_addr):
+def dma_s2mm_sync(virtual_addr, waiter=None):
+    if waiter is not None:
+        return waiter.wait(virtual_addr, S2MM_STATUS_REGISTER, IOC_IRQ_FLAG | IDLE_FLAG)
     while True:
         s2mm_status = read_dma(virtual_addr, S2MM_STATUS_REGISTER)
         if (s2mm_status & IOC_IRQ_FLAG) and (s2mm_status & IDLE_FLAG):
-            break
+            return True
+
+def make_wait_strategy(wait_config, default_timeout_ms=0):
+    completion_mode, spin_count, sleep_max, timeout_ms = wait_config
+    return WaitStrategy(completion_mode, spin_count, sleep_max/1e6, timeout_ms or default_timeout_ms)
 
 def print_mem(virtual_address, byte_count):
     data = virtual_address[:byte_count]
@@ -144,152 +165,122 @@ def print_mem(virtual_address, byte_count):
 
 def led_config(value):
     print("Performing configuration of the LEDs.")
-    write_dma(gpio_virtual_addr1, 0x00, value)
+    write_dma(hw.gpio_virtual_addr1, 0x00, value)
 
 def do_mm2s_status():                     #### Maybe those can be deleted and implemented into the main
-    dma_mm2s_status(dma_virtual_addr)
+    dma_mm2s_status(hw.dma_virtual_addr)
 
 def do_s2mm_status():                     #### Maybe those can be deleted and implemented into the main
-    dma_s2mm_status(dma_virtual_addr)
+    dma_s2mm_status(hw.dma_virtual_addr)
 
 def do_status_s2mm_mm2s():
-    dma_s2mm_status(dma_virtual_addr)
-    dma_mm2s_status(dma_virtual_addr)
+    dma_s2mm_status(hw.dma_virtual_addr)
+    dma_mm2s_status(hw.dma_virtual_addr)
     print("FIFO STATUS")
-    read_dma_status(gpio_virtual_addr1, 0x8)
-    read_dma_status(gpio_virtual_addr2, 0x0)
+    read_dma_status(hw.gpio_virtual_addr1, 0x8)
+    read_dma_status(hw.gpio_virtual_addr2, 0x0)
 
 def do_s2mm_reset():
-    write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER      , RESET_DMA)
+    write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER      , RESET_DMA)
 
 def do_mm2s_reset():
-    write_dma(dma_virtual_addr, MM2S_CONTROL_REGISTER      , RESET_DMA)
+    write_dma(hw.dma_virtual_addr, MM2S_CONTROL_REGISTER      , RESET_DMA)
 
 def do_s2mm_run():
-    write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER      , RUN_DMA)
+    write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER      , RUN_DMA)
 
 def do_mm2s_run():
-    write_dma(dma_virtual_addr, MM2S_CONTROL_REGISTER      , RUN_DMA)
+    write_dma(hw.dma_virtual_addr, MM2S_CONTROL_REGISTER      , RUN_DMA)
 
 def do_s2mm_irq():
-    write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
+    write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
 
 def do_mm2s_irq():
-    write_dma(dma_virtual_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
+    write_dma(hw.dma_virtual_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
 
 def do_s2mm_ioc():
-    write_dma(dma_virtual_addr, S2MM_STATUS_REGISTER    , CLEAR_IOC_IRQ)
+    write_dma(hw.dma_virtual_addr, S2MM_STATUS_REGISTER    , CLEAR_IOC_IRQ)
 
 def do_mm2s_ioc():
-    write_dma(dma_virtual_addr, MM2S_STATUS_REGISTER      , CLEAR_IOC_IRQ)
+    write_dma(hw.dma_virtual_addr, MM2S_STATUS_REGISTER      , CLEAR_IOC_IRQ)
 
 def do_s2mm_trn(byte):
-    write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER      , byte)
-    #dma_virtual_addr[S2MM_BUFF_LENGTH_REGISTER]=0x0080
+    write_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER      , byte)
+    #hw.dma_virtual_addr[S2MM_BUFF_LENGTH_REGISTER]=0x0080
 
 def do_mm2s_trn(byte):
-    write_dma(dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER      , byte)
-    #dma_virtual_addr[MM2S_TRNSFR_LENGTH_REGISTER]=0x0080
+    write_dma(hw.dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER      , byte)
+    #hw.dma_virtual_addr[MM2S_TRNSFR_LENGTH_REGISTER]=0x0080
 
 def do_read_s2mm_trn():
-    read_dma_status(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
+    read_dma_status(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
 
 def do_read_mm2s_trn():
-    read_dma_status(dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER)
+    read_dma_status(hw.dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER)
 
 def do_s2mm_adr():
-    write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER      , S2MM_OFFSET)
+    write_dma(hw.dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER      , S2MM_OFFSET)
 
 def do_mm2s_adr():
-    write_dma(dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER      , MM2S_OFFSET)
+    write_dma(hw.dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER      , MM2S_OFFSET)
 
 def do_read_s2mm_adr():
-    read_dma_status(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER)
+    read_dma_status(hw.dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER)
 
 def do_read_mm2s_adr():
-    read_dma_status(dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER)
+    read_dma_status(hw.dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER)
 
 def do_read_s2mm_crtl():
-    read_dma_status(dma_virtual_addr, S2MM_CONTROL_REGISTER)
+    read_dma_status(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER)
 
 def do_read_mm2s_crtl():
-    read_dma_status(dma_virtual_addr, MM2S_CONTROL_REGISTER)
+    read_dma_status(hw.dma_virtual_addr, MM2S_CONTROL_REGISTER)
 
 def do_read_led_status():                 ###### To DELETE?
-    read_dma_status(gpio_virtual_addr1, 0x0)    
+    read_dma_status(hw.gpio_virtual_addr1, 0x0)    
 
 def do_read_fifo_status_0():
-    read_dma_status(gpio_virtual_addr1, 0x8)
+    read_dma_status(hw.gpio_virtual_addr1, 0x8)
 
 def do_read_fifo_status_1():
-    read_dma_status(gpio_virtual_addr2, 0x0)
+    read_dma_status(hw.gpio_virtual_addr2, 0x0)
 
 def do_read_fifo_status_2():
     print("nothing to do")
-    #read_dma_status(gpio_virtual_addr2, 0x8)
+    #read_dma_status(hw.gpio_virtual_addr2, 0x8)
 
-def save_mem_to_file_hex(virtual_address, offset, byte_count, file_path):
+def save_mem_to_file_hex(virtual_address, offset, byte_count, sink):
+    # sink: HexTextSink the caller keeps open across packets
     data = virtual_address[offset: (offset + byte_count)]
-    with open(file_path, 'a') as file:
-        for i in range(byte_count):
-            file.write(f"{data[i]:02X}")
-            if i % 4 == 3:
-                file.write(" ")
-        file.write("\n")
-    #file.close()
-
-def save_mem_to_file_bin(virtual_address, offset, byte_count, file_path):
+    sink.write((data,))
+    sink.flush()
+
+def save_mem_to_file_bin(virtual_address, offset, byte_count, sink):
+    # sink: FileSink the caller keeps open across packets
     data = virtual_address[offset: (offset + byte_count)]
-    with open(file_path, 'ab') as file:  # Open in binary append mode
-        file.write(data)
-    #file.close()
+    sink.write((data,))
 
-def do_fill_memory(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, stop, debug, data_buffer_array_order):
+def do_fill_memory(packet_ring, buffer_size, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, stop, debug):
     try:
-        print(f"- S2MM info --> Started fill memory process | Polling period: {polling_period/10} ms | Max packet size: {max_packet_size} bytes")
+        print(f"- S2MM info --> Started fill memory process | Polling period: {polling_period/10} ms | Max packet size: {max_packet_size} bytes | Buffers: {packet_ring.n_slots} x {buffer_size} bytes")
         print("")
         #time.sleep(0.5)
         total_transmitted_bytes_buffer = 0
         while do_fill_memory_while.value == 0:
-            if (int(read_dma(gpio_virtual_addr2, 0x0)))>10 :
-                if   data_buffer_array[0] == 0 :
-                    write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , 0x0f000000)
-                    write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                    dma_s2mm_sync(dma_virtual_addr)
-                    data_buffer_array[0] = read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
-                    data_buffer_array_order.append(0)
-                    total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + data_buffer_array[0]
-                    total_transmitted_bytes.value = total_transmitted_bytes_buffer
-
-                elif data_buffer_array[1] == 0 :
-                    write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , 0x0f400000)
-                    write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                    dma_s2mm_sync(dma_virtual_addr)
-                    data_buffer_array[1] = read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
-                    data_buffer_array_order.append(1)
-                    total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + data_buffer_array[1]
-                    total_transmitted_bytes.value = total_transmitted_bytes_buffer
-
-                elif data_buffer_array[2] == 0 :
-                    write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , 0x0f800000)
-                    write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                    dma_s2mm_sync(dma_virtual_addr)
-                    data_buffer_array[2] = read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
-                    data_buffer_array_order.append(2)
-                    total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + data_buffer_array[2]
-                    total_transmitted_bytes.value = total_transmitted_bytes_buffer
-
-                elif data_buffer_array[3] == 0 :
-                    write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , 0x0fc00000)
-                    write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                    dma_s2mm_sync(dma_virtual_addr)
-                    data_buffer_array[3] = read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
-                    data_buffer_array_order.append(3)
-                    total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + data_buffer_array[3]
+            if (int(read_dma(hw.gpio_virtual_addr2, 0x0)))>10 :
+                if packet_ring.free():
+                    # Buffers are used in ring order, the writer releases them in the same order
+                    offset = packet_ring.next_slot()*buffer_size
+                    write_dma(hw.dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , S2MM_OFFSET + offset)
+                    write_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
+                    dma_s2mm_sync(hw.dma_virtual_addr)
+                    length = read_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
+                    packet_ring.push(offset, length)
+                    total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + length
                     total_transmitted_bytes.value = total_transmitted_bytes_buffer
 
                 else :
-                    print(f"Backpressure detected  --> {data_buffer_array_order}")
+                    print(f"Backpressure detected  --> {packet_ring.pending()} buffers waiting for the writer")
                     time.sleep(polling_period/10000)
         time.sleep(0.005)
         stop.value = 1
@@ -301,88 +292,36 @@ def do_fill_memory(data_buffer_array, total_transmitted_bytes, do_fill_memory_wh
 
 
 ####################################################################### WIP  --> aded timeout_period, added data_buffer_limit
-def do_fill_memory_high_speed(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, stop, debug, data_buffer_array_order):
+def do_fill_memory_high_speed(packet_ring, buffer_size, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, stop, debug):
     try:
-        print(f"- S2MM info --> Started fill memory high speed process | Polling period: {polling_period/10} ms | Max packet size: {max_packet_size} bytes | Timeout period: {timeout_period} ms | Data buffer limit: {data_buffer_limit} bytes")
+        print(f"- S2MM info --> Started fill memory high speed process | Polling period: {polling_period/10} ms | Max packet size: {max_packet_size} bytes | Timeout period: {timeout_period} ms | Data buffer limit: {data_buffer_limit} bytes | Buffers: {packet_ring.n_slots} x {buffer_size} bytes")
         print("")
         #time.sleep(0.5)
         total_transmitted_bytes_buffer = 0
-        data_buffer_counter_0 = 0
-        data_buffer_counter_1 = 0
-        data_buffer_counter_2 = 0
-        data_buffer_counter_3 = 0
+        data_buffer_counter = 0 # bytes collected in the buffer currently being filled
         begin_time = time.time()
-        while (do_fill_memory_while.value == 0) or (data_buffer_counter_0 > 0) or (data_buffer_counter_1 > 0) or (data_buffer_counter_2 > 0) or (data_buffer_counter_3 > 0):
+        while (do_fill_memory_while.value == 0) or (data_buffer_counter > 0):
             time_is_out = (time.time() - begin_time) > (timeout_period/1000)
-            if ((int(read_dma(gpio_virtual_addr2, 0x0)))>10) or time_is_out :
+            if ((int(read_dma(hw.gpio_virtual_addr2, 0x0)))>10) or time_is_out :
                 begin_time = time.time()
-                if data_buffer_array[0] == 0 and data_buffer_counter_1 == 0 and data_buffer_counter_2 == 0 and data_buffer_counter_3 == 0:
+                if packet_ring.free():
+                    offset = packet_ring.next_slot()*buffer_size
                     if not(time_is_out) :
-                        write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , (0x0f000000+data_buffer_counter_0))
-                        write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                        dma_s2mm_sync(dma_virtual_addr)
-                        data_buffer_counter_0 = data_buffer_counter_0 + read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
-                    if ((data_buffer_counter_0 > data_buffer_limit) or time_is_out) and data_buffer_counter_0 > 0:
+                        write_dma(hw.dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , (S2MM_OFFSET + offset + data_buffer_counter))
+                        write_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
+                        dma_s2mm_sync(hw.dma_virtual_addr)
+                        data_buffer_counter = data_buffer_counter + read_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
+                    # Hand the buffer over at the limit, on timeout, or when the next transfer would not fit
+                    if ((data_buffer_counter > data_buffer_limit) or (data_buffer_counter + max_packet_size > buffer_size) or time_is_out) and data_buffer_counter > 0:
                         if debug:
-                            print("used buffer 0")
-                            print(data_buffer_array_order)
-                            print(f"Data buffer array before {data_buffer_array[0]}")
-                            print(f"Data buffer counter {data_buffer_counter_0}")
-                        data_buffer_array_order.append(0)
-                        data_buffer_array[0] = data_buffer_counter_0
-                        data_buffer_counter_0 = 0
-                        if debug:
-                            print(f"Data buffer array after {data_buffer_array[0]}")
-                        total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + data_buffer_array[0]
-                        total_transmitted_bytes.value = total_transmitted_bytes_buffer
-
-                elif data_buffer_array[1] == 0 and data_buffer_counter_0 == 0 and data_buffer_counter_2 == 0 and data_buffer_counter_3 == 0:
-                    if not(time_is_out) :
-                        write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , (0x0f400000+data_buffer_counter_1))
-                        write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                        dma_s2mm_sync(dma_virtual_addr)
-                        data_buffer_counter_1 = data_buffer_counter_1 + read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
-                    if ((data_buffer_counter_1 > data_buffer_limit) or time_is_out) and data_buffer_counter_1 > 0:
-                        if debug:
-                            print("used buffer 1")
-                        data_buffer_array[1] = data_buffer_counter_1
-                        data_buffer_array_order.append(1)
-                        data_buffer_counter_1 = 0
-                        total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + data_buffer_array[1]
-                        total_transmitted_bytes.value = total_transmitted_bytes_buffer
-
-                elif data_buffer_array[2] == 0 and data_buffer_counter_1 == 0 and data_buffer_counter_0 == 0 and data_buffer_counter_3 == 0:
-                    if not(time_is_out) :
-                        write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , (0x0f800000+data_buffer_counter_2))
-                        write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                        dma_s2mm_sync(dma_virtual_addr)
-                        data_buffer_counter_2 = data_buffer_counter_2 + read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
-                    if ((data_buffer_counter_2 > data_buffer_limit) or time_is_out) and data_buffer_counter_2 > 0:
-                        if debug:
-                            print("used buffer 2") 
-                        data_buffer_array[2] = data_buffer_counter_2
-                        data_buffer_array_order.append(2)
-                        data_buffer_counter_2 = 0
-                        total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + data_buffer_array[2]
-                        total_transmitted_bytes.value = total_transmitted_bytes_buffer
-
-                elif data_buffer_array[3] == 0 and data_buffer_counter_1 == 0 and data_buffer_counter_0 == 0 and data_buffer_counter_2 == 0:
-                    if not(time_is_out) :
-                        write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , (0x0fc00000+data_buffer_counter_3))
-                        write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                        dma_s2mm_sync(dma_virtual_addr)
-                        data_buffer_counter_3 = data_buffer_counter_3 + read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
-                    if ((data_buffer_counter_3 > data_buffer_limit) or time_is_out) and data_buffer_counter_3 > 0:
-                        if debug:
-                            print("used buffer 3") 
-                        data_buffer_array[3] = data_buffer_counter_3
-                        data_buffer_array_order.append(3)
-                        data_buffer_counter_3 = 0
-                        total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + data_buffer_array[3]
+                            print(f"used buffer {packet_ring.next_slot()} | Data buffer counter {data_buffer_counter}")
+                        packet_ring.push(offset, data_buffer_counter)
+                        total_transmitted_bytes_buffer = total_transmitted_bytes_buffer  + data_buffer_counter
                         total_transmitted_bytes.value = total_transmitted_bytes_buffer
+                        data_buffer_counter = 0
 
                 else :
-                    print(f"Backpressure detected  --> {data_buffer_array_order}")
+                    print(f"Backpressure detected  --> {packet_ring.pending()} buffers waiting for the writer")
                     time.sleep(polling_period/10000)
         time.sleep(0.005)
         stop.value = 1
@@ -395,22 +334,29 @@ def do_fill_memory_high_speed(data_buffer_array, total_transmitted_bytes, do_fil
 
 
 
-def do_fill_memory_high_speed_socket(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, data_buffer_queue, BUFFER_SIZE, write_index):
+def do_fill_memory_high_speed_socket(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, data_buffer_queue, BUFFER_SIZE, write_index, wait_config=DEFAULT_WAIT_CONFIG):
     try:
-        print(f"- S2MM info --> Started fill memory high speed socket process | Polling period: {polling_period/10} ms | Max packet size: {max_packet_size} bytes | Timeout period: {timeout_period} ms | Data buffer limit: {data_buffer_limit} bytes")
+        print(f"- S2MM info --> Started fill memory high speed socket process | Polling period: {polling_period/10} ms | Max packet size: {max_packet_size} bytes | Timeout period: {timeout_period} ms | Data buffer limit: {data_buffer_limit} bytes | Completion mode: {wait_config[0]}")
         print("")
+        waiter       = make_wait_strategy(wait_config, FILL_WAIT_TIMEOUT_MS)
         packet_count = 0
         index        = 0
         for ind in range(BUFFER_SIZE):
             data_buffer_array[ind] = 0
         
         while (do_fill_memory_while.value == 0):
-            if (read_dma(gpio_virtual_addr2, 0x0)>10):
+            if (read_dma(hw.gpio_virtual_addr2, 0x0)>10):
                 if data_buffer_array[index] == 0:
-                    write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , (0x0F000000 + (index*64*1024)))
-                    write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                    dma_s2mm_sync(dma_virtual_addr)
-                    data_buffer_array[index] =  read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
+                    write_dma(hw.dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , (0x0F000000 + (index*64*1024)))
+                    write_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
+                    completed = dma_s2mm_sync(hw.dma_virtual_addr, waiter)
+                    while not completed and do_fill_memory_while.value == 0:
+                        if debug:
+                            print(f"S2MM wait timed out on index: {index} and packet counter: {packet_count}")
+                        completed = dma_s2mm_sync(hw.dma_virtual_addr, waiter)
+                    if not completed:
+                        break
+                    data_buffer_array[index] =  read_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
                     total_transmitted_bytes.value = total_transmitted_bytes.value  + data_buffer_array[index]
                     data_buffer_queue[write_index.value] = index
                     write_index.value = (write_index.value + 1) % BUFFER_SIZE
@@ -421,6 +367,7 @@ def do_fill_memory_high_speed_socket(data_buffer_array, total_transmitted_bytes,
             time.sleep(polling_period/10000)
         print("")
         print("- S2MM info --> Ended fill memory high speed socket process")
+        print(waiter.report("S2MM"))
     except KeyboardInterrupt:
         print("")
         print(f"--->    KeyboardInterrupt occurred for fill memory high speed process")
@@ -454,7 +401,7 @@ def do_write_memory_indexing(data_buffer_array, total_transmitted_bytes, do_writ
                 index = data_buffer_queue[read_index.value]
                 indexing_time = time.time()                  # DEBUG TIME #
                 with open(file_name, 'ab') as file:
-                    file.write(virtual_dst_addr[(index*64*1024) : (index*64*1024) + data_buffer_array[index]])
+                    file.write(hw.virtual_dst_addr[(index*64*1024) : (index*64*1024) + data_buffer_array[index]])
                 sendall_time = time.time()                   # DEBUG TIME #
                 read_index.value = (read_index.value + 1) % BUFFER_SIZE
                 total_written_bytes += data_buffer_array[index]
@@ -487,86 +434,52 @@ def do_write_memory_indexing(data_buffer_array, total_transmitted_bytes, do_writ
         print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
 
 
-def do_write_memory(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, file_name, file_type, stop, debug, data_buffer_array_order):
+def do_write_memory(packet_ring, total_transmitted_bytes, do_write_memory_while, polling_period, file_name, file_type, stop, debug, file_extent=FILE_EXTENT):
     try:
         print(f"- S2MM info --> Started write memory process | Polling period: {polling_period/10} ms | File name: {file_name} | File type: {file_type}")
         print("")
         total_written_bytes            = 0
         total_transmitted_bytes_value  = 0
+        # The file stays open for the run and each batch of buffers is one gathered write, one copy into a
+        # preallocated mapping of the file with --file_type m, or hex lines converted in bulk with --file_type t
+        if file_type == 'b':
+            sink = FileSink(file_name)
+        elif file_type == 'm':
+            sink = MappedFileSink(file_name, file_extent)
+        else:
+            sink = HexTextSink(file_name)
+        dst_view = memoryview(hw.virtual_dst_addr)
         #time.sleep(0.5)
-        while data_buffer_array[0] == 0 :
+        while (do_write_memory_while.value == 0 or stop.value == 0) and not packet_ring.available():
             time.sleep(polling_period/10000)
         start_time = time.time()
         current_time = start_time
-        if debug:
-            print(data_buffer_array[0] > 0)
-            print(data_buffer_array_order)
-            print(data_buffer_array_order[0] == 0)
-        while do_write_memory_while.value == 0 or stop.value == 0:
-            if   data_buffer_array[0] > 0 and data_buffer_array_order[0] == 0:
-                if debug:
-                    print(f"Wrote memory 0 ----> {data_buffer_array_order}") 
-                if file_type == 'b':
-                    save_mem_to_file_bin(virtual_dst_addr, int(0x00000000), data_buffer_array[0], file_name)
-                else :
-                    save_mem_to_file_hex(virtual_dst_addr, int(0x00000000), data_buffer_array[0], file_name)
-                total_written_bytes = total_written_bytes + data_buffer_array[0]
+        while do_write_memory_while.value == 0 or stop.value == 0 or packet_ring.available():
+            descriptors = packet_ring.peek()
+            if descriptors:
+                # Buffers come out in the order the fill process published them
+                for offset, length, sequence, timestamp in descriptors:
+                    if debug:
+                        print(f"Wrote buffer at 0x{offset:08x} ----> {length} bytes, {packet_ring.pending()} buffers pending")
+                    total_written_bytes = total_written_bytes + length
+                sink.write([dst_view[offset : offset + length] for offset, length, sequence, timestamp in descriptors])
+                packet_ring.release(len(descriptors))
                 total_transmitted_bytes_value = total_transmitted_bytes.value
-                data_buffer_array[0] = 0
-                data_buffer_array_order.pop(0)
-                current_time = time.time()
-                print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes_value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
-
-            elif data_buffer_array[1] > 0 and data_buffer_array_order[0] == 1:
-                if debug:
-                    print(f"Wrote memory 1 ----> {data_buffer_array_order}") 
-                if file_type == 'b':
-                    save_mem_to_file_bin(virtual_dst_addr, int(0x00400000), data_buffer_array[1], file_name)
-                else:
-                    save_mem_to_file_hex(virtual_dst_addr, int(0x00400000), data_buffer_array[1], file_name)
-                total_written_bytes = total_written_bytes + data_buffer_array[1]
-                total_transmitted_bytes_value = total_transmitted_bytes.value
-                data_buffer_array[1] = 0
-                data_buffer_array_order.pop(0)
-                current_time = time.time()
-                print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes_value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
-
-            elif data_buffer_array[2] > 0 and data_buffer_array_order[0] == 2:
-                if debug:
-                    print(f"Wrote memory 2 ----> {data_buffer_array_order}") 
-                if file_type == 'b':
-                    save_mem_to_file_bin(virtual_dst_addr, int(0x00800000), data_buffer_array[2], file_name)
-                else:
-                    save_mem_to_file_hex(virtual_dst_addr, int(0x00800000), data_buffer_array[2], file_name)
-                total_written_bytes = total_written_bytes + data_buffer_array[2]
-                total_transmitted_bytes_value = total_transmitted_bytes.value
-                data_buffer_array[2] = 0
-                data_buffer_array_order.pop(0)
-                current_time = time.time()
-                print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes_value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
-
-            elif data_buffer_array[3] > 0 and data_buffer_array_order[0] == 3:
-                if debug:
-                    print(f"Wrote memory 3 ----> {data_buffer_array_order}") 
-                if file_type == 'b':
-                    save_mem_to_file_bin(virtual_dst_addr, int(0x00c00000), data_buffer_array[3], file_name)
-                else:
-                    save_mem_to_file_hex(virtual_dst_addr, int(0x00c00000), data_buffer_array[3], file_name)
-                total_written_bytes = total_written_bytes + data_buffer_array[3]
-                total_transmitted_bytes_value = total_transmitted_bytes.value
-                data_buffer_array[3] = 0
-                data_buffer_array_order.pop(0)
                 current_time = time.time()
                 print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes_value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
 
             else :
+                sink.flush()
                 time.sleep(polling_period/10000)
                 total_transmitted_bytes_value = total_transmitted_bytes.value
                 current_time = time.time()
                 print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes_value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
 
+        dst_view.release()
         print("")
         print("- S2MM info --> Ended write memory process")
+        sink.close()
+        print(sink.report("S2MM"))
         #print("###     ")
         #print("###     ")
         #print("###     ")
@@ -595,7 +508,7 @@ packets = []
 while ...:
     if read_index.value != write_index.value:
         index = data_buffer_queue[read_index.value]
-        packets.append(header_cache[...] + virtual_dst_addr[...])
+        packets.append(header_cache[...] + hw.virtual_dst_addr[...])
         read_index.value = (read_index.value + 1) % BUFFER_SIZE
         if len(packets) == batch_size:
             combined_packet = b"".join(packets)
@@ -611,7 +524,7 @@ while ...:
             batch_size = 10
             packets = []
 
-packets.append(virtual_dst_addr[(index*64*1024) : (index*64*1024) + data_buffer_array[index]])
+packets.append(hw.virtual_dst_addr[(index*64*1024) : (index*64*1024) + data_buffer_array[index]])
                     append_time = time.time()                  # DEBUG TIME #
                     if len(packets) == batch_size:
                         combined_packet = b"".join(packets)
@@ -619,16 +532,11 @@ packets.append(virtual_dst_addr[(index*64*1024) : (index*64*1024) + data_buffer_
                         packets = []
 '''
 
-# Pre-allocate headers for all possible packet sizes
-header_cache = {
-    size: struct.pack("!I", size) 
-    for size in range(1, 65536)
-}
-
 def do_send_socket_no_print(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, debug, data_buffer_queue, HOST, PORT_TCP, BUFFER_SIZE, write_index, read_index):
     try:
         print(f"- S2MM info --> Started TCP send memory process | Polling period: {polling_period/10} ms")
         print(f"- S2MM info --> Connecting to socket as client | HOST: {HOST} | PORT: {PORT_TCP}")
+        import socket
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
             # Disable Nagle + increase send buffer
             client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
@@ -654,6 +562,10 @@ def do_send_socket_no_print(data_buffer_array, total_transmitted_bytes, do_write
             total = 0
             # DEBUG TIME #
 
+            # Header packed in place and sent together with a view of the DMA buffer: no allocation or copy per packet
+            header    = bytearray(LENGTH_HEADER.size)
+            dst_view  = memoryview(hw.virtual_dst_addr)
+
             while data_buffer_array[0] == 0 :
                 time.sleep(polling_period/10000)
             start_time = time.time()
@@ -662,7 +574,8 @@ def do_send_socket_no_print(data_buffer_array, total_transmitted_bytes, do_write
                 if read_index.value != write_index.value:
                     index = data_buffer_queue[read_index.value]
                     indexing_time = time.time()                  # DEBUG TIME #
-                    client.sendall(header_cache[data_buffer_array[index]] + virtual_dst_addr[(index*64*1024) : (index*64*1024) + data_buffer_array[index]])
+                    LENGTH_HEADER.pack_into(header, 0, data_buffer_array[index])
+                    send_framed(client, header, dst_view[(index*64*1024) : (index*64*1024) + data_buffer_array[index]])
                     sendall_time = time.time()                   # DEBUG TIME #
                     read_index.value = (read_index.value + 1) % BUFFER_SIZE
                     total_written_bytes += data_buffer_array[index]
@@ -678,6 +591,7 @@ def do_send_socket_no_print(data_buffer_array, total_transmitted_bytes, do_write
 
                 else:
                     time.sleep(polling_period/10000)
+            dst_view.release()
 
             current_time = time.time()
             print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
@@ -701,6 +615,7 @@ def do_send_socket(data_buffer_array, total_transmitted_bytes, do_write_memory_w
     try:
         print(f"- S2MM info --> Started TCP send memory process | Polling period: {polling_period/10} ms")
         print(f"- S2MM info --> Connecting to socket as client | HOST: {HOST} | PORT: {PORT_TCP}")
+        import socket
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
             # Disable Nagle + increase send buffer
             client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
@@ -724,6 +639,8 @@ def do_send_socket(data_buffer_array, total_transmitted_bytes, do_write_memory_w
             end_time_cycle   = 0
             packet_length_debug = 0
             increment_read_index_time = 0
+            header   = bytearray(LENGTH_HEADER.size)
+            dst_view = memoryview(hw.virtual_dst_addr)
             ## end   debug parameters
             with read_index.get_lock():
                 while do_write_memory_while.value == 0 or (read_index.value != write_index.value): #or not data_buffer_queue.empty():
@@ -733,9 +650,9 @@ def do_send_socket(data_buffer_array, total_transmitted_bytes, do_write_memory_w
                         index = read_index.value
                         got_index_time = time.time() # this is for debug
                         #packet_length = struct.pack("!I", data_buffer_array[index])
-                        packet_length = header_cache[data_buffer_array[index]]
+                        LENGTH_HEADER.pack_into(header, 0, data_buffer_array[index])
                         calculated_packet_length_time = time.time() # this is for debug
-                        client.sendall(packet_length + virtual_dst_addr[(index*65536) : (index*65536) + data_buffer_array[index]])
+                        send_framed(client, header, dst_view[(index*65536) : (index*65536) + data_buffer_array[index]])
                         end_send_all_time = time.time() # this is for debug
                         read_index.value = (read_index.value + 1) % BUFFER_SIZE
                         
@@ -759,6 +676,7 @@ def do_send_socket(data_buffer_array, total_transmitted_bytes, do_write_memory_w
                     else:
                         time.sleep(polling_period/10000)
                         current_time = time.time()
+            dst_view.release()
             print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
             print("")
             print("- S2MM info --> Ended TCP send memory process")
@@ -768,7 +686,7 @@ def do_send_socket(data_buffer_array, total_transmitted_bytes, do_write_memory_w
         print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
 
 
-def do_data_acquisition(polling_period, file_name, file_type, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug):
+def do_data_acquisition(polling_period, file_name, file_type, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug, buffers=S2MM_BUFFERS, buffer_size=S2MM_BUFFER_SIZE, file_extent=FILE_EXTENT):
     try:
 
         print(r""" This dog is just for fun. If you feel sad look at him.
@@ -784,14 +702,12 @@ def do_data_acquisition(polling_period, file_name, file_type, max_packet_size, f
 
                 """)
 
-        data_buffer_array       = Array('i', [0, 0, 0, 0])
+        from multiprocessing import Process, Value
 
+        # Filled buffers in publication order, shared memory between the two processes without a manager process
+        packet_ring             = SpscRing(buffers)
 
-        manager = Manager()
-        data_buffer_array_order = manager.list()
-        #data_buffer_array_order = Array('i', [])
-
-        total_transmitted_bytes = Value('i', 0)
+        total_transmitted_bytes = Value('q', 0) # 64-bit, long runs pass 2 GB
         do_write_memory_while   = Value('i', 0)
         do_fill_memory_while    = Value('i', 0)
         stop                    = Value('i', 0)
@@ -799,19 +715,20 @@ def do_data_acquisition(polling_period, file_name, file_type, max_packet_size, f
         do_configure()
 
         if fill_process_type == "standard" :
-            p1 = Process(target=do_fill_memory , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, stop, debug, data_buffer_array_order, ))
+            p1 = Process(target=do_fill_memory , args=(packet_ring, buffer_size, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, stop, debug, ))
             p1.start()
         elif fill_process_type == "buffered" :
-            p1 = Process(target=do_fill_memory_high_speed , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, stop, debug, data_buffer_array_order, ))
+            p1 = Process(target=do_fill_memory_high_speed , args=(packet_ring, buffer_size, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, stop, debug, ))
             p1.start()
         else :
             print("***  ERROR  *** | Please choise 'standard' or 'buffered' options")
 
-        p2 = Process(target=do_write_memory, args=(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, file_name, file_type, stop, debug, data_buffer_array_order, ))
+        p2 = Process(target=do_write_memory, args=(packet_ring, total_transmitted_bytes, do_write_memory_while, polling_period, file_name, file_type, stop, debug, file_extent, ))
         p2.start()
 
         p1.join()
         p2.join()
+        packet_ring.close()
         print("")
         print("")
     except KeyboardInterrupt:
@@ -821,7 +738,7 @@ def do_data_acquisition(polling_period, file_name, file_type, max_packet_size, f
 
 
 
-def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name, file_type, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug):
+def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name, file_type, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug, wait_config):
     try:
 
         print(r""" This giraffe is just for fun. If you feel sad look at its funny eyes.
@@ -845,19 +762,21 @@ def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name,
         data_buffer_array_order = manager.list()
         #data_buffer_array_order = Array('i', [])
         
-        total_transmitted_bytes = Value('i', 0)
+        total_transmitted_bytes = Value('q', 0) # 64-bit, long runs pass 2 GB
         do_write_memory_while   = Value('i', 0)
         do_fill_memory_while    = Value('i', 0)
         stop                    = Value('i', 0)
 
         do_configure()
         '''
+        from multiprocessing import Process, Array, Value, RawArray
+
         BUFFER_SIZE             = 240
         data_buffer_array       = Array('i', BUFFER_SIZE)
         write_index             = Value('i', 0)
         read_index              = Value('i', 0)
         data_buffer_queue       = RawArray('i', BUFFER_SIZE)
-        total_transmitted_bytes = Value('i', 0)
+        total_transmitted_bytes = Value('q', 0) # 64-bit, long runs pass 2 GB
         do_write_memory_while   = Value('i', 0)
         do_fill_memory_while    = Value('i', 0)
 
@@ -874,14 +793,14 @@ def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name,
             print("***  ERROR  *** | Please choise 'standard' or 'buffered' options")
         '''
 
-        p1 = Process(target=do_fill_memory_high_speed_socket , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, data_buffer_queue, BUFFER_SIZE, write_index))
+        p1 = Process(target=do_fill_memory_high_speed_socket , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, data_buffer_queue, BUFFER_SIZE, write_index, wait_config))
         p1.start()
 
         #p2 = Process(target=do_write_memory, args=(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, file_name, file_type, stop, debug, data_buffer_array_order, ))
         p2 = Process(target=do_write_memory_indexing, args=(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, data_buffer_queue, BUFFER_SIZE, write_index, read_index, file_name, ))
         p2.start()
 
-        p3 = Process(target=do_load_fifo_rate_not_verbose, args=(NumberOfEvents, period, packet_size, ))
+        p3 = Process(target=do_load_fifo_rate_not_verbose, args=(NumberOfEvents, period, packet_size, wait_config, ))
         p3.start()
         p3.join()
         do_write_memory_while.value = 1
@@ -898,6 +817,7 @@ def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name,
 
 def start_tcp_server_original(HOST, PORT_TCP):
     """TCP echo server."""
+    import socket
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind((HOST, PORT_TCP))
@@ -910,11 +830,9 @@ def start_tcp_server_original(HOST, PORT_TCP):
                 data = conn.recv(length)
                 conn.sendall(b'ACK')  # Acknowledge receipt
 
-import socket
-import struct
-
 def start_tcp_server(HOST, PORT_TCP, file_path):
     """TCP echo server that saves received data to a file."""
+    import socket
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind((HOST, PORT_TCP))
@@ -944,7 +862,7 @@ def start_tcp_server(HOST, PORT_TCP, file_path):
                 conn.sendall(b'ACK')  # Acknowledge receipt
 
 
-def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug, file_path):
+def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug, file_path, wait_config):
     try:
 
         print(r""" The parrot is just for fun. Be carefull. It was a  pirate...
@@ -962,6 +880,8 @@ def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_pa
  Remember that YOU have to start manually the receiving server before this benchmark!
                 """)
 
+        from multiprocessing import Process, Array, Value, RawArray
+
         BUFFER_SIZE       = 240
         data_buffer_array = Array('i', BUFFER_SIZE)
         write_index       = Value('i', 0)
@@ -972,7 +892,7 @@ def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_pa
         #data_buffer_array_order = manager.list()
         #data_buffer_queue = Queue(maxsize=240)
         
-        total_transmitted_bytes = Value('i', 0)
+        total_transmitted_bytes = Value('q', 0) # 64-bit, long runs pass 2 GB
         do_write_memory_while   = Value('i', 0)
         do_fill_memory_while    = Value('i', 0)
 
@@ -987,7 +907,7 @@ def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_pa
         #p0.start()
 
 
-        p1 = Process(target=do_fill_memory_high_speed_socket , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, data_buffer_queue, BUFFER_SIZE, write_index))
+        p1 = Process(target=do_fill_memory_high_speed_socket , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, data_buffer_queue, BUFFER_SIZE, write_index, wait_config))
         p1.start()
 
         #p2 = Process(target=do_send_socket, args=(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, debug, data_buffer_queue, HOST, PORT_TCP, BUFFER_SIZE, write_index, read_index, ))
@@ -995,7 +915,7 @@ def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_pa
         p2.start()
 
         time.sleep(1)
-        p3 = Process(target=do_load_fifo_rate_not_verbose, args=(NumberOfEvents, period, packet_size, ))
+        p3 = Process(target=do_load_fifo_rate_not_verbose, args=(NumberOfEvents, period, packet_size, wait_config, ))
         p3.start()
         p3.join()
         do_write_memory_while.value = 1
@@ -1017,28 +937,30 @@ def do_configure():
     print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
     print("++                  BEGIN CONFIGURATION PROCEDURE                ++")
     print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
-    dma_s2mm_status(dma_virtual_addr)
-    dma_mm2s_status(dma_virtual_addr)
+    dma_s2mm_status(hw.dma_virtual_addr)
+    dma_mm2s_status(hw.dma_virtual_addr)
     print("Start AXI DMA configuration")
-    write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER      , RESET_DMA)
-    write_dma(dma_virtual_addr, MM2S_CONTROL_REGISTER      , RESET_DMA)
-    dma_s2mm_status(dma_virtual_addr)
-    dma_mm2s_status(dma_virtual_addr)
+    write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER      , RESET_DMA)
+    write_dma(hw.dma_virtual_addr, MM2S_CONTROL_REGISTER      , RESET_DMA)
+    dma_s2mm_status(hw.dma_virtual_addr)
+    dma_mm2s_status(hw.dma_virtual_addr)
     time.sleep(0.1)
-    write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
-    write_dma(dma_virtual_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
-    write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER      , RUN_DMA)
-    write_dma(dma_virtual_addr, MM2S_CONTROL_REGISTER      , RUN_DMA)
-    write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , S2MM_OFFSET)
-    write_dma(dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET)
-    #write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , 4)
-    #write_dma(dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER, 4)
-    dma_s2mm_status(dma_virtual_addr)
-    dma_mm2s_status(dma_virtual_addr)
+    hw.dma_virtual_addr.write_many((
+        (S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ),
+        (MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ),
+        (S2MM_CONTROL_REGISTER      , RUN_DMA),
+        (MM2S_CONTROL_REGISTER      , RUN_DMA),
+        (S2MM_DST_ADDRESS_REGISTER  , S2MM_OFFSET),
+        (MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET),
+    ))
+    #write_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , 4)
+    #write_dma(hw.dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER, 4)
+    dma_s2mm_status(hw.dma_virtual_addr)
+    dma_mm2s_status(hw.dma_virtual_addr)
     print("FIFO STATUS")
-    read_dma_status(gpio_virtual_addr1, 0x8)
-    read_dma_status(gpio_virtual_addr2, 0x0)
-    #read_dma_status(gpio_virtual_addr2, 0x8)
+    read_dma_status(hw.gpio_virtual_addr1, 0x8)
+    read_dma_status(hw.gpio_virtual_addr2, 0x0)
+    #read_dma_status(hw.gpio_virtual_addr2, 0x8)
     print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
     print("++                   END CONFIGURATION PROCEDURE                 ++")
     print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
@@ -1047,57 +969,66 @@ def do_configure():
 
 
 
-def do_read_word(byte):
+def do_read_word(byte, wait_config=DEFAULT_WAIT_CONFIG):
     #print("Source memory block data:      ", end="")
-    #print_mem(virtual_dst_addr, byte)
+    #print_mem(hw.virtual_dst_addr, byte)
 
     #print("Clearing the destination register block...")
-    #virtual_dst_addr.write(bytes([0] * byte))
+    #hw.virtual_dst_addr.write(bytes([0] * byte))
 
     #print("Memory before reading the word:   ", end="")
-    #print_mem(virtual_dst_addr, byte)
+    #print_mem(hw.virtual_dst_addr, byte)
 
+    waiter = make_wait_strategy(wait_config)
     start_time = time.time()
 
-    #dma_s2mm_status(dma_virtual_addr)
-    #write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER      , RESET_DMA     ) # Reset the DMA
+    #dma_s2mm_status(hw.dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER      , RESET_DMA     ) # Reset the DMA
 
-    #dma_s2mm_status(dma_virtual_addr)
-    #write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ) # Enable all interrupts.
+    #dma_s2mm_status(hw.dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ) # Enable all interrupts.
 
-    #dma_s2mm_status(dma_virtual_addr)
-    #write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER      , RUN_DMA       ) # Run DMA
+    #dma_s2mm_status(hw.dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER      , RUN_DMA       ) # Run DMA
 
-    #dma_s2mm_status(dma_virtual_addr)
-    #write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , S2MM_OFFSET   ) # Writing source address of the data from MM2S in DDR...
+    #dma_s2mm_status(hw.dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER  , S2MM_OFFSET   ) # Writing source address of the data from MM2S in DDR...
 
-    #dma_s2mm_status(dma_virtual_addr)
-    #write_dma(dma_virtual_addr, S2MM_STATUS_REGISTER      , CLEAR_IOC_IRQ     )
+    #dma_s2mm_status(hw.dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, S2MM_STATUS_REGISTER      , CLEAR_IOC_IRQ     )
 
-    #dma_s2mm_status(dma_virtual_addr)
-    write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , byte          ) # Writing MM2S transfer length of 4 bytes -> 32 bit -> 1 word
+    #dma_s2mm_status(hw.dma_virtual_addr)
+    write_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER  , byte          ) # Writing MM2S transfer length of 4 bytes -> 32 bit -> 1 word
 
 
     
-    #dma_s2mm_status(dma_virtual_addr)
-    dma_s2mm_sync(dma_virtual_addr)                                         # Waiting for MM2S synchronization...
+    #dma_s2mm_status(hw.dma_virtual_addr)
+    completed = dma_s2mm_sync(hw.dma_virtual_addr, waiter)                     # Waiting for MM2S synchronization...
 
     end_time = time.time()
+    print(waiter.report("S2MM"))
+    if not completed:
+        print(f"***  ERROR  *** | S2MM transfer did not complete within {wait_config[3]} ms")
+        return
 
+    text_sink = HexTextSink("output.txt")
+    bin_sink  = FileSink("output.bin")
     start_time_txt = time.time()
-    save_mem_to_file_hex(virtual_dst_addr, 0, byte, "output.txt")
+    save_mem_to_file_hex(hw.virtual_dst_addr, 0, byte, text_sink)
     end_time_txt = time.time()
 
     start_time_bin = time.time()
-    save_mem_to_file_bin(virtual_dst_addr, 0, byte, "output.bin")
+    save_mem_to_file_bin(hw.virtual_dst_addr, 0, byte, bin_sink)
     end_time_bin = time.time()
+    text_sink.close()
+    bin_sink.close()
 
     print("Memory after reading the word:   ", end="")
-    #print_mem(virtual_dst_addr, byte)
+    #print_mem(hw.virtual_dst_addr, byte)
     print("FIFO STATUS")
-    read_dma_status(gpio_virtual_addr1, 0x8)
-    read_dma_status(gpio_virtual_addr2, 0x0)
-    #read_dma_status(gpio_virtual_addr2, 0x8)
+    read_dma_status(hw.gpio_virtual_addr1, 0x8)
+    read_dma_status(hw.gpio_virtual_addr2, 0x0)
+    #read_dma_status(hw.gpio_virtual_addr2, 0x8)
     print("=============================")
     delta_time = end_time - start_time
     data_throughput = byte/delta_time
@@ -1125,105 +1056,115 @@ def do_ready_to_receive(byte):
     print("*")
 
     #print("-->  Reset the DMA.")
-    #write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER, RESET_DMA)
-    #dma_s2mm_status(dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER, RESET_DMA)
+    #dma_s2mm_status(hw.dma_virtual_addr)
 
     #print("-->  Enable all interrupts.")
-    #write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER, ENABLE_ALL_IRQ)
-    #dma_s2mm_status(dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER, ENABLE_ALL_IRQ)
+    #dma_s2mm_status(hw.dma_virtual_addr)
 
     #print("-->  Writing the destination address for the data from S2MM in DDR...")
-    write_dma(dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER, S2MM_OFFSET)
-    #dma_s2mm_status(dma_virtual_addr)
+    write_dma(hw.dma_virtual_addr, S2MM_DST_ADDRESS_REGISTER, S2MM_OFFSET)
+    #dma_s2mm_status(hw.dma_virtual_addr)
 
     #print("-->  Run the S2MM channel.")
-    #write_dma(dma_virtual_addr, S2MM_CONTROL_REGISTER, RUN_DMA)
-    #dma_s2mm_status(dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, S2MM_CONTROL_REGISTER, RUN_DMA)
+    #dma_s2mm_status(hw.dma_virtual_addr)
     print("***  WAITING FOR A PACKET")
-    while True:
-
-        #print("-->  Clear all the interrupts...")
-        #write_dma(dma_virtual_addr, S2MM_STATUS_REGISTER    , CLEAR_IOC_IRQ  )
-
-        if ((int(read_dma(gpio_virtual_addr2, 0x0)))>10):
-            start_time = time.time()
-            #print(f"-->  Writing S2MM transfer length of {byte} bytes...")
-            write_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER, byte)
-
-            #print("-->  Waiting for S2MM synchronization...")
-            dma_s2mm_sync(dma_virtual_addr)
-            end_time = time.time()
-
-            received_bytes = read_dma(dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
-            print(f"***  Total number of bytes received during transaction {received_bytes} bytes")
-
-
-
-            print("***  Writing to files")
-            #print("***  Destination memory block: ", end="")
-            #print_mem(virtual_dst_addr, byte)
-            start_time_txt = time.time()
-            save_mem_to_file_hex(virtual_dst_addr, 0, received_bytes, "output.txt")
-            end_time_txt = time.time()
-            start_time_bin = time.time()
-            save_mem_to_file_bin(virtual_dst_addr, 0, received_bytes, "output.bin")
-            end_time_bin = time.time()
-            print(f"S2MM Data throughput: {(received_bytes/(end_time - start_time))/1000000} MB/s, {8*(received_bytes/(end_time - start_time))/1000000000} Gb/s")
-            print(f"Time elapsed to write txt file -> {(end_time_txt - start_time_txt)*1000} ms -> {(received_bytes/(end_time_txt - start_time_txt))/1000000} MB/s")
-            print(f"Time elapsed to write bin file -> {(end_time_bin - start_time_bin)*1000} ms -> {(received_bytes/(end_time_bin - start_time_bin))/1000000} MB/s")
-            print("***  DONE")
-            print("=======================================================================")
-            print("***  WAITING FOR A PACKET")
-        else:
-            time.sleep(0.01)
+    text_sink = HexTextSink("output.txt") # both files stay open until the acquisition is stopped
+    bin_sink  = FileSink("output.bin")
+    try:
+        while True:
+
+            #print("-->  Clear all the interrupts...")
+            #write_dma(hw.dma_virtual_addr, S2MM_STATUS_REGISTER    , CLEAR_IOC_IRQ  )
+
+            if ((int(read_dma(hw.gpio_virtual_addr2, 0x0)))>10):
+                start_time = time.time()
+                #print(f"-->  Writing S2MM transfer length of {byte} bytes...")
+                write_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER, byte)
+
+                #print("-->  Waiting for S2MM synchronization...")
+                dma_s2mm_sync(hw.dma_virtual_addr)
+                end_time = time.time()
+
+                received_bytes = read_dma(hw.dma_virtual_addr, S2MM_BUFF_LENGTH_REGISTER)
+                print(f"***  Total number of bytes received during transaction {received_bytes} bytes")
+
+
+
+                print("***  Writing to files")
+                #print("***  Destination memory block: ", end="")
+                #print_mem(hw.virtual_dst_addr, byte)
+                start_time_txt = time.time()
+                save_mem_to_file_hex(hw.virtual_dst_addr, 0, received_bytes, text_sink)
+                end_time_txt = time.time()
+                start_time_bin = time.time()
+                save_mem_to_file_bin(hw.virtual_dst_addr, 0, received_bytes, bin_sink)
+                end_time_bin = time.time()
+                print(f"S2MM Data throughput: {(received_bytes/(end_time - start_time))/1000000} MB/s, {8*(received_bytes/(end_time - start_time))/1000000000} Gb/s")
+                print(f"Time elapsed to write txt file -> {(end_time_txt - start_time_txt)*1000} ms -> {(received_bytes/(end_time_txt - start_time_txt))/1000000} MB/s")
+                print(f"Time elapsed to write bin file -> {(end_time_bin - start_time_bin)*1000} ms -> {(received_bytes/(end_time_bin - start_time_bin))/1000000} MB/s")
+                print("***  DONE")
+                print("=======================================================================")
+                print("***  WAITING FOR A PACKET")
+            else:
+                time.sleep(0.01)
+    finally:
+        text_sink.close()
+        bin_sink.close()
 
 
 
 
-def do_load_fifo(NumberOfBytes):
+def do_load_fifo(NumberOfBytes, wait_config=DEFAULT_WAIT_CONFIG):
     print("=======================================================================")
     print("=     Loading the FIFO memory with a configurable number of bytes     =")
     print("=======================================================================")
 
     #print("-->  Source memory before writing:   ")
-    #print_mem(virtual_src_addr, NumberOfBytes)
+    #print_mem(hw.virtual_src_addr, NumberOfBytes)
 
     for i in range(NumberOfBytes + 1):
-        struct.pack_into('>I', virtual_src_addr, i * 4, i)
+        struct.pack_into('>I', hw.virtual_src_addr, i * 4, i)
 
     print("-->  Source memory after writing:   ")
-    #print_mem(virtual_src_addr, NumberOfBytes)
+    #print_mem(hw.virtual_src_addr, NumberOfBytes)
 
     #print("Status before reset")
-    #dma_mm2s_status(dma_virtual_addr)
-    #write_dma(dma_virtual_addr, MM2S_CONTROL_REGISTER      , RESET_DMA     ) # Reset the DMA
-    #write_dma(dma_virtual_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ) # Enable all interrupts.
+    #dma_mm2s_status(hw.dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, MM2S_CONTROL_REGISTER      , RESET_DMA     ) # Reset the DMA
+    #write_dma(hw.dma_virtual_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ) # Enable all interrupts.
 
     #print("Status after reset and before run")
-    #dma_mm2s_status(dma_virtual_addr)
-    #write_dma(dma_virtual_addr, MM2S_CONTROL_REGISTER      , RUN_DMA       ) # Run DMA
+    #dma_mm2s_status(hw.dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, MM2S_CONTROL_REGISTER      , RUN_DMA       ) # Run DMA
 
     print("-->  Writing the start address for the data from MM2S in DDR...")
-    write_dma(dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET   )
-    dma_mm2s_status(dma_virtual_addr)
+    write_dma(hw.dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET   )
+    dma_mm2s_status(hw.dma_virtual_addr)
     
     #print("-->  Clear all the interrupts...")
-    #write_dma(dma_virtual_addr, MM2S_STATUS_REGISTER      , CLEAR_IOC_IRQ  )
-    #dma_mm2s_status(dma_virtual_addr)
+    #write_dma(hw.dma_virtual_addr, MM2S_STATUS_REGISTER      , CLEAR_IOC_IRQ  )
+    #dma_mm2s_status(hw.dma_virtual_addr)
 
     print(f"-->  Writing S2MM transfer length of {NumberOfBytes} bytes...")
     start_time = time.time()
-    write_dma(dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER, NumberOfBytes ) # Writing MM2S transfer length of 4 bytes -> 32 bit -> 1 word
-    #dma_mm2s_status(dma_virtual_addr)
+    write_dma(hw.dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER, NumberOfBytes ) # Writing MM2S transfer length of 4 bytes -> 32 bit -> 1 word
+    #dma_mm2s_status(hw.dma_virtual_addr)
 
-    dma_mm2s_sync(dma_virtual_addr)                                          # Waiting for MM2S synchronization...
+    waiter = make_wait_strategy(wait_config)
+    completed = dma_mm2s_sync(hw.dma_virtual_addr, waiter)                      # Waiting for MM2S synchronization...
     end_time = time.time()
+    print(waiter.report("MM2S"))
+    if not completed:
+        print(f"***  ERROR  *** | MM2S transfer did not complete within {wait_config[3]} ms")
 
 
     print("---->   FIFO STATUS   <----")
-    read_dma_status(gpio_virtual_addr1, 0x8)
-    read_dma_status(gpio_virtual_addr2, 0x0)
-    #read_dma_status(gpio_virtual_addr2, 0x8)
+    read_dma_status(hw.gpio_virtual_addr1, 0x8)
+    read_dma_status(hw.gpio_virtual_addr2, 0x0)
+    #read_dma_status(hw.gpio_virtual_addr2, 0x8)
 
     print("=============================")
     delta_time = end_time - start_time
@@ -1233,7 +1174,7 @@ def do_load_fifo(NumberOfBytes):
     print(f"Data throughput:   {data_throughput/1000000} MB/s, {8*data_throughput/1000000000} Gb/s")
 
 
-def do_load_fifo_rate(NumberOfRepetitions):
+def do_load_fifo_rate(NumberOfRepetitions, wait_config=DEFAULT_WAIT_CONFIG):
     print("==========================================================")
     print(f"Loading {NumberOfRepetitions} emulated data packets of 50000 bytes each")
     
@@ -1242,15 +1183,19 @@ def do_load_fifo_rate(NumberOfRepetitions):
     print(f"dead time between events is set to {dead_time*1000} ms")
 
     for i in range(NumberOfBytes + 1):
-        struct.pack_into('>I', virtual_src_addr, i * 4, i)
+        struct.pack_into('>I', hw.virtual_src_addr, i * 4, i)
 
+    waiter = make_wait_strategy(wait_config)
     start_time = time.time()
 
     for j in range(NumberOfRepetitions):
         
-        write_dma(dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET   )
-        write_dma(dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER, NumberOfBytes )
-        dma_mm2s_sync(dma_virtual_addr)
+        write_dma(hw.dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET   )
+        write_dma(hw.dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER, NumberOfBytes )
+        if not dma_mm2s_sync(hw.dma_virtual_addr, waiter):
+            print("")
+            print(f"***  ERROR  *** | MM2S transfer {j+1} did not complete within {wait_config[3]} ms")
+            break
         if j < (NumberOfRepetitions - 1):
             print(f"------>     sent {j+1} packets", end='\r')
         else:
@@ -1262,11 +1207,13 @@ def do_load_fifo_rate(NumberOfRepetitions):
     print(f"------>     elapsed time = {end_time - start_time} s")
     print(f"------>     event rate   = {NumberOfRepetitions/(end_time - start_time)} Hz")
     print(f"------>     data rate    = {(50000*NumberOfRepetitions)/(end_time - start_time)/1000000} MB/s")
+    print(waiter.report("MM2S"))
     print("==========================================================")
 
-def do_load_fifo_rate_not_verbose(NumberOfRepetitions, period, PacketSize):
+def do_load_fifo_rate_not_verbose(NumberOfRepetitions, period, PacketSize, wait_config=DEFAULT_WAIT_CONFIG):
 
     dead_time      = period/10000
+    waiter         = make_wait_strategy(wait_config)
 
     print(f"- MM2S info --> Started process | Loading {NumberOfRepetitions} data packets of {PacketSize} bytes each. Dead time is {period/10} ms")
     print("")
@@ -1274,15 +1221,17 @@ def do_load_fifo_rate_not_verbose(NumberOfRepetitions, period, PacketSize):
     #time.sleep(1.0)
 
     for i in range(PacketSize + 1):
-        struct.pack_into('>I', virtual_src_addr, i * 4, i)
+        struct.pack_into('>I', hw.virtual_src_addr, i * 4, i)
 
     start_time = time.time()
 
     for j in range(NumberOfRepetitions):
         
-        write_dma(dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET   )
-        write_dma(dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER, PacketSize )
-        dma_mm2s_sync(dma_virtual_addr)
+        write_dma(hw.dma_virtual_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET   )
+        write_dma(hw.dma_virtual_addr, MM2S_TRNSFR_LENGTH_REGISTER, PacketSize )
+        if not dma_mm2s_sync(hw.dma_virtual_addr, waiter):
+            print(f"- MM2S info --> Transfer {j+1} did not complete within {wait_config[3]} ms, stopping")
+            break
         #if j < (NumberOfRepetitions - 1):
             #print(f"------>     sent {j+1} packets", end='\r')
         #else:
@@ -1293,11 +1242,21 @@ def do_load_fifo_rate_not_verbose(NumberOfRepetitions, period, PacketSize):
 
     print("")
     print(f"- MM2S info --> Elapsed time {end_time - start_time:.2f} s | Event rate {NumberOfRepetitions/(end_time - start_time):.2f} Hz | Data rate {(PacketSize*NumberOfRepetitions)/(end_time - start_time)/1000000:.2f} MB/s")
+    print(waiter.report("MM2S"))
     #print("==========================================================")
 
 
 
 
+def print_startup_timing(command_start, command_end):
+    mapping_time = sum(seconds for name, seconds in hw.timings)
+    print(f"- Startup info --> Module load {(MODULE_LOAD_END - MODULE_LOAD_START)*1000:.2f} ms | Argument parsing {(command_start - MODULE_LOAD_END)*1000:.2f} ms | Command {(command_end - command_start - mapping_time)*1000:.2f} ms | Mappings {mapping_time*1000:.2f} ms")
+    for name, seconds in hw.timings:
+        print(f"- Startup info --> Mapped {name:<24}: {seconds*1000:.3f} ms")
+
+
+MODULE_LOAD_END = time.perf_counter()
+
 def main():
 
     parser = argparse.ArgumentParser(description="Python3 driver For the Eclypse Z7 board. Developed at INFN Turin.")
@@ -1312,11 +1271,18 @@ def main():
     parser.add_argument('--number_of_packets', type=int, default=100, help='Number of packets to be used in the benchmark - default=100')
     parser.add_argument('--polling_period', type=int, default=10, help='Polling period of the S2MM python driver value expressed in hundreds of us - default=10')
     parser.add_argument('--file_name', type=str, default="output_default_file_name.bin", help='Provide filename to be used for benchmark please - default="output_default_file_name.bin"')
-    parser.add_argument('--file_type', type=str, choices=['b', 't'], default='b', help='Select file type, b for binary, t for text. To be noted that text type is extremely slow - default="b"')
+    parser.add_argument('--file_type', type=str, choices=['b', 't', 'm'], default='b', help='Select file type, b for binary, t for text (hex, a space every 4 bytes, a line per buffer), m for binary written through a preallocated memory mapping of the file (--file_extent_mb) - default="b"')
+    parser.add_argument('--file_extent_mb', type=int, default=FILE_EXTENT // (1024*1024), help=f'--file_type m: MB reserved with posix_fallocate and mapped at a time - default={FILE_EXTENT // (1024*1024)}')
     parser.add_argument('--fill_process_type', type=str, choices=['standard', 'buffered'], default='buffered', help='Select fill memory function - default="buffered"')
     parser.add_argument('--timeout_period', type=int, default=1000, help='Timeout time for buffered fill memory dump to file in ms - default=1000')
     parser.add_argument('--data_buffer_limit', type=int, default=2097152, help='Max number of bytes that the driver can buffer in a single transaction - default=2097152 -> 2 MB')
+    parser.add_argument('--buffers', type=int, default=S2MM_BUFFERS, help=f'Number of S2MM buffers used by --acquisition, a power of two - default={S2MM_BUFFERS}')
+    parser.add_argument('--buffer_size', type=int, default=S2MM_BUFFER_SIZE, help=f'Size in bytes of each --acquisition buffer, buffers x buffer_size must fit the {S2MM_REGION_SIZE >> 20} MB S2MM region - default={S2MM_BUFFER_SIZE}')
     parser.add_argument('--debug', action='store_true', help='Enable debug messages')
+    parser.add_argument('--completion_mode', type=str, choices=['spin', 'backoff'], default='spin', help='Wait for DMA completion by spinning on the status register or by spinning then sleeping with exponential backoff - default="spin"')
+    parser.add_argument('--wait_spin_count', type=int, default=1000, help='Status register reads between clock checks, and before the first sleep in backoff mode - default=1000')
+    parser.add_argument('--wait_sleep_max', type=int, default=1000, help='Max backoff sleep in us - default=1000')
+    parser.add_argument('--wait_timeout', type=int, default=0, help='Deadline for a single DMA transfer in ms, 0 waits forever - default=0')
 
     parser.add_argument('--acquisition', action='store_true', help='Start the data taking. Example usage: eclypse_driver.py --acquisition --polling_period 20 --file_name test.bin --file_type b --max_packet_size 65535')
 
@@ -1351,21 +1317,27 @@ def main():
     parser.add_argument('--read_fifo_status_0', action='store_true', help='Perform the other action-> remember to type "--other ok"')
     parser.add_argument('--read_fifo_status_1', action='store_true', help='Perform the other action-> remember to type "--other ok"')
     parser.add_argument('--read_fifo_status_2', action='store_true', help='Perform the other action-> remember to type "--other ok"')
+    parser.add_argument('--timing', action='store_true', help='Print how long module load, argument parsing, each hardware mapping and the command took. Use "python3 -X importtime eclypse_driver.py ..." for the import breakdown')
     args = parser.parse_args()
-
+    command_start = time.perf_counter()
+    wait_config = (args.completion_mode, args.wait_spin_count, args.wait_sleep_max, args.wait_timeout)
+    if args.buffers < 1 or args.buffers & (args.buffers - 1):
+        parser.error("--buffers must be a power of two, the buffer of a ring position must stay the same when its counters wrap")
+    if args.buffer_size < args.max_packet_size or args.buffers*args.buffer_size > S2MM_REGION_SIZE:
+        parser.error(f"--buffers x --buffer_size must fit the S2MM region ({S2MM_REGION_SIZE} bytes) and each buffer must hold --max_packet_size bytes")
 
     if args.led :
         led_config(args.led)
     elif args.benchmark:
-        do_benchmark(args.number_of_packets, args.packet_period, args.packet_size, args.polling_period, args.file_name, args.file_type, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug)
+        do_benchmark(args.number_of_packets, args.packet_period, args.packet_size, args.polling_period, args.file_name, args.file_type, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug, wait_config)
     elif args.benchmark_tcp:
-        do_benchmark_tcp(args.number_of_packets, args.packet_period, args.packet_size, args.polling_period, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug, args.file_name)
+        do_benchmark_tcp(args.number_of_packets, args.packet_period, args.packet_size, args.polling_period, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug, args.file_name, wait_config)
     elif args.acquisition:
-        do_data_acquisition(args.polling_period, args.file_name, args.file_type, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug)
+        do_data_acquisition(args.polling_period, args.file_name, args.file_type, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug, args.buffers, args.buffer_size, args.file_extent_mb*1024*1024)
     elif args.load_fifo_rate:
-        do_load_fifo_rate(args.load_fifo_rate)
+        do_load_fifo_rate(args.load_fifo_rate, wait_config)
     elif args.load_fifo:
-        do_load_fifo(args.load_fifo)
+        do_load_fifo(args.load_fifo, wait_config)
     elif args.mm2s_status:
         do_mm2s_status()
     elif args.s2mm_status:
@@ -1421,18 +1393,16 @@ def main():
     elif args.read_fifo_status_2:
         do_read_fifo_status_2()
     elif args.read_word:
-        do_read_word(args.read_word)
+        do_read_word(args.read_word, wait_config)
     elif args.other :
         debug()
     else :
         print("Please provide an argument or call --help")
 
-    dma_virtual_addr.close()
-    gpio_virtual_addr1.close()
-    gpio_virtual_addr2.close()
-    virtual_src_addr.close()
-    virtual_dst_addr.close()
-    os.close(ddr_memory)
+    command_end = time.perf_counter()
+    if args.timing:
+        print_startup_timing(command_start, command_end)
+    hw.close()
 
 
 if __name__ == "__main__":
@@ -3,6 +3,17 @@
 #include <linux/uaccess.h>
 #include <linux/io.h>
 #include <linux/cdev.h>
+#include <linux/interrupt.h>
+#include <linux/wait.h>
+#include <linux/poll.h>
+#include <linux/slab.h>
+#include <linux/delay.h>
+#include <linux/mm.h>
+#include <linux/platform_device.h>
+#include <linux/dma-mapping.h>
+#include <linux/dma-direct.h>
+
+#include "axi_mem_ioctl.h"
 
 
 MODULE_LICENSE("GPL");
@@ -16,74 +27,586 @@ MODULE_DESCRIPTION("AXI Memory Access Driver");
 #define MEM_BASE_ADDR  0xA0030000  // Base address that
 #define MEM_SIZE       0x0000FFFF   
 
+/* AXI DMA register block, used by the completion interrupts */
+#define DMA_REG_SIZE            0x00010000
+#define MM2S_STATUS_REGISTER    0x04
+#define S2MM_STATUS_REGISTER    0x34
+#define STATUS_ALL_IRQ          0x00007000
+
+/*
+ * mmap regions of the register window (minor 0), selected by the mmap offset.
+ * The top bits of the offset pick the cache policy of the mapping:
+ *   0x00000000 region default, 0x10000000 uncached, 0x20000000 write-combined, 0x30000000 cached.
+ * Register blocks are always mapped uncached. Cached buffer mappings need cache
+ * maintenance around the DMA transfers (AXI_MEM_IOC_INVALIDATE / AXI_MEM_IOC_FLUSH)
+ * and are only allowed on buffers in System RAM, e.g. a reserved-memory carve out.
+ */
+#define AXI_MEM_ALIAS_SHIFT     28
+#define AXI_MEM_OFFSET_MASK     ((1UL << AXI_MEM_ALIAS_SHIFT) - 1)
+
+enum axi_mem_cache {
+    AXI_MEM_UNCACHED,
+    AXI_MEM_WRITECOMBINE,
+    AXI_MEM_CACHED,
+};
+
+struct axi_mem_region {
+    const char *name;
+    unsigned long offset;         // Offset in the /dev/axi_mem mmap space
+    unsigned long size;
+    phys_addr_t phys;
+    bool buffer;                  // DMA buffer: may be mapped write-combined or cached
+    enum axi_mem_cache cache;     // Policy used for the plain (alias 0) offset
+    void __iomem *regs;           // Kernel mapping of a register region, used by the batch ioctl
+};
+
+/* Minor numbers: 0 is the register window, 1 and 2 are the completion event channels */
+#define AXI_MEM_MINOR_REGS      0
+#define AXI_MEM_MINOR_S2MM_IRQ  1
+#define AXI_MEM_MINOR_MM2S_IRQ  2
+
+static unsigned long dma_base_addr = 0xB0000000;
+module_param(dma_base_addr, ulong, 0444);
+MODULE_PARM_DESC(dma_base_addr, "Physical address of the AXI DMA register block");
+
+static unsigned long dma1_base_addr = 0xB0010000;
+module_param(dma1_base_addr, ulong, 0444);
+MODULE_PARM_DESC(dma1_base_addr, "Physical address of the second AXI DMA register block");
+
+static unsigned long s2mm_buf_addr = 0x92000000;
+module_param(s2mm_buf_addr, ulong, 0444);
+MODULE_PARM_DESC(s2mm_buf_addr, "Physical address of the S2MM buffer region");
+
+static unsigned long mm2s_buf_addr = 0x90000000;
+module_param(mm2s_buf_addr, ulong, 0444);
+MODULE_PARM_DESC(mm2s_buf_addr, "Physical address of the MM2S buffer region");
+
+static unsigned long buf_size = 0x02000000;
+module_param(buf_size, ulong, 0444);
+MODULE_PARM_DESC(buf_size, "Size of each buffer region in bytes (default 32 MB)");
+
+static int buf_cache = AXI_MEM_WRITECOMBINE;
+module_param(buf_cache, int, 0444);
+MODULE_PARM_DESC(buf_cache, "Default cache policy of the buffer regions: 0 uncached, 1 write-combined, 2 cached");
+
+static int s2mm_irq = -1;
+module_param(s2mm_irq, int, 0444);
+MODULE_PARM_DESC(s2mm_irq, "Linux IRQ number of the S2MM completion interrupt (see /proc/interrupts), -1 disables it");
+
+static int mm2s_irq = -1;
+module_param(mm2s_irq, int, 0444);
+MODULE_PARM_DESC(mm2s_irq, "Linux IRQ number of the MM2S completion interrupt (see /proc/interrupts), -1 disables it");
+
+struct axi_mem_irq_channel {
+    const char *name;
+    int irq;
+    unsigned int status_register;
+    atomic_t count;               // Completions seen since the module was loaded
+    wait_queue_head_t queue;
+};
+
+/* Per open file state of an event channel */
+struct axi_mem_irq_file {
+    struct axi_mem_irq_channel *channel;
+    unsigned int seen;            // Value of count when the last event was consumed
+};
+
+static struct axi_mem_irq_channel irq_channels[] = {
+    [AXI_MEM_MINOR_S2MM_IRQ] = { .name = "axi_mem_s2mm", .status_register = S2MM_STATUS_REGISTER },
+    [AXI_MEM_MINOR_MM2S_IRQ] = { .name = "axi_mem_mm2s", .status_register = MM2S_STATUS_REGISTER },
+};
+
+enum axi_mem_region_index {
+    AXI_MEM_REGION_GPIO_2,
+    AXI_MEM_REGION_AXIL_0,
+    AXI_MEM_REGION_AXIL_1,
+    AXI_MEM_REGION_S2MM,
+    AXI_MEM_REGION_MM2S,
+};
+
+#define AXI_MEM_BUF_SPAN        0x02000000  // Room for each buffer region in the mmap space
+
+/* Physical addresses and buffer policies are filled in from the module parameters at init */
+static struct axi_mem_region regions[] = {
+    [AXI_MEM_REGION_GPIO_2] = { .name = "gpio_2", .offset = 0x00000000, .size = 0x00010000, .phys = MEM_BASE_ADDR },
+    [AXI_MEM_REGION_AXIL_0] = { .name = "axil_0", .offset = 0x00010000, .size = DMA_REG_SIZE },
+    [AXI_MEM_REGION_AXIL_1] = { .name = "axil_1", .offset = 0x00020000, .size = DMA_REG_SIZE },
+    [AXI_MEM_REGION_S2MM]   = { .name = "s2mm",   .offset = 1 * AXI_MEM_BUF_SPAN, .buffer = true },
+    [AXI_MEM_REGION_MM2S]   = { .name = "mm2s",   .offset = 2 * AXI_MEM_BUF_SPAN, .buffer = true },
+};
 
+static struct platform_device *sync_pdev;  // Device used for the cache maintenance through the DMA API
 static void __iomem *mapped_mem;
+static void __iomem *mapped_dma;
 static int dev_major;
 
+/* Completion interrupt: acknowledge the DMA and wake up the waiters */
+static irqreturn_t axi_mem_irq_handler(int irq, void *dev_id) {
+    struct axi_mem_irq_channel *channel = dev_id;
+    uint32_t status;
+
+    status = ioread32(mapped_dma + channel->status_register);
+    if (!(status & STATUS_ALL_IRQ))
+        return IRQ_NONE;
+
+    iowrite32(status & STATUS_ALL_IRQ, mapped_dma + channel->status_register);  // IRQ bits are write-1-to-clear
+    atomic_inc(&channel->count);
+    wake_up_interruptible(&channel->queue);
+    return IRQ_HANDLED;
+}
+
 /* Open device*/
 static int axi_mem_open(struct inode *inode, struct file *file) {
-    pr_info("AXI meme driver: Device opened\n");
+    unsigned int minor = iminor(inode);
+    struct axi_mem_irq_file *irq_file;
+
+    if (minor == AXI_MEM_MINOR_REGS) {
+        pr_info("AXI meme driver: Device opened\n");
+        return 0;
+    }
+
+    if (minor >= ARRAY_SIZE(irq_channels) || irq_channels[minor].irq < 0)
+        return -ENODEV;
+
+    irq_file = kzalloc(sizeof(*irq_file), GFP_KERNEL);
+    if (!irq_file)
+        return -ENOMEM;
+    irq_file->channel = &irq_channels[minor];
+    irq_file->seen = atomic_read(&irq_file->channel->count);
+    file->private_data = irq_file;
     return 0;
 }
 
-/* Read */
-static ssize_t axi_mem_read(struct file *file, char __user *buf, size_t count, loff_t *ppos) {
+static int axi_mem_release(struct inode *inode, struct file *file) {
+    kfree(file->private_data);
+    return 0;
+}
+
+/* Blocking read on an event channel: returns the completion count once a new completion arrived */
+static ssize_t axi_mem_irq_read(struct file *file, char __user *buf, size_t count) {
+    struct axi_mem_irq_file *irq_file = file->private_data;
+    struct axi_mem_irq_channel *channel = irq_file->channel;
     uint32_t value;
 
-    if (*ppos >= MEM_SIZE) return 0;  // Avoid over-read
-    value = ioread32(mapped_mem + *ppos);  // Read mapped memory
+    if (count < sizeof(value))
+        return -EINVAL;
 
+    if (file->f_flags & O_NONBLOCK) {
+        if (atomic_read(&channel->count) == irq_file->seen)
+            return -EAGAIN;
+    } else if (wait_event_interruptible(channel->queue, atomic_read(&channel->count) != irq_file->seen)) {
+        return -ERESTARTSYS;
+    }
+
+    value = atomic_read(&channel->count);
+    irq_file->seen = value;
     if (copy_to_user(buf, &value, sizeof(value)))
         return -EFAULT;
 
     return sizeof(value);
 }
 
+static __poll_t axi_mem_poll(struct file *file, poll_table *wait) {
+    struct axi_mem_irq_file *irq_file = file->private_data;
+
+    if (!irq_file)
+        return EPOLLIN | EPOLLRDNORM | EPOLLOUT | EPOLLWRNORM;  // The register window never blocks
+
+    poll_wait(file, &irq_file->channel->queue, wait);
+    if (atomic_read(&irq_file->channel->count) != irq_file->seen)
+        return EPOLLIN | EPOLLRDNORM;
+    return 0;
+}
+
+/* Clamp a transfer on the register window to whole 32-bit words */
+static ssize_t axi_mem_window_count(loff_t pos, size_t count) {
+    if ((pos | count) & 3)
+        return -EINVAL;  // Registers are only accessed as aligned words
+    if (pos >= MEM_SIZE)
+        return 0;
+    return min_t(size_t, count, (MEM_SIZE - pos) & ~3UL);
+}
+
+/* Read: copies count bytes of the register window through a small bounce buffer */
+static ssize_t axi_mem_read(struct file *file, char __user *buf, size_t count, loff_t *ppos) {
+    uint32_t bounce[64];
+    ssize_t total;
+    ssize_t done = 0;
+
+    if (file->private_data) return axi_mem_irq_read(file, buf, count);
+    total = axi_mem_window_count(*ppos, count);  // Avoid over-read
+    if (total <= 0)
+        return total;
+
+    while (done < total) {
+        size_t chunk = min_t(size_t, total - done, sizeof(bounce));
+
+        memcpy_fromio(bounce, mapped_mem + *ppos, chunk);  // Read mapped memory
+        if (copy_to_user(buf + done, bounce, chunk))
+            return done ? done : -EFAULT;
+        *ppos += chunk;
+        done += chunk;
+    }
+    return done;
+}
+
 /* Write */
 static ssize_t axi_mem_write(struct file *file, const char __user *buf, size_t count, loff_t *ppos) {
-    uint32_t value;
+    uint32_t bounce[64];
+    ssize_t total;
+    ssize_t done = 0;
+
+    if (file->private_data) return -EINVAL;  // Event channels are read only
+    total = axi_mem_window_count(*ppos, count);  // Over-write check
+    if (total <= 0)
+        return total;
+
+    while (done < total) {
+        size_t chunk = min_t(size_t, total - done, sizeof(bounce));
+
+        if (copy_from_user(bounce, buf + done, chunk))
+            return done ? done : -EFAULT;
+        memcpy_toio(mapped_mem + *ppos, bounce, chunk);  // Write mapped memory
+        *ppos += chunk;
+        done += chunk;
+    }
+    return done;
+}
+
+static const struct axi_mem_region *axi_mem_find_region(unsigned long offset, unsigned long size) {
+    int i;
+
+    for (i = 0; i < ARRAY_SIZE(regions); i++) {
+        if (offset >= regions[i].offset && offset - regions[i].offset + size <= regions[i].size)
+            return &regions[i];
+    }
+    return NULL;
+}
+
+/* mmap: offset selects the region and the cache policy alias, see the region table */
+static int axi_mem_mmap(struct file *file, struct vm_area_struct *vma) {
+    unsigned long offset = vma->vm_pgoff << PAGE_SHIFT;
+    unsigned long size = vma->vm_end - vma->vm_start;
+    unsigned int alias = offset >> AXI_MEM_ALIAS_SHIFT;
+    const struct axi_mem_region *region;
+    enum axi_mem_cache cache;
+
+    if (file->private_data)
+        return -ENODEV;  // Event channels cannot be mapped
+
+    offset &= AXI_MEM_OFFSET_MASK;
+    region = axi_mem_find_region(offset, size);
+    if (!region || alias > AXI_MEM_CACHED + 1)
+        return -EINVAL;
 
-    if (*ppos + sizeof(value) > MEM_SIZE) return 0;  // Over-write check
-    if (copy_from_user(&value, buf, sizeof(value)))
+    cache = alias ? alias - 1 : region->cache;
+    if (!region->buffer && cache != AXI_MEM_UNCACHED)
+        return -EINVAL;  // Register blocks must not be cached or write-combined
+    if (cache == AXI_MEM_CACHED && !pfn_valid(PHYS_PFN(region->phys)))
+        return -EINVAL;  // No cache maintenance possible outside System RAM
+
+    switch (cache) {
+    case AXI_MEM_CACHED:
+        break;
+    case AXI_MEM_WRITECOMBINE:
+        vma->vm_page_prot = pgprot_writecombine(vma->vm_page_prot);
+        break;
+    default:
+        vma->vm_page_prot = pgprot_noncached(vma->vm_page_prot);
+        break;
+    }
+
+    return remap_pfn_range(vma, vma->vm_start, (region->phys + offset - region->offset) >> PAGE_SHIFT, size, vma->vm_page_prot);
+}
+
+/* Cache maintenance of a buffer range for cached mappings */
+static long axi_mem_ioctl_sync(unsigned int cmd, unsigned long arg) {
+    const struct axi_mem_region *region;
+    struct axi_mem_sync sync;
+    dma_addr_t dma_addr;
+
+    if (copy_from_user(&sync, (void __user *)arg, sizeof(sync)))
         return -EFAULT;
 
-    iowrite32(value, mapped_mem + *ppos);  // Write mapped mempry
-    return sizeof(value);
+    if (!sync.length || sync.length > AXI_MEM_BUF_SPAN)
+        return -EINVAL;
+    region = axi_mem_find_region(sync.offset, sync.length);
+    if (!region || !region->buffer || !pfn_valid(PHYS_PFN(region->phys)))
+        return -EINVAL;
+
+    dma_addr = phys_to_dma(&sync_pdev->dev, region->phys + sync.offset - region->offset);
+    if (cmd == AXI_MEM_IOC_INVALIDATE)
+        dma_sync_single_for_cpu(&sync_pdev->dev, dma_addr, sync.length, DMA_FROM_DEVICE);
+    else
+        dma_sync_single_for_device(&sync_pdev->dev, dma_addr, sync.length, DMA_TO_DEVICE);
+    return 0;
+}
+
+static void axi_mem_delay(unsigned int us) {
+    if (us < 20000)
+        usleep_range(us, us + us / 8 + 1);
+    else
+        msleep(DIV_ROUND_UP(us, 1000));
+}
+
+/* Register operations in order, read results are copied back into the user array */
+static long axi_mem_ioctl_batch(unsigned long arg) {
+    struct axi_mem_reg_batch batch;
+    struct axi_mem_reg_op *ops;
+    const struct axi_mem_region **targets;
+    void __user *user_ops;
+    long ret = 0;
+    u32 i;
+
+    if (copy_from_user(&batch, (void __user *)arg, sizeof(batch)))
+        return -EFAULT;
+    if (!batch.count || batch.count > AXI_MEM_BATCH_MAX)
+        return -EINVAL;
+    user_ops = u64_to_user_ptr(batch.ops);
+
+    ops = memdup_user(user_ops, batch.count * sizeof(*ops));
+    if (IS_ERR(ops))
+        return PTR_ERR(ops);
+    targets = kcalloc(batch.count, sizeof(*targets), GFP_KERNEL);
+    if (!targets) {
+        kfree(ops);
+        return -ENOMEM;
+    }
+
+    /* Validate everything first, a rejected batch leaves the hardware untouched */
+    for (i = 0; i < batch.count; i++) {
+        if (ops[i].op == AXI_MEM_OP_DELAY) {
+            if (ops[i].value > AXI_MEM_DELAY_MAX_US)
+                ret = -EINVAL;
+            continue;
+        }
+        if (ops[i].op != AXI_MEM_OP_WRITE && ops[i].op != AXI_MEM_OP_READ)
+            ret = -EINVAL;
+        else if (ops[i].offset & 3)
+            ret = -EINVAL;
+        else if (!(targets[i] = axi_mem_find_region(ops[i].offset, sizeof(u32))) || !targets[i]->regs)
+            ret = -EINVAL;  // Buffers and unmapped regions are not reachable through the batch
+        if (ret)
+            goto out;
+    }
+
+    for (i = 0; i < batch.count; i++) {
+        switch (ops[i].op) {
+        case AXI_MEM_OP_WRITE:
+            iowrite32(ops[i].value, targets[i]->regs + ops[i].offset - targets[i]->offset);
+            break;
+        case AXI_MEM_OP_READ:
+            ops[i].value = ioread32(targets[i]->regs + ops[i].offset - targets[i]->offset);
+            break;
+        default:
+            axi_mem_delay(ops[i].value);
+            break;
+        }
+    }
+
+    if (copy_to_user(user_ops, ops, batch.count * sizeof(*ops)))
+        ret = -EFAULT;
+out:
+    kfree(targets);
+    kfree(ops);
+    return ret;
+}
+
+static long axi_mem_ioctl(struct file *file, unsigned int cmd, unsigned long arg) {
+    if (file->private_data)
+        return -ENOTTY;
+
+    switch (cmd) {
+    case AXI_MEM_IOC_INVALIDATE:
+    case AXI_MEM_IOC_FLUSH:
+        return axi_mem_ioctl_sync(cmd, arg);
+    case AXI_MEM_IOC_REG_BATCH:
+        return axi_mem_ioctl_batch(arg);
+    default:
+        return -ENOTTY;
+    }
+}
+
+static void axi_mem_setup_regions(void) {
+    int i;
+
+    if (buf_cache < AXI_MEM_UNCACHED || buf_cache > AXI_MEM_CACHED) {
+        pr_warn("axi_mem: invalid buf_cache %d, using write-combined\n", buf_cache);
+        buf_cache = AXI_MEM_WRITECOMBINE;
+    }
+    if (buf_size > AXI_MEM_BUF_SPAN) {
+        pr_warn("axi_mem: buf_size 0x%lx does not fit the mmap layout, using 0x%x\n", buf_size, AXI_MEM_BUF_SPAN);
+        buf_size = AXI_MEM_BUF_SPAN;
+    }
+
+    regions[AXI_MEM_REGION_AXIL_0].phys = dma_base_addr;
+    regions[AXI_MEM_REGION_AXIL_1].phys = dma1_base_addr;
+    regions[AXI_MEM_REGION_S2MM].phys   = s2mm_buf_addr;
+    regions[AXI_MEM_REGION_MM2S].phys   = mm2s_buf_addr;
+
+    for (i = 0; i < ARRAY_SIZE(regions); i++) {
+        if (regions[i].buffer) {
+            regions[i].size = buf_size;
+            regions[i].cache = buf_cache;
+        }
+        pr_info("axi_mem region %-6s: offset 0x%08lx -> phys 0x%08llx size 0x%08lx\n",
+                regions[i].name, regions[i].offset, (unsigned long long)regions[i].phys, regions[i].size);
+    }
+}
+
+/* Kernel mappings of the register regions for the batch ioctl */
+static void axi_mem_unmap_registers(void) {
+    int i;
+
+    for (i = 0; i < ARRAY_SIZE(regions); i++) {
+        if (regions[i].regs) {
+            iounmap(regions[i].regs);
+            regions[i].regs = NULL;
+        }
+    }
+}
+
+static int axi_mem_map_registers(void) {
+    int i;
+
+    for (i = 0; i < ARRAY_SIZE(regions); i++) {
+        if (regions[i].buffer)
+            continue;
+        regions[i].regs = ioremap(regions[i].phys, regions[i].size);
+        if (!regions[i].regs) {
+            pr_err("Failed to map the %s registers\n", regions[i].name);
+            axi_mem_unmap_registers();
+            return -ENOMEM;
+        }
+    }
+    return 0;
 }
 
 /* File operations structure */
 static struct file_operations axi_mem_fops = {
     .owner   = THIS_MODULE,
     .open    = axi_mem_open,
+    .release = axi_mem_release,
     .read    = axi_mem_read,
     .write   = axi_mem_write,
+    .poll    = axi_mem_poll,
+    .mmap    = axi_mem_mmap,
+    .unlocked_ioctl = axi_mem_ioctl,
 };
 
+static void axi_mem_free_irqs(void) {
+    int i;
+
+    for (i = AXI_MEM_MINOR_S2MM_IRQ; i < ARRAY_SIZE(irq_channels); i++) {
+        if (irq_channels[i].irq >= 0)
+            free_irq(irq_channels[i].irq, &irq_channels[i]);
+    }
+}
+
+static int axi_mem_request_irqs(void) {
+    int i, ret;
+
+    irq_channels[AXI_MEM_MINOR_S2MM_IRQ].irq = -1;
+    irq_channels[AXI_MEM_MINOR_MM2S_IRQ].irq = -1;
+
+    for (i = AXI_MEM_MINOR_S2MM_IRQ; i < ARRAY_SIZE(irq_channels); i++) {
+        int irq = (i == AXI_MEM_MINOR_S2MM_IRQ) ? s2mm_irq : mm2s_irq;
+
+        atomic_set(&irq_channels[i].count, 0);
+        init_waitqueue_head(&irq_channels[i].queue);
+        if (irq < 0)
+            continue;
+
+        ret = request_irq(irq, axi_mem_irq_handler, 0, irq_channels[i].name, &irq_channels[i]);
+        if (ret) {
+            pr_err("Failed to request IRQ %d for %s\n", irq, irq_channels[i].name);
+            axi_mem_free_irqs();
+            return ret;
+        }
+        irq_channels[i].irq = irq;
+        pr_info("%s completion interrupt on IRQ %d\n", irq_channels[i].name, irq);
+    }
+    return 0;
+}
+
 /* Kernel module init*/
 static int __init axi_mem_init(void) {
+    int ret;
+
+    axi_mem_setup_regions();
+
+    sync_pdev = platform_device_register_simple(DEVICE_NAME, -1, NULL, 0);
+    if (IS_ERR(sync_pdev)) {
+        pr_err("Failed to register the cache maintenance device\n");
+        return PTR_ERR(sync_pdev);
+    }
+    ret = dma_coerce_mask_and_coherent(&sync_pdev->dev, DMA_BIT_MASK(32));
+    if (ret)
+        goto err_pdev;
+
     dev_major = register_chrdev(0, DEVICE_NAME, &axi_mem_fops); // Register device
     if (dev_major < 0) {
         pr_err("Failed to register device\n");
-        return dev_major;
+        ret = dev_major;
+        goto err_pdev;
     }
 
     /* Map physycal memory */
     mapped_mem = ioremap(MEM_BASE_ADDR, MEM_SIZE);
     if (!mapped_mem) {
-        unregister_chrdev(dev_major, DEVICE_NAME);
         pr_err("Failed to map memory\n");
-        return -ENOMEM;
+        ret = -ENOMEM;
+        goto err_chrdev;
+    }
+
+    ret = axi_mem_map_registers();
+    if (ret)
+        goto err_mem;
+
+    /* Map the DMA registers and hook the completion interrupts, if any were given */
+    if (s2mm_irq >= 0 || mm2s_irq >= 0) {
+        mapped_dma = ioremap(dma_base_addr, DMA_REG_SIZE);
+        if (!mapped_dma) {
+            pr_err("Failed to map DMA registers\n");
+            ret = -ENOMEM;
+            goto err_regs;
+        }
+        ret = axi_mem_request_irqs();
+        if (ret)
+            goto err_dma;
+    } else {
+        irq_channels[AXI_MEM_MINOR_S2MM_IRQ].irq = -1;
+        irq_channels[AXI_MEM_MINOR_MM2S_IRQ].irq = -1;
     }
 
     pr_info("axi_mem driver initialized, device major: %d\n", dev_major);
     return 0;
+
+err_dma:
+    iounmap(mapped_dma);
+    mapped_dma = NULL;
+err_regs:
+    axi_mem_unmap_registers();
+err_mem:
+    iounmap(mapped_mem);
+err_chrdev:
+    unregister_chrdev(dev_major, DEVICE_NAME);
+err_pdev:
+    platform_device_unregister(sync_pdev);
+    return ret;
 }
 
 /* Cleanup */
 static void __exit axi_mem_exit(void) {
+    if (mapped_dma) {
+        axi_mem_free_irqs();
+        iounmap(mapped_dma);
+    }
+    axi_mem_unmap_registers();
     if (mapped_mem)
         iounmap(mapped_mem);
     unregister_chrdev(dev_major, DEVICE_NAME);
+    platform_device_unregister(sync_pdev);
     pr_info("axi_mem driver unloaded\n");
 }
 
@@ -0,0 +1,56 @@
+#ifndef AXI_MEM_IOCTL_H
+#define AXI_MEM_IOCTL_H
+
+/* ioctl interface of /dev/axi_mem, shared by the kernel module and its users */
+
+#ifdef __KERNEL__
+#include <linux/types.h>
+#include <linux/ioctl.h>
+#else
+#include <stdint.h>
+#include <sys/ioctl.h>
+typedef uint32_t __u32;
+typedef uint64_t __u64;
+#endif
+
+#define AXI_MEM_IOC_MAGIC       'x'
+
+/* Cache maintenance on a buffer region range, offset in the mmap space without the alias bits */
+struct axi_mem_sync {
+    __u64 offset;
+    __u64 length;
+};
+
+/* Make DMA written data visible to a cached mapping (call after the transfer completed, before reading) */
+#define AXI_MEM_IOC_INVALIDATE  _IOW(AXI_MEM_IOC_MAGIC, 1, struct axi_mem_sync)
+/* Write CPU data back to memory (call after filling a cached buffer, before starting the transfer) */
+#define AXI_MEM_IOC_FLUSH       _IOW(AXI_MEM_IOC_MAGIC, 2, struct axi_mem_sync)
+
+/* Register operation of a batch, offset in the mmap space of a register region (gpio_2, axil_0, axil_1) */
+enum axi_mem_reg_op_type {
+    AXI_MEM_OP_WRITE = 0,         // Write value to offset
+    AXI_MEM_OP_READ  = 1,         // Read offset, the result is returned in value
+    AXI_MEM_OP_DELAY = 2,         // Sleep value us, offset is ignored
+};
+
+struct axi_mem_reg_op {
+    __u32 offset;
+    __u32 value;
+    __u32 op;
+    __u32 reserved;
+};
+
+struct axi_mem_reg_batch {
+    __u64 ops;                    // User pointer to count struct axi_mem_reg_op
+    __u32 count;
+    __u32 reserved;
+};
+
+#define AXI_MEM_BATCH_MAX       256
+#define AXI_MEM_DELAY_MAX_US    1000000
+
+/* Run a sequence of register operations in order in a single kernel entry.
+ * The whole batch is validated before the first operation is executed. */
+#define AXI_MEM_IOC_REG_BATCH   _IOWR(AXI_MEM_IOC_MAGIC, 3, struct axi_mem_reg_batch)
+
+#endif
@@ -12,6 +12,22 @@
 #include <fcntl.h>
 #include <unistd.h>
 #include <stdint.h>
+#include <sys/mman.h>
+
+#define AXI_MEM_DEVICE "/dev/axi_mem"
+
+// Persistent descriptor of /dev/axi_mem for mem_read/mem_write, opened on first use
+static int axi_mem_fd = -1;
+
+static int get_axi_mem_fd(void)
+{
+    if (axi_mem_fd < 0) {
+        axi_mem_fd = open(AXI_MEM_DEVICE, O_RDWR | O_SYNC);
+        if (axi_mem_fd < 0)
+            PyErr_SetFromErrnoWithFilename(PyExc_OSError, AXI_MEM_DEVICE);
+    }
+    return axi_mem_fd;
+}
 
 // /**
 //  * @brief Allocates a block of memory and returns its address.
@@ -60,24 +76,15 @@ static PyObject * mem_write(PyObject *self, PyObject *args)
 
     // PySys_WriteStdout("mem_write: received address as long: %ld\n", address);
     // PySys_WriteStdout("Writing value %i\n", value);
-    int fd = open("/dev/axi_mem", O_RDWR);  
-
-        if (fd < 0) {
-        perror("open");
+    int fd = get_axi_mem_fd();
+    if (fd < 0)
         return NULL;
-    }
 
     off_t offset = address-AXI_base_address;  // Offset di scrittura
 
     // Scrive direttamente all'offset specificato
-    if (pwrite(fd, &value, sizeof(value), offset) != sizeof(value)) {
-        PyErr_SetFromErrno(PyExc_IOError);
-        // perror("pwrite");
-        close(fd);
-
-        Py_RETURN_NONE;
-    }
-    close(fd);
+    if (pwrite(fd, &value, sizeof(value), offset) != sizeof(value))
+        return PyErr_SetFromErrno(PyExc_IOError);
     Py_RETURN_NONE;
 }
 
@@ -97,27 +104,323 @@ static PyObject * mem_read(PyObject *self, PyObject *args)
         return NULL;
 
     off_t offset = address-AXI_base_address;  // Offset di scrittura
-    int fd = open("/dev/axi_mem", O_RDWR);  
+    int fd = get_axi_mem_fd();
+    if (fd < 0)
+        return NULL;
+
+    // Read 32-bit value from memory
+    if (pread(fd, &read_value, sizeof(read_value), offset) != sizeof(read_value))
+        return PyErr_SetFromErrno(PyExc_IOError);
+
+    return PyLong_FromUnsignedLong((uint32_t)read_value);
+}
+
+
+///////////////////////////////////////////////////////////////////////
+/*************************Device object type**************************/
+///////////////////////////////////////////////////////////////////////
+
+/**
+ * @brief Register window kept open and mapped for the lifetime of the object.
+ *
+ * Offsets are byte offsets inside the window, like the python RegisterBank.
+ * read_many/write_many do the whole sequence in one call and release the GIL
+ * while the registers are accessed. busy counts the calls in that section, the
+ * window cannot be unmapped (close, __exit__, __init__ again) until it is 0.
+ */
+typedef struct {
+    PyObject_HEAD
+    int fd;
+    volatile uint32_t *regs;
+    size_t length;
+    int busy; // changed with the GIL held
+} DeviceObject;
+
+static int device_check_open(DeviceObject *self)
+{
+    if (self->regs == NULL) {
+        PyErr_SetString(PyExc_ValueError, "I/O operation on a closed device");
+        return -1;
+    }
+    return 0;
+}
+
+static int device_check_offset(DeviceObject *self, unsigned long offset)
+{
+    if ((offset & 3) || self->length < sizeof(uint32_t) || offset > self->length - sizeof(uint32_t)) {
+        PyErr_Format(PyExc_ValueError, "Register offset %lu is not an aligned word inside the %zu byte window", offset, self->length);
+        return -1;
+    }
+    return 0;
+}
 
-    // Open file
-        if (fd < 0) {
-        perror("open");
+static int device_check_idle(DeviceObject *self)
+{
+    if (self->busy) {
+        PyErr_SetString(PyExc_RuntimeError, "Device is in use by read_many/write_many in another thread");
+        return -1;
+    }
+    return 0;
+}
+
+static void device_release(DeviceObject *self)
+{
+    if (self->regs != NULL) {
+        munmap((void *)self->regs, self->length);
+        self->regs = NULL;
+    }
+    if (self->fd >= 0) {
+        close(self->fd);
+        self->fd = -1;
+    }
+}
+
+/**
+ * @brief Device(path="/dev/axi_mem", offset=0, length=0x10000): open and map a register window.
+ *
+ * offset is the mmap offset of the region in the device, e.g. 0x10000 for the first AXI DMA.
+ */
+static int Device_init(DeviceObject *self, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"path", "offset", "length", NULL};
+    const char *path = AXI_MEM_DEVICE;
+    unsigned long offset = 0;
+    Py_ssize_t length = 0x10000;
+    void *regs;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|skn", kwlist, &path, &offset, &length))
+        return -1;
+    if (length < (Py_ssize_t)sizeof(uint32_t)) {
+        PyErr_SetString(PyExc_ValueError, "length must hold at least one register");
+        return -1;
+    }
+    if (device_check_idle(self) < 0)
+        return -1;
+
+    device_release(self);
+    self->fd = open(path, O_RDWR | O_SYNC);
+    if (self->fd < 0) {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+        return -1;
+    }
+    regs = mmap(NULL, length, PROT_READ | PROT_WRITE, MAP_SHARED, self->fd, offset);
+    if (regs == MAP_FAILED) {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+        device_release(self);
+        return -1;
+    }
+    self->regs = regs;
+    self->length = length & ~(size_t)3;
+    return 0;
+}
+
+static PyObject * Device_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    DeviceObject *self = (DeviceObject *)type->tp_alloc(type, 0);
+
+    if (self != NULL) {
+        self->fd = -1;
+        self->regs = NULL;
+        self->length = 0;
+        self->busy = 0;
+    }
+    return (PyObject *)self;
+}
+
+static void Device_dealloc(DeviceObject *self)
+{
+    // Never busy here: a read_many/write_many call holds a reference to the object
+    device_release(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject * Device_read(DeviceObject *self, PyObject *args)
+{
+    unsigned long offset;
+
+    if (!PyArg_ParseTuple(args, "k", &offset))
+        return NULL;
+    if (device_check_open(self) < 0 || device_check_offset(self, offset) < 0)
+        return NULL;
+    return PyLong_FromUnsignedLong(self->regs[offset >> 2]);
+}
+
+static PyObject * Device_write(DeviceObject *self, PyObject *args)
+{
+    unsigned long offset;
+    uint32_t value;
+
+    if (!PyArg_ParseTuple(args, "kI", &offset, &value))
+        return NULL;
+    if (device_check_open(self) < 0 || device_check_offset(self, offset) < 0)
+        return NULL;
+    self->regs[offset >> 2] = value;
+    Py_RETURN_NONE;
+}
+
+/**
+ * @brief read_many(offsets) -> list of the values, read in order.
+ */
+static PyObject * Device_read_many(DeviceObject *self, PyObject *args)
+{
+    PyObject *offsets, *seq, *result = NULL;
+    volatile uint32_t *regs;
+    uint32_t *index = NULL;
+    Py_ssize_t count, i;
+
+    if (!PyArg_ParseTuple(args, "O", &offsets))
+        return NULL;
+    seq = PySequence_Fast(offsets, "read_many expects a sequence of offsets");
+    if (seq == NULL)
+        return NULL;
+    if (device_check_open(self) < 0) {
+        Py_DECREF(seq);
         return NULL;
     }
-    // Read 32-bit value from memory
+    // Busy from here on: converting the offsets may run python code, and the GIL is released below
+    regs = self->regs;
+    self->busy++;
+
+    count = PySequence_Fast_GET_SIZE(seq);
+    index = PyMem_New(uint32_t, count ? count : 1);
+    if (index == NULL) {
+        PyErr_NoMemory();
+        goto out;
+    }
+    for (i = 0; i < count; i++) {
+        unsigned long offset = PyLong_AsUnsignedLong(PySequence_Fast_GET_ITEM(seq, i));
+        if (PyErr_Occurred() || device_check_offset(self, offset) < 0)
+            goto out;
+        index[i] = offset >> 2;
+    }
+
+    // The values overwrite the indexes in place, no python object is touched meanwhile
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < count; i++)
+        index[i] = regs[index[i]];
+    Py_END_ALLOW_THREADS
+
+    result = PyList_New(count);
+    if (result == NULL)
+        goto out;
+    for (i = 0; i < count; i++) {
+        PyObject *value = PyLong_FromUnsignedLong(index[i]);
+        if (value == NULL) {
+            Py_CLEAR(result);
+            goto out;
+        }
+        PyList_SET_ITEM(result, i, value);
+    }
+out:
+    self->busy--;
+    PyMem_Free(index);
+    Py_DECREF(seq);
+    return result;
+}
 
-    if (pread(fd, &read_value, sizeof(read_value), offset) != sizeof(read_value)) {
-        // perror("pread");
-        PyErr_SetFromErrno(PyExc_IOError);
-        close(fd);
-        Py_RETURN_NONE;
+/**
+ * @brief write_many(pairs): write a sequence of (offset, value) pairs in order.
+ */
+static PyObject * Device_write_many(DeviceObject *self, PyObject *args)
+{
+    PyObject *pairs, *seq;
+    volatile uint32_t *regs;
+    uint32_t *words = NULL;
+    Py_ssize_t count, i;
 
+    if (!PyArg_ParseTuple(args, "O", &pairs))
+        return NULL;
+    seq = PySequence_Fast(pairs, "write_many expects a sequence of (offset, value) pairs");
+    if (seq == NULL)
+        return NULL;
+    if (device_check_open(self) < 0) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+    regs = self->regs;
+    self->busy++;
+
+    count = PySequence_Fast_GET_SIZE(seq);
+    words = PyMem_New(uint32_t, 2 * (count ? count : 1));
+    if (words == NULL) {
+        PyErr_NoMemory();
+        goto error;
     }
-    close(fd);
+    for (i = 0; i < count; i++) {
+        unsigned long offset;
+        unsigned int value;
+
+        if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(seq, i), "kI", &offset, &value))
+            goto error;
+        if (device_check_offset(self, offset) < 0)
+            goto error;
+        words[2 * i] = offset >> 2;
+        words[2 * i + 1] = value;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < count; i++)
+        regs[words[2 * i]] = words[2 * i + 1];
+    Py_END_ALLOW_THREADS
+
+    self->busy--;
+    PyMem_Free(words);
+    Py_DECREF(seq);
+    Py_RETURN_NONE;
+error:
+    self->busy--;
+    PyMem_Free(words);
+    Py_DECREF(seq);
+    return NULL;
+}
+
+static PyObject * Device_close(DeviceObject *self, PyObject *Py_UNUSED(ignored))
+{
+    if (device_check_idle(self) < 0)
+        return NULL;
+    device_release(self);
+    Py_RETURN_NONE;
+}
+
+static PyObject * Device_enter(DeviceObject *self, PyObject *Py_UNUSED(ignored))
+{
+    if (device_check_open(self) < 0)
+        return NULL;
+    Py_INCREF(self);
+    return (PyObject *)self;
+}
 
-    return PyLong_FromUnsignedLong(read_value);
+static PyObject * Device_exit(DeviceObject *self, PyObject *args)
+{
+    if (device_check_idle(self) < 0)
+        return NULL;
+    device_release(self);
+    Py_RETURN_FALSE;
 }
 
+static PyMethodDef Device_methods[] = {
+    {"read", (PyCFunction)Device_read, METH_VARARGS, "Read the 32-bit register at a byte offset."},
+    {"write", (PyCFunction)Device_write, METH_VARARGS, "Write a 32-bit register at a byte offset."},
+    {"read_many", (PyCFunction)Device_read_many, METH_VARARGS, "Read a sequence of offsets in order, the GIL is released during the access."},
+    {"write_many", (PyCFunction)Device_write_many, METH_VARARGS, "Write a sequence of (offset, value) pairs in order, the GIL is released during the access."},
+    {"close", (PyCFunction)Device_close, METH_NOARGS, "Unmap the window and close the device, raises RuntimeError while another thread is in read_many/write_many."},
+    {"__enter__", (PyCFunction)Device_enter, METH_NOARGS, NULL},
+    {"__exit__", (PyCFunction)Device_exit, METH_VARARGS, NULL},
+    {NULL, NULL, 0, NULL} /* Sentinel */
+};
+
+static PyTypeObject DeviceType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "SOC_driver.Device",
+    .tp_doc = "Device(path='/dev/axi_mem', offset=0, length=0x10000): persistent mmap'ed register window",
+    .tp_basicsize = sizeof(DeviceObject),
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = Device_new,
+    .tp_init = (initproc)Device_init,
+    .tp_dealloc = (destructor)Device_dealloc,
+    .tp_methods = Device_methods,
+};
+
 // /**
 //  * @brief Frees a previously allocated memory block.
 //  * 
@@ -347,6 +650,18 @@ static struct PyModuleDef SOC_driver = {
  */
 PyMODINIT_FUNC PyInit_SOC_driver(void)
 {
-    Py_Initialize();
-    return PyModule_Create(&SOC_driver);
+    PyObject *module;
+
+    if (PyType_Ready(&DeviceType) < 0)
+        return NULL;
+    module = PyModule_Create(&SOC_driver);
+    if (module == NULL)
+        return NULL;
+    Py_INCREF(&DeviceType);
+    if (PyModule_AddObject(module, "Device", (PyObject *)&DeviceType) < 0) {
+        Py_DECREF(&DeviceType);
+        Py_DECREF(module);
+        return NULL;
+    }
+    return module;
 }
@@ -6,6 +6,8 @@ import time
 HOST      = '0.0.0.0'
 PORT_TCP  = 5001
 file_path = "Please_work.bin"
+DMA_CHANNELS = 1 # must match --dma_channels of the driver, with more than one the header is (channel, length)
+HEADER = struct.Struct("!I") if DMA_CHANNELS == 1 else struct.Struct("!BI")
 
 total = 0
 receive_length = 0
@@ -13,6 +15,7 @@ calculated_length = 0
 transmit_packet = 0
 counter = 0
 counter_bytes = 0
+channel_bytes = [0] * DMA_CHANNELS
 
 """TCP echo server that saves received data to a file."""
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
@@ -27,12 +30,16 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
         print("Connected")
         while True:
             start_cycle_time     = time.time()  ################
-            length_data = conn.recv(4)
+            length_data = conn.recv(HEADER.size, socket.MSG_WAITALL)
             received_length_time = time.time()  ################
             if not length_data:
                 break  # Connection closed
             
-            length = struct.unpack("!I", length_data)[0]
+            if DMA_CHANNELS == 1:
+                channel = 0
+                length = HEADER.unpack(length_data)[0]
+            else:
+                channel, length = HEADER.unpack(length_data)
             calculated_length_time    = time.time()  ################
             data = b""
             while len(data) < length:
@@ -50,6 +57,7 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
             transmit_packet += end_packet_time-calculated_length_time
             counter += 1
             counter_bytes += length
+            channel_bytes[channel] += length
 
             #print(f"Received up to now: {len(data)}")
             #print(f"Transfer speed    : {8*len(data)/(end - start)/1e6} Mbps")
@@ -65,3 +73,6 @@ print(f"receive_length    : {(receive_length/counter)*1000:.3f} ms | {100*(recei
 print(f"calculated_length : {(calculated_length/counter)*1000:.3f} ms | {100*(calculated_length/total):.2f} %")
 print(f"transmit_packet   : {(transmit_packet/counter)*1000:.3f} ms | {100*(transmit_packet/total):.2f} % | {counter_bytes/transmit_packet/1e6:.3f} MBps")
 print(f"total             : {(total/counter)*1000:.3f} ms | {100*(total/total):.2f} % | {counter_bytes/total/1e6:.3f} MBps")
+if DMA_CHANNELS > 1:
+    for channel in range(DMA_CHANNELS):
+        print(f"channel {channel}         : {channel_bytes[channel]} bytes")
@@ -0,0 +1,96 @@
+import io
+import os
+import sys
+import zlib
+import random
+import subprocess
+
+import pytest
+
+import dma_utils
+from dma_utils import CompressionPool, compress_block, decompress_blocks, COMPRESSED_HEADER, COMPRESSION_CODECS
+
+
+def sample(length, seed=0):
+    # ADC like words: compressible, but not trivially
+    generator = random.Random(seed)
+    return bytes(generator.getrandbits(4) for i in range(length))
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_compress_block_round_trip(codec):
+    data = sample(10000)
+    frame, cpu_time = compress_block(codec, 1, data)
+    codec_index, raw_length, length = COMPRESSED_HEADER.unpack_from(frame)
+    assert COMPRESSION_CODECS[codec_index] == codec
+    assert raw_length == len(data) and length == len(frame) - COMPRESSED_HEADER.size
+    assert list(decompress_blocks(io.BytesIO(frame))) == [data]
+
+
+def test_decompress_does_not_guess_the_codec():
+    # A raw deflate payload does not start with 0x78, the codec byte decides anyway
+    data = sample(5000)
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 9)
+    payload = compressor.compress(data) + compressor.flush()
+    frame = COMPRESSED_HEADER.pack(COMPRESSION_CODECS.index('zlib'), len(data), len(payload)) + payload
+    assert list(decompress_blocks(io.BytesIO(frame))) == [data]
+
+
+def test_decompress_rejects_unknown_codec_and_bad_length():
+    payload = zlib.compress(b"abc")
+    with pytest.raises(ValueError):
+        list(decompress_blocks(io.BytesIO(COMPRESSED_HEADER.pack(7, 3, len(payload)) + payload)))
+    with pytest.raises(ValueError):
+        list(decompress_blocks(io.BytesIO(COMPRESSED_HEADER.pack(COMPRESSION_CODECS.index('zlib'), 4, len(payload)) + payload)))
+
+
+@pytest.mark.parametrize("codec, pool", [("zlib", "thread"), ("lzma", "thread"), ("zlib", "process")])
+def test_pool_keeps_the_order_of_every_channel(codec, pool):
+    compressor = CompressionPool(codec, 1, 2, pool, block_size=4096, channels=2)
+    written = [bytearray(), bytearray()]
+    frames  = [[], []]
+    for i in range(40):
+        channel = i % 2
+        buffers = [sample(700, i), os.urandom(50)]
+        compressor.write(channel, buffers)
+        for buffer in buffers:
+            written[channel] += buffer
+        for ready_channel, frame in compressor.ready():
+            frames[ready_channel].append(frame)
+    for ready_channel, frame in compressor.drain():
+        frames[ready_channel].append(frame)
+    compressor.close()
+    for channel in range(2):
+        assert b"".join(decompress_blocks(io.BytesIO(b"".join(frames[channel])))) == written[channel]
+    assert compressor.blocks == len(frames[0]) + len(frames[1])
+
+
+def test_pool_bounds_the_blocks_in_flight():
+    compressor = CompressionPool('zlib', 1, 1, 'thread', block_size=1024)
+    for i in range(20):
+        compressor.write(0, [sample(1024, i)])
+        for frame in compressor.ready():
+            pass
+        assert len(compressor.in_flight) <= 2
+    compressor.close()
+
+
+def test_pool_rejects_unknown_codec():
+    with pytest.raises(ValueError):
+        CompressionPool('none')
+
+
+def test_codecs_are_imported_on_first_use():
+    check = "import sys, dma_utils; print(sorted({'zlib', 'lzma'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", check], cwd=os.path.dirname(dma_utils.__file__), capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_unavailable_codec_is_rejected(monkeypatch):
+    frame, cpu_time = compress_block('lzma', 0, sample(100))
+    monkeypatch.setattr(dma_utils, "CODEC_MODULES", {})
+    monkeypatch.setitem(sys.modules, "lzma", None) # as on a Python built without liblzma
+    with pytest.raises(ValueError):
+        CompressionPool('lzma')
+    with pytest.raises(ValueError):
+        list(decompress_blocks(io.BytesIO(frame)))
@@ -0,0 +1,67 @@
+import os
+import mmap
+
+import pytest
+
+from dma_utils import FileSink, StagedFileSink, MappedFileSink, IOV_MAX
+
+
+def test_file_sink_appends_every_buffer_in_order(tmp_path):
+    path = tmp_path / "out.bin"
+    path.write_bytes(b"old")
+    buffers = [bytes([i % 256]) * (i % 7) for i in range(IOV_MAX + 10)] # more buffers than one writev takes
+    sink = FileSink(str(path))
+    sink.write(buffers)
+    sink.write([memoryview(b"tail")])
+    sink.close()
+    assert path.read_bytes() == b"old" + b"".join(buffers) + b"tail"
+    assert sink.calls >= 2
+
+
+@pytest.mark.parametrize("fsync", ["none", "periodic", "bytes"])
+def test_staged_file_sink_keeps_the_order(tmp_path, fsync):
+    path = tmp_path / "out.bin"
+    buffers = [os.urandom(n) for n in range(1, 300, 7)]
+    sink = StagedFileSink(str(path), buffer_size=256, buffers=2, fsync=fsync, fsync_interval=0.01, fsync_bytes=1000)
+    for first in range(0, len(buffers), 5):
+        sink.write(buffers[first : first + 5])
+        sink.flush()
+    sink.close()
+    assert path.read_bytes() == b"".join(buffers)
+    if fsync != "none":
+        assert sink.syncs >= 1
+
+
+def test_staged_file_sink_rejects_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        StagedFileSink(str(tmp_path / "out.bin"), fsync='always')
+
+
+def test_staged_file_sink_propagates_write_errors(tmp_path):
+    sink = StagedFileSink(str(tmp_path / "out.bin"), buffer_size=1024, buffers=2)
+    # Every write of the background thread now fails with ENOSPC
+    os.close(sink.sink.fd)
+    sink.sink.fd = os.open("/dev/full", os.O_WRONLY)
+    sink.write([b"a" * 1024])
+    sink.flush()
+    with pytest.raises(OSError):
+        for i in range(10): # the error surfaces at the next hand off once the thread hit it
+            sink.write([b"b" * 1024])
+            sink.thread.join(0.05)
+    fd = sink.sink.fd
+    with pytest.raises(OSError):
+        sink.close()
+    assert not sink.thread.is_alive()
+    with pytest.raises(OSError):
+        os.fstat(fd) # closed despite the error
+
+
+def test_mapped_file_sink_across_extents(tmp_path):
+    path = tmp_path / "out.bin"
+    path.write_bytes(b"kept")
+    buffers = [os.urandom(3000) for i in range(10)]
+    sink = MappedFileSink(str(path), extent=2*mmap.ALLOCATIONGRANULARITY) # 30000 bytes cross several extents
+    for buffer in buffers:
+        sink.write([buffer])
+    sink.close()
+    assert path.read_bytes() == b"kept" + b"".join(buffers)
@@ -0,0 +1,68 @@
+import socket
+import threading
+
+from dma_utils import (LENGTH_HEADER, FRAMED_FLAG, FRAMED_ALIGN, framed_descriptor, framed_count, framed_packets,
+                       framed_records, framed_data_offset, send_gathered, SPOOL_FLAG)
+
+
+def aggregate(view, base, packets):
+    # Layout of do_fill_memory_high_speed_socket: every packet aligned, its length header right before it
+    batch_bytes = 0
+    for packet in packets:
+        offset = base + framed_data_offset(batch_bytes)
+        view[offset : offset + len(packet)] = packet
+        LENGTH_HEADER.pack_into(view, offset - LENGTH_HEADER.size, len(packet))
+        batch_bytes = offset + len(packet) - base
+    return framed_descriptor(base, len(packets)), batch_bytes
+
+
+def received(sock, chunks):
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+        chunks.append(data)
+
+
+def test_descriptor_flags_do_not_overlap():
+    offset = framed_descriptor(0x00FF0040, 1234)
+    assert offset & FRAMED_FLAG and not offset & SPOOL_FLAG
+    assert framed_count(offset) == 1234
+
+
+def test_packets_start_on_aligned_offsets():
+    memory = bytearray(1 << 16)
+    view = memoryview(memory)
+    packets = [bytes([i]) * length for i, length in enumerate((1, 59, 60, 61, 64, 0, 200, 3))]
+    offset, span = aggregate(view, 128, packets)
+    starts = []
+    position = 128
+    for packet in packets:
+        position = framed_data_offset(position)
+        starts.append(position)
+        position += len(packet)
+    assert all(start % FRAMED_ALIGN == 0 for start in starts)
+    assert [bytes(data) for data in framed_packets(view, offset)] == packets
+    assert span == position - 128
+
+
+def test_records_are_the_single_channel_stream():
+    memory = bytearray(1 << 16)
+    view = memoryview(memory)
+    packets = [bytes([i]) * (i*37 % 300) for i in range(30)]
+    offset, span = aggregate(view, 0, packets)
+    assert b"".join(framed_records(view, offset)) == b"".join(LENGTH_HEADER.pack(len(packet)) + packet for packet in packets)
+
+
+def test_send_gathered_resumes_partial_writes():
+    sender, receiver = socket.socketpair()
+    sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    chunks = []
+    reader = threading.Thread(target=received, args=(receiver, chunks))
+    reader.start()
+    buffers = [bytes([i % 256]) * (i*101 % 5000) for i in range(2000)]
+    send_gathered(sender, buffers)
+    sender.close()
+    reader.join()
+    receiver.close()
+    assert b"".join(chunks) == b"".join(buffers)
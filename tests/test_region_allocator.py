@@ -0,0 +1,67 @@
+import pytest
+
+from dma_utils import RegionAllocator
+
+
+def test_transfers_are_packed_and_aligned():
+    allocator = RegionAllocator(4096, 256, 64)
+    offsets = []
+    for length in (10, 64, 65, 200):
+        offsets.append(allocator.reserve())
+        allocator.commit(length)
+    assert offsets == [0, 64, 128, 256]
+    assert allocator.used() == 512
+
+
+def test_rejects_transfers_that_do_not_fit_twice():
+    with pytest.raises(ValueError):
+        RegionAllocator(1024, 600)
+
+
+def test_wraps_once_the_oldest_buffers_are_reclaimed():
+    allocator = RegionAllocator(1024, 256, 64)
+    for i in range(4):
+        assert allocator.reserve() == i*256
+        allocator.commit(256)
+    assert allocator.reserve() is None
+    assert allocator.full == 1
+    allocator.reclaim(1)
+    assert allocator.reserve() == 0
+    assert allocator.wraps == 1
+    allocator.commit(100)
+    assert allocator.reserve() is None # 128 bytes left before the oldest buffer at 256
+    allocator.reclaim(1)
+    assert allocator.reserve() == 128
+
+
+def test_no_wrap_while_the_oldest_buffer_is_at_the_start():
+    allocator = RegionAllocator(1024, 256, 64)
+    for i in range(3):
+        allocator.reserve()
+        allocator.commit(256)
+    allocator.reserve()
+    allocator.commit(200) # 64 bytes left at the end, too few for a max_transfer
+    assert allocator.reserve() is None
+    allocator.reclaim(1)
+    assert allocator.reserve() == 0
+
+
+def test_empty_region_starts_again_from_zero():
+    allocator = RegionAllocator(1024, 256, 64)
+    for i in range(3):
+        allocator.reserve()
+        allocator.commit(100)
+    allocator.reclaim(3)
+    assert allocator.used() == 0
+    assert allocator.reserve() == 0
+
+
+def test_mark_keeps_reclaim_counts_in_step():
+    allocator = RegionAllocator(1024, 256, 64)
+    allocator.reserve()
+    allocator.commit(256)
+    allocator.mark() # spool descriptor queued without a buffer
+    allocator.reserve()
+    allocator.commit(256)
+    allocator.reclaim(2)
+    assert allocator.entries[0][0] == 256
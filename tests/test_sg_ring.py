@@ -0,0 +1,71 @@
+import pytest
+
+from dma_utils import RegisterBank, SgRing, SgStandInDevice, SG_DESCRIPTOR_SIZE, SG_STATUS, S2MM_TAILDESC_REGISTER
+
+SLOT_SIZE   = 256
+MEMORY_PHYS = 0x02000000
+
+
+def make_ring(n_slots, buffer_length=None):
+    desc_offset = n_slots*SLOT_SIZE
+    memory = bytearray(desc_offset + n_slots*SG_DESCRIPTOR_SIZE)
+    regs   = RegisterBank(bytearray(0x100))
+    ring   = SgRing(RegisterBank(memory, desc_offset, n_slots*SG_DESCRIPTOR_SIZE), MEMORY_PHYS + desc_offset, MEMORY_PHYS, SLOT_SIZE, n_slots, buffer_length)
+    ring.build()
+    ring.start(regs)
+    return ring, SgStandInDevice(regs, memory, MEMORY_PHYS), memory, regs
+
+
+def test_harvest_returns_completed_descriptors_in_order():
+    ring, device, memory, regs = make_ring(8)
+    packets = [bytes([i]) * (10 + i) for i in range(5)]
+    for packet in packets:
+        assert device.push(packet)
+    completed = ring.harvest()
+    assert [(slot, length) for slot, length, status in completed] == [(i, 10 + i) for i in range(5)]
+    for slot, length, status in completed:
+        assert memory[slot*SLOT_SIZE : slot*SLOT_SIZE + length] == packets[slot]
+    assert ring.harvest() == []
+    assert ring.outstanding == 5
+
+
+def test_stand_in_stops_at_taildesc_until_recycle():
+    ring, device, memory, regs = make_ring(4)
+    for i in range(4):
+        assert device.push(b'x' * 16)
+    assert not device.push(b'y' * 16) # every descriptor is complete, the engine idles at the tail
+    assert len(ring.harvest()) == 4
+    assert not device.push(b'y' * 16) # harvested but not given back yet
+    ring.recycle(2)
+    assert regs[S2MM_TAILDESC_REGISTER] == ring.descriptor_phys(1)
+    assert device.push(b'y' * 16)
+    assert device.push(b'z' * 16)
+    assert not device.push(b'w' * 16)
+    assert [slot for slot, length, status in ring.harvest()] == [0, 1]
+
+
+def test_recycle_clears_status_and_wraps():
+    ring, device, memory, regs = make_ring(4)
+    received = []
+    for i in range(10):
+        assert device.push(bytes([i]) * 8)
+        for slot, length, status in ring.harvest():
+            received.append(memory[slot*SLOT_SIZE])
+            ring.recycle(1)
+            assert ring.desc_bank[slot*SG_DESCRIPTOR_SIZE + SG_STATUS] == 0
+    assert received == list(range(10))
+    assert ring.outstanding == 0
+
+
+def test_recycle_more_than_outstanding_raises():
+    ring, device, memory, regs = make_ring(4)
+    device.push(b'a')
+    ring.harvest()
+    with pytest.raises(ValueError):
+        ring.recycle(2)
+
+
+def test_buffer_length_truncates_packets():
+    ring, device, memory, regs = make_ring(4, buffer_length=32)
+    device.push(b'a' * 100)
+    assert [length for slot, length, status in ring.harvest()] == [32]
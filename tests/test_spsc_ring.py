@@ -0,0 +1,112 @@
+import pytest
+
+from dma_utils import SpscRing, SPSC_WRAP
+
+
+@pytest.fixture
+def ring():
+    rings = []
+    def make(n_slots, consumers=1):
+        rings.append(SpscRing(n_slots, consumers=consumers))
+        return rings[-1]
+    yield make
+    for made in rings:
+        made.close()
+
+
+def move_counters(ring, position):
+    # Start every cursor at position, as after that many descriptors went through
+    ring.words[ring.head_word] = position
+    for tail_word in ring.tail_words:
+        ring.words[tail_word] = position
+    ring.write_position = position
+    ring.read_position  = position
+
+
+@pytest.mark.parametrize("n_slots", [0, 3, 240, 1000])
+def test_rejects_slot_counts_that_are_not_powers_of_two(n_slots):
+    with pytest.raises(ValueError):
+        SpscRing(n_slots)
+
+
+def test_push_peek_release_in_order(ring):
+    ring = ring(8)
+    for i in range(8):
+        assert ring.push(i*100, i)
+    assert not ring.push(800, 8)
+    assert ring.free() == 0
+    descriptors = ring.peek(3)
+    assert [(offset, length) for offset, length, sequence, timestamp in descriptors] == [(0, 0), (100, 1), (200, 2)]
+    ring.release(3)
+    assert ring.free() == 3
+    assert ring.consumed() == 3
+    assert [offset for offset, length, sequence, timestamp in ring.peek()] == [300, 400, 500, 600, 700]
+
+
+def test_put_is_invisible_until_publish(ring):
+    ring = ring(4)
+    ring.put(1, 1)
+    ring.put(2, 2)
+    assert ring.peek() == []
+    ring.publish()
+    assert len(ring.peek()) == 2
+
+
+def test_counters_wrap_at_two_to_the_32(ring):
+    ring = ring(256)
+    move_counters(ring, SPSC_WRAP - 100)
+    received = []
+    for i in range(1000):
+        assert ring.push(i, i % 64)
+        if i % 7 == 6:
+            descriptors = ring.peek()
+            received += [offset for offset, length, sequence, timestamp in descriptors]
+            ring.release(len(descriptors))
+    received += [offset for offset, length, sequence, timestamp in ring.peek()]
+    assert received == list(range(1000))
+    assert ring.write_position == (SPSC_WRAP - 100 + 1000) % SPSC_WRAP
+
+
+def test_full_ring_across_the_wrap(ring):
+    ring = ring(16)
+    move_counters(ring, SPSC_WRAP - 5)
+    for i in range(16):
+        assert ring.push(i, 1)
+    assert not ring.push(16, 1)
+    assert [offset for offset, length, sequence, timestamp in ring.peek()] == list(range(16))
+
+
+def test_every_consumer_sees_every_descriptor(ring):
+    ring = ring(8, consumers=3)
+    for i in range(5):
+        ring.push(i, 1)
+    for consumer in range(3):
+        ring.attach(consumer)
+        assert [offset for offset, length, sequence, timestamp in ring.peek()] == list(range(5))
+
+
+def test_slot_is_reused_only_after_every_consumer_released_it(ring):
+    ring = ring(4, consumers=2)
+    for i in range(4):
+        assert ring.push(i, 1)
+    ring.attach(0).release(4)
+    assert ring.free() == 0 # consumer 1 still holds all of them
+    assert not ring.push(4, 1)
+    assert ring.lag(0) == 0 and ring.lag(1) == 4
+    ring.attach(1).release(1)
+    assert ring.consumed() == 1
+    assert ring.push(4, 1)
+    assert not ring.push(5, 1)
+    assert ring.pending() == 4
+    assert [offset for offset, length, sequence, timestamp in ring.attach(0).peek()] == [4]
+    assert [offset for offset, length, sequence, timestamp in ring.attach(1).peek()] == [1, 2, 3, 4]
+
+
+def test_attach_of_a_shared_ring_by_name(ring):
+    owner = ring(8)
+    owner.push(42, 7)
+    other = SpscRing(8, name=owner.shm.name)
+    try:
+        assert [(offset, length) for offset, length, sequence, timestamp in other.peek()] == [(42, 7)]
+    finally:
+        other.close()
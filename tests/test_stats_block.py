@@ -0,0 +1,44 @@
+from dma_utils import StatsBlock, STATS_FIELDS
+
+
+def test_publish_read_and_total():
+    stats = StatsBlock(("fill", "consumer 0"))
+    try:
+        stats.publish(0, *range(1, len(STATS_FIELDS) + 1))
+        stats.publish(1, *([2**40] * len(STATS_FIELDS)))
+        assert stats.read(0) == dict(zip(STATS_FIELDS, range(1, len(STATS_FIELDS) + 1)))
+        assert stats.total(STATS_FIELDS[0]) == 1 + 2**40
+        assert stats.total(STATS_FIELDS[0], ["consumer 0"]) == 2**40
+        attached = StatsBlock(stats.writers, name=stats.shm.name)
+        assert attached.read(1) == stats.read(1)
+        attached.close()
+    finally:
+        stats.close()
+
+
+def test_writer_stopped_inside_publish_is_stale():
+    stats = StatsBlock(("fill",))
+    try:
+        stats.publish(0, *([7] * len(STATS_FIELDS)))
+        assert stats.read(0)[STATS_FIELDS[0]] == 7
+        stats.words[0] += 1 # killed between the two sequence stores
+        stats.words[1] = 99
+        assert stats.read(0)[STATS_FIELDS[0]] == 7
+        assert 0 in stats.stale
+        assert "stale" in stats.report("S2MM")
+        stats.words[0] += 1
+        assert stats.read(0)[STATS_FIELDS[0]] == 99
+        assert 0 not in stats.stale
+    finally:
+        stats.close()
+
+
+def test_stale_before_any_snapshot_reads_zeros():
+    stats = StatsBlock(("fill",))
+    try:
+        stats.words[0] = 1
+        assert stats.read(0) == dict.fromkeys(STATS_FIELDS, 0)
+        assert 0 in stats.stale
+    finally:
+        stats.words[0] = 0
+        stats.close()
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from dma_utils import HexTextSink, hex_line, convert_to_text, LENGTH_HEADER
+
+
+def legacy_hex_line(data):
+    # save_mem_to_file_hex before hex_line: two digits per byte, a space after every 4 bytes
+    text = ""
+    for i in range(len(data)):
+        text += f"{data[i]:02X}"
+        if i % 4 == 3:
+            text += " "
+    return text + "\n"
+
+
+@pytest.mark.parametrize("length", [0, 1, 3, 4, 5, 8, 13, 64, 1001])
+def test_hex_line_matches_the_legacy_format(length):
+    data = os.urandom(length)
+    assert hex_line(data) == legacy_hex_line(data)
+    assert hex_line(memoryview(data)) == legacy_hex_line(data)
+
+
+def test_hex_text_sink_writes_one_line_per_buffer(tmp_path):
+    path = tmp_path / "out.txt"
+    packets = [os.urandom(n) for n in (4, 7, 100)]
+    sink = HexTextSink(str(path), chunk_size=16)
+    sink.write(packets[:2])
+    sink.write(packets[2:])
+    sink.close()
+    assert path.read_text() == "".join(legacy_hex_line(packet) for packet in packets)
+    assert sink.lines == 3
+
+
+def test_convert_to_text_framed_and_raw(tmp_path):
+    packets = [os.urandom(n) for n in (12, 0, 33)]
+    framed = tmp_path / "framed.bin"
+    framed.write_bytes(b"".join(LENGTH_HEADER.pack(len(packet)) + packet for packet in packets))
+    assert convert_to_text(str(framed), str(tmp_path / "framed.txt"), framed=True) == (45, 3)
+    assert (tmp_path / "framed.txt").read_text() == "".join(legacy_hex_line(packet) for packet in packets)
+
+    raw = tmp_path / "raw.bin"
+    raw.write_bytes(b"".join(packets))
+    assert convert_to_text(str(raw), str(tmp_path / "raw.txt"), line_bytes=16) == (45, 3)
+    data = b"".join(packets)
+    assert (tmp_path / "raw.txt").read_text() == "".join(legacy_hex_line(data[start : start + 16]) for start in range(0, 45, 16))
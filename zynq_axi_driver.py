@@ -1,14 +1,19 @@
+import time
+
+MODULE_LOAD_START = time.perf_counter() # before the other imports, --timing includes them
+
 import os
 import mmap
 import struct
+import copy
 import argparse
-import time
-import socket
 
 #from multiprocessing import Process, Array, Value, Manager, Queue
 #from queue import Empty
 
-from multiprocessing import Process, Array, Value, RawArray
+# multiprocessing and socket are imported by the commands that need them, they dominate the startup time of a status read
+
+from dma_utils import RegisterBank, RegisterBatch, HardwareMap, CacheSync, WaitStrategy, WAIT_MODES, SgRing, SG_DESCRIPTOR_SIZE, SG_STATUS_ERRORS, LENGTH_HEADER, send_framed, CompressionPool, COMPRESSION_CODECS, FileSink, HexTextSink, convert_to_text, StagedFileSink, MappedFileSink, FSYNC_POLICIES, SpscRing, SPSC_WRAP, RegionAllocator, Doorbell, NOTIFY_MODES, SpillSpool, BACKPRESSURE_POLICIES, SPOOL_FLAG, FRAMED_FLAG, framed_descriptor, framed_count, framed_packets, framed_records, framed_data_offset, FRAMED_ALIGN, send_gathered, JitterStats, StatsBlock, apply_scheduling
 
 # Register Offsets
 MM2S_CONTROL_REGISTER       = 0x00
@@ -32,9 +37,13 @@ AXI_DMA_1_ALMOST_EMPTY_FLAG = 1<<2
 # Status Codes
 STATUS_HALTED           = 0x00000001
 STATUS_IDLE             = 0x00000002
+STATUS_SG_INCLDED       = 0x00000008
 STATUS_DMA_INTERNAL_ERR = 0x00000010
 STATUS_DMA_SLAVE_ERR    = 0x00000020
 STATUS_DMA_DECODE_ERR   = 0x00000040
+STATUS_SG_INTERNAL_ERR  = 0x00000100
+STATUS_SG_SLAVE_ERR     = 0x00000200
+STATUS_SG_DECODE_ERR    = 0x00000400
 STATUS_IOC_IRQ          = 0x00001000
 STATUS_DELAY_IRQ        = 0x00002000
 STATUS_ERR_IRQ          = 0x00004000
@@ -56,38 +65,247 @@ ENABLE_ALL_IRQ   = 0x00007000
 # MM2S_OFFSET  = 0x0e000000
 # S2MM_OFFSET  = 0x0f000000
 
-'''
-MM2S_OFFSET_0  = 0x0090000000
-S2MM_OFFSET_0  = 0x0092000000
-GPIO_2_OFFSET  = 0x00A0030000
-AXIL_0_OFFSET  = 0x00B0000000
-#AXIL_1_OFFSET  = 0x00B0010000
-'''
+# Physical addresses, as programmed into the DMA address registers and descriptors
+MM2S_PHYS_0    = 0x0090000000
+S2MM_PHYS_0    = 0x0092000000
+#GPIO_2_PHYS   = 0x00A0030000
+#AXIL_0_PHYS   = 0x00B0000000
+#AXIL_1_PHYS   = 0x00B0010000
 
-#MM2S_OFFSET_0  = 0x00000000
-#S2MM_OFFSET_0  = 0x02000000
+# mmap offsets of /dev/axi_mem, see the region table of kernel_module/axi_mem_driver.c
 GPIO_2_OFFSET  = 0x00000000
-#AXIL_0_OFFSET  = 0x20000000
+AXIL_0_OFFSET  = 0x00010000
+AXIL_1_OFFSET  = 0x00020000 # second engine, --dma_channels 2
+S2MM_OFFSET_0  = 0x02000000
+MM2S_OFFSET_0  = 0x04000000
+
+# Added to a buffer offset to override the module default cache policy (buf_cache parameter); registers are always uncached
+MAP_ALIAS_UNCACHED     = 0x10000000
+MAP_ALIAS_WRITECOMBINE = 0x20000000
+MAP_ALIAS_CACHED       = 0x30000000
+BUFFER_CACHE_ALIASES   = {'default': 0, 'uncached': MAP_ALIAS_UNCACHED, 'wc': MAP_ALIAS_WRITECOMBINE, 'cached': MAP_ALIAS_CACHED}
+
+# Completion event channels of the axi_mem kernel module (--completion_mode irq)
+IRQ_S2MM_DEVICE      = "/dev/axi_mem_s2mm"
+IRQ_MM2S_DEVICE      = "/dev/axi_mem_mm2s"
+FILL_WAIT_TIMEOUT_MS = 100 # without --wait_timeout the fill process still checks its stop flag this often
+NOTIFY_WAIT_TIMEOUT_MS = 100 # --notify event: longest sleep of the writer/sender on empty rings, also bounds a missed kick
+
+# Multi engine acquisition (--dma_channels): each engine fills its own 16 MB slice of the S2MM region
+MAX_DMA_CHANNELS       = 2
+S2MM_CHANNEL_STRIDE    = 16*1024*1024
+DMA_ALMOST_EMPTY_FLAGS = (AXI_DMA_0_ALMOST_EMPTY_FLAG, AXI_DMA_1_ALMOST_EMPTY_FLAG)
+CHANNEL_HEADER         = struct.Struct("!BI") # TCP header (channel, length) when more than one engine is streaming
+
+# Scatter-gather mode (--s2mm_mode sg): one descriptor per 64 KB slot, ring right after the slots in the S2MM region
+SG_SLOT_SIZE         = 64*1024
+SG_SLOTS             = 240
+
+# Simple mode: transfers are packed one after the other in the channel slice of the S2MM region (RegionAllocator)
+S2MM_ALLOC_ALIGN     = 64    # cache line, keeps the destination aligned for the DMA and for the cache maintenance
+S2MM_MIN_PACKET      = 1024  # the descriptor ring has room for a full slice of packets this small
+STATS_PUBLISH_INTERVAL = 0.1 # seconds between two copies of the local counters of a stage to the stats block
+SPILL_RESUME_OCCUPANCY = 0.5 # --backpressure spill: back to the ring once the writer freed half of the slice
+
+# Consumers of the packet rings (--outputs): every one sees every packet, a buffer is reused once all of them released it
+OUTPUTS          = ('file', 'tcp', 'monitor')
+#TCP_HOST        = '127.0.0.1'
+TCP_HOST         = '192.168.2.1'
+TCP_PORT         = 5001
+MONITOR_INTERVAL = 1.0 # seconds between two lines of the live monitor
+
+# --pipeline: fill, writer/sender and load stages as processes, or as threads sharing the mappings and the rings
+PIPELINE_MODES = ('process', 'thread')
+# Stages that --cpu_affinity/--rt_priority/--nice apply to; writer covers every --outputs consumer
+PIPELINE_STAGES = ('fill', 'writer', 'load')
+
+# (completion mode, spins before sleeping, max backoff sleep in us, timeout in ms - 0 for none)
+DEFAULT_WAIT_CONFIG  = ('spin', 1000, 1000, 0)
+
+# --compression: (codec, level - -1 for the codec default, pool workers, pool type, block size in bytes)
+COMPRESSION_POOLS          = ('thread', 'process')
+DEFAULT_COMPRESSION_CONFIG = ('none', -1, 2, 'thread', 1024*1024)
+
+# --disk_writer: the writer writes the ring slots itself, or copies them into staging buffers written by a background thread
+DISK_WRITERS = ('direct', 'async')
+# (disk writer, staging buffer size, staging buffers, fsync policy, fsync interval in s, fsync bytes, --file_type m extent in bytes)
+DEFAULT_SINK_CONFIG  = ('direct', 4*1024*1024, 2, 'none', 1.0, 64*1024*1024, 256*1024*1024)
+
+# Regions of /dev/axi_mem: (offset, length, RegisterBank). Buffers use the module default policy (write-combined). Each one is mapped the first time a command touches it (hw.<name>).
+# Control regions are accessed through RegisterBank (see dma_utils) instead of seek/read/write on the mmap
+hw = HardwareMap("/dev/axi_mem", {
+    'axi_MM2S_0_virtual_addr' : (MM2S_OFFSET_0, 33554432, False), # 32 MB
+    'axi_S2MM_0_virtual_addr' : (S2MM_OFFSET_0, 33554432, False), # 32 MB
+    'axi_S2MM_0_desc_addr'    : (S2MM_OFFSET_0 | MAP_ALIAS_UNCACHED, 33554432, False), # uncached view for the SG descriptors
+    'axi_gpio_2_ctrl_addr'    : (GPIO_2_OFFSET, 65536   , True ), # 64 KB
+    'axi_dma_0_ctrl_addr'     : (AXIL_0_OFFSET, 65536   , True ), # 64 KB
+    'axi_dma_1_ctrl_addr'     : (AXIL_1_OFFSET, 65536   , True ), # 64 KB
+})
+
+# Set by --buffer_cache cached: buffers are mapped cacheable and every DMA transfer is paired with a cache maintenance ioctl
+buffer_sync = None
+
+
+DMA_CTRL_REGIONS = ('axi_dma_0_ctrl_addr', 'axi_dma_1_ctrl_addr')
+
+def fill_reservation(max_packet_size, data_buffer_limit):
+    # Largest region a simple mode fill process asks the allocator for, a whole batch when it aggregates:
+    # the batch is still open below data_buffer_limit, the last packet starts after its header and alignment
+    if data_buffer_limit <= 0:
+        return max_packet_size
+    return data_buffer_limit + LENGTH_HEADER.size + FRAMED_ALIGN + max_packet_size
+
+
+def make_packet_ring(s2mm_mode, consumers=1):
+    # Power of two, so the slot of a position stays the same when the 32-bit counters wrap
+    if s2mm_mode == 'sg':
+        return SpscRing(1 << (SG_SLOTS - 1).bit_length(), consumers=consumers) # room for every SG descriptor, in the order of the SG ring
+    return SpscRing(1 << (S2MM_CHANNEL_STRIDE // S2MM_MIN_PACKET - 1).bit_length(), consumers=consumers)
+
+def pipeline_worker(pipeline):
+    if pipeline == 'thread':
+        import threading
+        return threading.Thread # file writes, socket sends and sleeps release the GIL
+    from multiprocessing import Process
+    return Process
+
+def run_stage(scheduling, stage, target, *args):
+    # Applied in the stage's own process/thread, affinity and priorities are per thread on Linux
+    if scheduling:
+        settings = scheduling.get(stage, {})
+        applied = apply_scheduling(settings.get('cpus'), settings.get('fifo_priority'), settings.get('nice'), scheduling.get('mlock', False))
+        if applied:
+            print(f"- Pipeline info --> Stage {stage} | {' | '.join(applied)}")
+    target(*args)
+
+def stage_worker(Worker, scheduling, stage, target, args):
+    return Worker(target=run_stage, args=(scheduling, stage, target) + tuple(args))
+
+def stage_copy(shared):
+    # Own cursors/fds state for a stage: a forked process gets a copy anyway, a thread needs one (attach() changes the object)
+    return None if shared is None else copy.copy(shared)
+
+def make_stats(dma_channels, outputs):
+    # One line per fill process (writer index = channel), then one per consumer (writer index = dma_channels + consumer)
+    return StatsBlock([f"fill {channel}" for channel in range(dma_channels)] + [f"{output} {consumer}" for consumer, output in enumerate(outputs)])
+
+def transmitted_bytes(stats, dma_channels):
+    return stats.total('bytes', range(dma_channels))
+
+def make_file_sink(path, sink_config, file_type='b'):
+    disk_writer, buffer_size, buffers, fsync, fsync_interval, fsync_bytes, extent = sink_config
+    if file_type == 'm':
+        return MappedFileSink(path, extent)
+    if file_type == 't':
+        return HexTextSink(path)
+    if disk_writer == 'async':
+        return StagedFileSink(path, buffer_size, buffers, fsync, fsync_interval, fsync_bytes)
+    return FileSink(path)
+
+def make_compression_pool(compression_config, channels):
+    codec, level, workers, pool, block_size = compression_config
+    if codec == 'none':
+        return None
+    return CompressionPool(codec, level, workers, pool, block_size, channels)
+
+def stream_parts(descriptors, channel, dma_channels, s2mm_view, spools):
+    # TCP stream of a batch of descriptors as header/payload buffers, for the compression stage
+    parts   = []
+    packets = 0
+    payload = 0
+    for offset, length, sequence, timestamp in descriptors:
+        if offset & SPOOL_FLAG:
+            packet_data = spools[channel].replay(offset)
+        elif offset & FRAMED_FLAG:
+            packet_data = framed_packets(s2mm_view, offset)
+        else:
+            packet_data = (s2mm_view[offset : offset + length],)
+        for data in packet_data:
+            parts.append(LENGTH_HEADER.pack(len(data)) if dma_channels == 1 else CHANNEL_HEADER.pack(channel, len(data)))
+            parts.append(data)
+            packets += 1
+            payload += len(data)
+        if offset & SPOOL_FLAG:
+            spools[channel].caught_up(timestamp)
+    return parts, packets, payload
+
+def make_consumer_processes(outputs, packet_rings, stats, do_write_memory_while, polling_period, file_name, debug, doorbell, spools, pipeline='process', scheduling=None, sink_config=DEFAULT_SINK_CONFIG, file_type='b', compression_config=DEFAULT_COMPRESSION_CONFIG):
+    Worker = pipeline_worker(pipeline)
+    processes = []
+    for consumer, output in enumerate(outputs):
+        rings       = [stage_copy(packet_ring) for packet_ring in packet_rings]
+        bell        = stage_copy(doorbell)
+        stage_spools = [stage_copy(spool) for spool in spools]
+        if output == 'file':
+            processes.append(stage_worker(Worker, scheduling, 'writer', do_write_memory_indexing, (rings, stats, do_write_memory_while, polling_period, file_name, bell, stage_spools, consumer, sink_config, file_type, compression_config, )))
+        elif output == 'tcp':
+            processes.append(stage_worker(Worker, scheduling, 'writer', do_send_socket_no_print, (rings, stats, do_write_memory_while, polling_period, debug, TCP_HOST, TCP_PORT, bell, stage_spools, consumer, compression_config, )))
+        else:
+            processes.append(stage_worker(Worker, scheduling, 'writer', do_monitor_rings, (rings, stats, do_write_memory_while, polling_period, outputs, bell, consumer, )))
+    return processes
+
+def print_pipeline_report(pipeline, cpu_start, start_time, transferred_bytes):
+    # Children are waited for, so their CPU time is in os.times() for the process mode as well
+    cpu_end  = os.times()
+    cpu_time = sum(cpu_end[:4]) - sum(cpu_start[:4])
+    elapsed  = time.perf_counter() - start_time
+    cpu_per_gb = cpu_time / (transferred_bytes / 1e9) if transferred_bytes else 0
+    print(f"- Pipeline info --> Mode: {pipeline} | Elapsed time {elapsed:.2f} s | CPU time {cpu_time:.2f} s ({100*cpu_time/elapsed:.0f} % of one core) | {cpu_per_gb:.2f} CPU-s/GB")
+
+def attach_consumer(packet_rings, doorbell, consumer):
+    for packet_ring in packet_rings:
+        packet_ring.attach(consumer)
+    if doorbell is not None:
+        doorbell.attach(consumer)
+
+def print_lag_report(label, consumer, max_lag):
+    print(f"- {label} info --> Consumer {consumer} | MAX lag {max_lag} descriptors")
+
+def wait_for_packets(packet_rings, doorbell, polling_period):
+    # Called by the writer/sender when every ring is empty
+    if doorbell is None:
+        time.sleep(polling_period/10000)
+    else:
+        doorbell.wait(lambda: any(packet_ring.available() for packet_ring in packet_rings), NOTIFY_WAIT_TIMEOUT_MS)
 
-ddr_memory = os.open("/dev/axi_mem", os.O_RDWR | os.O_SYNC)
+def print_latency_report(label, notify, latency_sum, latency_max, packets, cpu_time, written_bytes):
+    cpu_per_gb = cpu_time / (written_bytes / 1e9) if written_bytes else 0
+    print(f"- {label} info --> Notify: {notify} | AVG publish to write latency {latency_sum/packets*1e6 if packets else 0:.1f} us | MAX {latency_max*1e6:.1f} us | CPU time {cpu_time:.2f} s | {cpu_per_gb:.2f} CPU-s/GB")
 
+def dma_channel_ctrl(channel):
+    return getattr(hw, DMA_CTRL_REGIONS[channel])
 
-#axi_MM2S_0_virtual_addr = mmap.mmap(ddr_memory, 33554432, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=MM2S_OFFSET_0) # 32 MB
-#axi_S2MM_0_virtual_addr = mmap.mmap(ddr_memory, 33554432, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=S2MM_OFFSET_0) # 32 MB
-axi_gpio_2_ctrl_addr = mmap.mmap(ddr_memory, 65536, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=GPIO_2_OFFSET) # 64 KB
-#axi_dma_0_ctrl_addr  = mmap.mmap(ddr_memory, 65536, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=AXIL_0_OFFSET) # 64 KB
+def channel_file_name(file_name, channel, dma_channels):
+    if dma_channels == 1:
+        return file_name
+    root, extension = os.path.splitext(file_name)
+    return f"{root}_ch{channel}{extension}"
 
-#axi_dma_1_ctrl_addr  = mmap.mmap(ddr_memory, 65536, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=AXIL_1_OFFSET) # 64 KB
+def set_buffer_cache(buffer_cache):
+    """Select the cache policy of the buffer mappings, before they are first touched."""
+    global buffer_sync
+    alias = BUFFER_CACHE_ALIASES[buffer_cache]
+    for name, offset in (('axi_S2MM_0_virtual_addr', S2MM_OFFSET_0), ('axi_MM2S_0_virtual_addr', MM2S_OFFSET_0)):
+        hw.regions[name] = (offset | alias,) + hw.regions[name][1:]
+    buffer_sync = CacheSync(hw) if buffer_cache == 'cached' else None
 
+def invalidate_s2mm(offset, length):
+    if buffer_sync is not None and length:
+        buffer_sync.invalidate(S2MM_OFFSET_0 + offset, length)
+
+def flush_s2mm(offset, length):
+    if buffer_sync is not None and length:
+        buffer_sync.flush(S2MM_OFFSET_0 + offset, length)
+
+def flush_mm2s(offset, length):
+    if buffer_sync is not None and length:
+        buffer_sync.flush(MM2S_OFFSET_0 + offset, length)
 
 def write_dma(virtual_addr, offset, value):
-    virtual_addr.seek(offset)
-    virtual_addr.write((value).to_bytes(4, byteorder='little'))
+    virtual_addr[offset] = value
 
 def read_dma(virtual_addr, offset):
-    virtual_addr.seek(offset)
-    data = virtual_addr.read(4)
-    return int.from_bytes(data, byteorder='little')
+    return virtual_addr[offset]
 
 def read_dma_status(virtual_addr, offset):
     status = read_dma(virtual_addr, offset)
@@ -102,12 +320,20 @@ def dma_s2mm_status(virtual_addr):
         print(" Running.")
     if status & STATUS_IDLE:
         print(" Idle.")
+    if status & STATUS_SG_INCLDED:
+        print(" SG is included.")
     if status & STATUS_DMA_INTERNAL_ERR:
         print(" DMA internal error.")
     if status & STATUS_DMA_SLAVE_ERR:
         print(" DMA slave error.")
     if status & STATUS_DMA_DECODE_ERR:
         print(" DMA decode error.")
+    if status & STATUS_SG_INTERNAL_ERR:
+        print(" SG internal error.")
+    if status & STATUS_SG_SLAVE_ERR:
+        print(" SG slave error.")
+    if status & STATUS_SG_DECODE_ERR:
+        print(" SG decode error.")
     if status & STATUS_IOC_IRQ:
         print(" IOC interrupt occurred.")
     if status & STATUS_DELAY_IRQ:
@@ -124,12 +350,20 @@ def dma_mm2s_status(virtual_addr):
         print(" Running.")
     if status & STATUS_IDLE:
         print(" Idle.")
+    if status & STATUS_SG_INCLDED:
+        print(" SG is included.")
     if status & STATUS_DMA_INTERNAL_ERR:
         print(" DMA internal error.")
     if status & STATUS_DMA_SLAVE_ERR:
         print(" DMA slave error.")
     if status & STATUS_DMA_DECODE_ERR:
         print(" DMA decode error.")
+    if status & STATUS_SG_INTERNAL_ERR:
+        print(" SG internal error.")
+    if status & STATUS_SG_SLAVE_ERR:
+        print(" SG slave error.")
+    if status & STATUS_SG_DECODE_ERR:
+        print(" SG decode error.")
     if status & STATUS_IOC_IRQ:
         print(" IOC interrupt occurred.")
     if status & STATUS_DELAY_IRQ:
@@ -137,17 +371,29 @@ def dma_mm2s_status(virtual_addr):
     if status & STATUS_ERR_IRQ:
         print(" Error interrupt occurred.")
 
-def dma_mm2s_sync(virtual_addr):
+def dma_mm2s_sync(virtual_addr, waiter=None):
+    if waiter is not None:
+        return waiter.wait(virtual_addr, MM2S_STATUS_REGISTER, IOC_IRQ_FLAG | IDLE_FLAG)
     while True:
         mm2s_status = read_dma(virtual_addr, MM2S_STATUS_REGISTER)
         if (mm2s_status & IOC_IRQ_FLAG) and (mm2s_status & IDLE_FLAG):
-            break
+            return True
 
-def dma_s2mm_sync(virtual_addr):
+def dma_s2mm_sync(virtual_addr, waiter=None):
+    if waiter is not None:
+        return waiter.wait(virtual_addr, S2MM_STATUS_REGISTER, IOC_IRQ_FLAG | IDLE_FLAG)
     while True:
         s2mm_status = read_dma(virtual_addr, S2MM_STATUS_REGISTER)
         if (s2mm_status & IOC_IRQ_FLAG) and (s2mm_status & IDLE_FLAG):
-            break
+            return True
+
+def make_wait_strategy(wait_config, irq_device, default_timeout_ms=0):
+    completion_mode, spin_count, sleep_max, timeout_ms = wait_config
+    return WaitStrategy(completion_mode, spin_count, sleep_max/1e6, timeout_ms or default_timeout_ms, irq_device)
+
+def print_cpu_report(label, completion_mode, cpu_time, transferred_bytes):
+    cpu_per_gb = cpu_time / (transferred_bytes / 1e9) if transferred_bytes else 0
+    print(f"- {label} info --> Completion mode: {completion_mode} | CPU time {cpu_time:.2f} s | {cpu_per_gb:.2f} CPU-s/GB")
 
 def print_mem(virtual_address, byte_count):
     data = virtual_address[:byte_count]
@@ -159,129 +405,343 @@ def print_mem(virtual_address, byte_count):
 
 
 def do_mm2s_status():                     #### Maybe those can be deleted and implemented into the main
-    dma_mm2s_status(axi_dma_0_ctrl_addr)
+    dma_mm2s_status(hw.axi_dma_0_ctrl_addr)
 
 def do_s2mm_status():                     #### Maybe those can be deleted and implemented into the main
-    dma_s2mm_status(axi_dma_0_ctrl_addr)
+    dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
 
 def do_status_s2mm_mm2s():
-    dma_s2mm_status(axi_dma_0_ctrl_addr)
-    dma_mm2s_status(axi_dma_0_ctrl_addr)
+    dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
+    dma_mm2s_status(hw.axi_dma_0_ctrl_addr)
     print("FIFO STATUS")
-    read_dma_status(axi_gpio_2_ctrl_addr, 0x0)
+    read_dma_status(hw.axi_gpio_2_ctrl_addr, 0x0)
 
 def do_s2mm_reset():
-    write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RESET_DMA)
+    write_dma(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RESET_DMA)
 
 def do_mm2s_reset():
-    write_dma(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RESET_DMA)
+    write_dma(hw.axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RESET_DMA)
 
 def do_s2mm_run():
-    write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RUN_DMA)
+    write_dma(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RUN_DMA)
 
 def do_mm2s_run():
-    write_dma(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RUN_DMA)
+    write_dma(hw.axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RUN_DMA)
 
 def do_s2mm_irq():
-    write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
+    write_dma(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
 
 def do_mm2s_irq():
-    write_dma(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
+    write_dma(hw.axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
 
 def do_s2mm_ioc():
-    write_dma(axi_dma_0_ctrl_addr, S2MM_STATUS_REGISTER    , CLEAR_IOC_IRQ)
+    write_dma(hw.axi_dma_0_ctrl_addr, S2MM_STATUS_REGISTER    , CLEAR_IOC_IRQ)
 
 def do_mm2s_ioc():
-    write_dma(axi_dma_0_ctrl_addr, MM2S_STATUS_REGISTER      , CLEAR_IOC_IRQ)
+    write_dma(hw.axi_dma_0_ctrl_addr, MM2S_STATUS_REGISTER      , CLEAR_IOC_IRQ)
 
 def do_s2mm_trn(byte):
-    write_dma(axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER      , byte)
-    #axi_dma_0_ctrl_addr[S2MM_BUFF_LENGTH_REGISTER]=0x0080
+    write_dma(hw.axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER      , byte)
+    #hw.axi_dma_0_ctrl_addr[S2MM_BUFF_LENGTH_REGISTER]=0x0080
 
 def do_mm2s_trn(byte):
-    write_dma(axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER      , byte)
-    #axi_dma_0_ctrl_addr[MM2S_TRNSFR_LENGTH_REGISTER]=0x0080
+    write_dma(hw.axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER      , byte)
+    #hw.axi_dma_0_ctrl_addr[MM2S_TRNSFR_LENGTH_REGISTER]=0x0080
 
 def do_read_s2mm_trn():
-    read_dma_status(axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER)
+    read_dma_status(hw.axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER)
 
 def do_read_mm2s_trn():
-    read_dma_status(axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER)
+    read_dma_status(hw.axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER)
 
 def do_s2mm_adr():
-    write_dma(axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER      , S2MM_OFFSET)
+    write_dma(hw.axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER      , S2MM_PHYS_0)
 
 def do_mm2s_adr():
-    write_dma(axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER      , MM2S_OFFSET)
+    write_dma(hw.axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER      , MM2S_PHYS_0)
 
 def do_read_s2mm_adr():
-    read_dma_status(axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER)
+    read_dma_status(hw.axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER)
 
 def do_read_mm2s_adr():
-    read_dma_status(axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER)
+    read_dma_status(hw.axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER)
 
 def do_read_s2mm_crtl():
-    read_dma_status(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER)
+    read_dma_status(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER)
 
 def do_read_mm2s_crtl():
-    read_dma_status(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER)
+    read_dma_status(hw.axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER)
 
 def do_read_fifo_status_1():
-    read_dma_status(axi_gpio_2_ctrl_addr, 0x0)
+    read_dma_status(hw.axi_gpio_2_ctrl_addr, 0x0)
 
 def do_read_fifo_status_2():
     print("nothing to do")
-    #read_dma_status(axi_gpio_2_ctrl_addr, 0x8)
+    #read_dma_status(hw.axi_gpio_2_ctrl_addr, 0x8)
 
-def save_mem_to_file_hex(virtual_address, offset, byte_count, file_path):
+def save_mem_to_file_hex(virtual_address, offset, byte_count, sink):
+    # sink: HexTextSink the caller keeps open across packets
     data = virtual_address[offset: (offset + byte_count)]
-    with open(file_path, 'a') as file:
-        for i in range(byte_count):
-            file.write(f"{data[i]:02X}")
-            if i % 4 == 3:
-                file.write(" ")
-        file.write("\n")
-    #file.close()
-
-def save_mem_to_file_bin(virtual_address, offset, byte_count, file_path):
+    sink.write((data,))
+    sink.flush()
+
+def do_convert_text(input_path, line_bytes, framed):
+    output_path = os.path.splitext(input_path)[0] + ".txt"
+    start_time = time.perf_counter()
+    converted, lines = convert_to_text(input_path, output_path, line_bytes, framed)
+    elapsed = time.perf_counter() - start_time
+    print(f"- Convert info --> {input_path} -> {output_path} | {converted} bytes in {lines} lines | {elapsed:.2f} s | {converted/elapsed/1e6 if elapsed else 0:.1f} MB/s")
+
+def save_mem_to_file_bin(virtual_address, offset, byte_count, sink):
+    # sink: FileSink the caller keeps open across packets
     data = virtual_address[offset: (offset + byte_count)]
-    with open(file_path, 'ab') as file:  # Open in binary append mode
-        file.write(data)
-    #file.close()
+    sink.write((data,))
 
-def do_fill_memory_high_speed_socket(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, data_buffer_queue, BUFFER_SIZE, write_index):
+def do_fill_memory_high_speed_socket(packet_ring, stats, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, wait_config=DEFAULT_WAIT_CONFIG, channel=0, doorbell=None, backpressure='block', spool=None):
     try:
-        print(f"- S2MM info --> Started fill memory high speed socket process | Polling period: {polling_period/10} ms | Max packet size: {max_packet_size} bytes | Timeout period: {timeout_period} ms | Data buffer limit: {data_buffer_limit} bytes")
+        print(f"- S2MM info --> Started fill memory high speed socket process | DMA channel: {channel} | Polling period: {polling_period/10} ms | Max packet size: {max_packet_size} bytes | Timeout period: {timeout_period} ms | Data buffer limit: {data_buffer_limit} bytes | Completion mode: {wait_config[0]} | Backpressure: {backpressure}")
         print("")
+        dma_ctrl     = dma_channel_ctrl(channel)
+        almost_empty = DMA_ALMOST_EMPTY_FLAGS[channel]
+        buffer_offset = channel*S2MM_CHANNEL_STRIDE
+        # drop/spill: the FIFO keeps being drained into a scratch buffer at the end of the slice while the ring is full
+        scratch_size = 0 if backpressure == 'block' else -(-max_packet_size // S2MM_ALLOC_ALIGN) * S2MM_ALLOC_ALIGN
+        scratch_offset = S2MM_CHANNEL_STRIDE - scratch_size
+        # data_buffer_limit > 0: consecutive packets share one region and one descriptor, published once it holds
+        # data_buffer_limit bytes or timeout_period ms after its first packet
+        aggregate    = data_buffer_limit > 0
+        allocator    = RegionAllocator(S2MM_CHANNEL_STRIDE - scratch_size, fill_reservation(max_packet_size, data_buffer_limit), S2MM_ALLOC_ALIGN)
+        waiter       = make_wait_strategy(wait_config, IRQ_S2MM_DEVICE, FILL_WAIT_TIMEOUT_MS)
+        s2mm_view    = memoryview(hw.axi_S2MM_0_virtual_addr)
+        cpu_start    = time.thread_time()
+        filled_bytes = 0
         packet_count = 0
-        index        = 0
-        for ind in range(BUFFER_SIZE):
-            data_buffer_array[ind] = 0
+        reclaimed    = packet_ring.consumed()
+        # Backpressure metrics
+        episodes        = 0
+        blocked_since   = None
+        blocked_time    = 0.0
+        dropped_packets = 0
+        dropped_bytes   = 0
+        spill_start     = None # monotonic time of the first packet of the open spool segment
+        arrivals        = JitterStats()
+        # Aggregation state and metrics
+        batch_offset    = None
+        batch_bytes     = 0 # span of the batch in the region, headers and alignment included
+        batch_payload   = 0
+        batch_count     = 0
+        batch_start     = 0.0
+        batches         = 0
+        batch_timeouts  = 0
+        batch_packets   = 0
+
+        def close_batch():
+            nonlocal batch_offset, batches, batch_packets
+            # The length headers are CPU stores in the DMA region, clean them before the region can go back to the DMA
+            flush_s2mm(buffer_offset + batch_offset, batch_bytes)
+            allocator.commit(batch_bytes)
+            packet_ring.push(framed_descriptor(buffer_offset + batch_offset, batch_count), batch_payload, batch_start)
+            if doorbell is not None:
+                doorbell.kick()
+            batches      += 1
+            batch_packets += batch_count
+            batch_offset  = None
+
+        published       = 0.0
         while (do_fill_memory_while.value == 0):
-            if (read_dma(axi_gpio_2_ctrl_addr, 0x0) & AXI_DMA_0_ALMOST_EMPTY_FLAG):
-                if data_buffer_array[index] == 0:
-                    write_dma(axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER  , (S2MM_OFFSET_0 + (index*64*1024)))
-                    write_dma(axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
-                    dma_s2mm_sync(axi_dma_0_ctrl_addr)
-                    data_buffer_array[index] =  read_dma(axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER)
-                    total_transmitted_bytes.value = total_transmitted_bytes.value  + data_buffer_array[index]
-                    data_buffer_queue[write_index.value] = index
-                    write_index.value = (write_index.value + 1) % BUFFER_SIZE
-                    index = (index + 1) % BUFFER_SIZE
-                    packet_count += 1
+            now = time.monotonic()
+            if now - published >= STATS_PUBLISH_INTERVAL:
+                stats.publish(channel, filled_bytes, packet_count, dropped_packets, episodes, waiter.waits)
+                published = now
+            if batch_offset is not None and now - batch_start >= timeout_period/1000:
+                batch_timeouts += 1
+                close_batch()
+            # Buffers are freed in the order the writer released their descriptors
+            released = (packet_ring.consumed() - reclaimed) % SPSC_WRAP
+            allocator.reclaim(released)
+            reclaimed = (reclaimed + released) % SPSC_WRAP
+            # Close the spool segment once the writer made enough room, the packets after it go to the ring again
+            if spill_start is not None and packet_ring.free() and allocator.occupancy() < SPILL_RESUME_OCCUPANCY:
+                packet_ring.push(spool.end_segment(), 0, spill_start)
+                allocator.mark()
+                if doorbell is not None:
+                    doorbell.kick()
+                spill_start = None
+            if (read_dma(hw.axi_gpio_2_ctrl_addr, 0x0) & almost_empty):
+                if batch_offset is not None:
+                    offset = batch_offset + framed_data_offset(batch_bytes)
                 else:
-                    print(f"backpressure detected on index: {index} and packet counter: {packet_count}")
+                    offset = allocator.reserve() if spill_start is None and packet_ring.free() else None
+                    if aggregate and offset is not None:
+                        batch_offset  = offset
+                        batch_bytes   = 0
+                        batch_payload = 0
+                        batch_count   = 0
+                        batch_start   = time.monotonic()
+                        offset       += framed_data_offset(0)
+                if offset is None:
+                    if blocked_since is None:
+                        blocked_since = time.perf_counter()
+                        episodes += 1
+                        print(f"backpressure detected on channel: {channel} occupancy: {allocator.occupancy()*100:.1f} % and packet counter: {packet_count} | Policy: {backpressure}")
+                    if backpressure == 'block':
+                        time.sleep(polling_period/10000)
+                        continue
+                elif blocked_since is not None:
+                    blocked_time += time.perf_counter() - blocked_since
+                    blocked_since = None
+                destination = offset if offset is not None else scratch_offset
+                write_dma(dma_ctrl, S2MM_DST_ADDRESS_REGISTER  , (S2MM_PHYS_0 + buffer_offset + destination))
+                write_dma(dma_ctrl, S2MM_BUFF_LENGTH_REGISTER  , max_packet_size)
+                completed = dma_s2mm_sync(dma_ctrl, waiter)
+                while not completed and do_fill_memory_while.value == 0:
+                    if debug:
+                        print(f"S2MM wait timed out on channel: {channel} offset: 0x{destination:08x} and packet counter: {packet_count}")
+                    completed = dma_s2mm_sync(dma_ctrl, waiter)
+                if not completed:
+                    break
+                length = read_dma(dma_ctrl, S2MM_BUFF_LENGTH_REGISTER)
+                arrivals.tick()
+                if offset is None and backpressure == 'drop':
+                    dropped_packets += 1
+                    dropped_bytes   += length
+                    continue
+                invalidate_s2mm(buffer_offset + destination, length)
+                filled_bytes += length
+                packet_count += 1
+                if offset is None:
+                    if spill_start is None:
+                        spill_start = time.monotonic()
+                    spool.append(s2mm_view[buffer_offset + destination : buffer_offset + destination + length])
+                    continue
+                if aggregate:
+                    # Length header in the cache line before the packet, written after the invalidation of its data and
+                    # flushed with the batch in close_batch()
+                    LENGTH_HEADER.pack_into(s2mm_view, buffer_offset + offset - LENGTH_HEADER.size, length)
+                    batch_bytes    = offset + length - batch_offset
+                    batch_payload += length
+                    batch_count   += 1
+                    if batch_bytes >= data_buffer_limit:
+                        close_batch()
+                else:
+                    allocator.commit(length)
+                    packet_ring.push(buffer_offset + offset, length)
+                    if doorbell is not None:
+                        doorbell.kick()
             time.sleep(polling_period/10000)
+        if batch_offset is not None:
+            close_batch()
+        if spill_start is not None:
+            # The writer keeps running until every fill process returned, hand it the last segment
+            while not packet_ring.free():
+                time.sleep(polling_period/10000)
+            packet_ring.push(spool.end_segment(), 0, spill_start)
+            allocator.mark()
+            if doorbell is not None:
+                doorbell.kick()
+        if blocked_since is not None:
+            blocked_time += time.perf_counter() - blocked_since
+        stats.publish(channel, filled_bytes, packet_count, dropped_packets, episodes, waiter.waits)
+        s2mm_view.release()
         print("")
         print("- S2MM info --> Ended fill memory high speed socket process")
+        print_cpu_report("S2MM", waiter.mode, time.thread_time() - cpu_start, filled_bytes)
+        print(waiter.report("S2MM"))
+        print(allocator.report("S2MM"))
+        print(arrivals.report("S2MM", "Packet arrival"))
+        if aggregate:
+            print(f"- S2MM info --> Aggregation: {batches} descriptors for {batch_packets} packets | AVG {batch_packets/max(batches, 1):.1f} packets per descriptor | Closed by timeout {batch_timeouts} | Limit {data_buffer_limit} bytes / {timeout_period} ms")
+        print(f"- S2MM info --> Backpressure: {backpressure} | Episodes {episodes} | Time without ring space {blocked_time:.3f} s | Dropped {dropped_packets} packets / {dropped_bytes} bytes")
+        if spool is not None:
+            print(spool.report("S2MM"))
+            spool.close()
+        if doorbell is not None:
+            print(doorbell.report("S2MM"))
+        waiter.close()
     except KeyboardInterrupt:
         print("")
         print(f"--->    KeyboardInterrupt occurred for fill memory high speed process")
 
 
-def do_write_memory_indexing(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, data_buffer_queue, BUFFER_SIZE, write_index, read_index, file_name):
+def do_fill_memory_sg(packet_ring, stats, do_fill_memory_while, polling_period, max_packet_size, debug, channel=0, doorbell=None):
+    try:
+        BUFFER_SIZE    = SG_SLOTS # harvested and released in the order of the SG ring, the packet ring has room for all of them
+        buffer_offset  = channel*S2MM_CHANNEL_STRIDE
+        sg_ring_offset = buffer_offset + BUFFER_SIZE*SG_SLOT_SIZE
+        dma_ctrl       = dma_channel_ctrl(channel)
+        print(f"- S2MM info --> Started fill memory scatter-gather process | DMA channel: {channel} | Polling period: {polling_period/10} ms | Descriptors: {BUFFER_SIZE} x {min(max_packet_size, SG_SLOT_SIZE)} bytes | Ring offset: 0x{sg_ring_offset:08x}")
+        print("")
+        desc_bank = RegisterBank(hw.axi_S2MM_0_desc_addr, sg_ring_offset, BUFFER_SIZE*SG_DESCRIPTOR_SIZE)
+        ring = SgRing(desc_bank, S2MM_PHYS_0 + sg_ring_offset, S2MM_PHYS_0 + buffer_offset, SG_SLOT_SIZE, BUFFER_SIZE, min(max_packet_size, SG_SLOT_SIZE))
+        ring.build()
+
+        # CURDESC can only be written while the channel is halted
+        write_dma(dma_ctrl, S2MM_CONTROL_REGISTER, RESET_DMA)
+        while read_dma(dma_ctrl, S2MM_CONTROL_REGISTER) & RESET_DMA:
+            pass
+        if not (read_dma(dma_ctrl, S2MM_STATUS_REGISTER) & STATUS_SG_INCLDED):
+            print("***  ERROR  *** | The AXI DMA was built without scatter-gather support, use --s2mm_mode simple")
+            desc_bank.release()
+            return
+        ring.start(dma_ctrl)
+
+        cpu_start    = time.thread_time()
+        filled_bytes = 0
+        packet_count = 0
+        harvests     = 0
+        arrivals     = JitterStats()
+        recycled     = packet_ring.consumed()
+        idle_polls   = 0
+        published    = 0.0
+        while (do_fill_memory_while.value == 0):
+            completed = ring.harvest()
+            if completed:
+                harvests += 1
+                arrivals.tick()
+                harvested_bytes = 0
+                for slot, length, status in completed:
+                    if status & SG_STATUS_ERRORS:
+                        print(f"***  ERROR  *** | Descriptor {slot} completed with status 0x{status:08x}")
+                    invalidate_s2mm(buffer_offset + slot*SG_SLOT_SIZE, length)
+                    packet_ring.put(buffer_offset + slot*SG_SLOT_SIZE, length)
+                    harvested_bytes += length
+                packet_ring.publish()
+                if doorbell is not None:
+                    doorbell.kick()
+                filled_bytes += harvested_bytes
+                packet_count += len(completed)
+            # Slots go back to the hardware in ring order once the consumer released them
+            released = min((packet_ring.consumed() - recycled) % SPSC_WRAP, ring.outstanding)
+            ring.recycle(released)
+            recycled = (recycled + released) % SPSC_WRAP
+            now = time.monotonic()
+            if now - published >= STATS_PUBLISH_INTERVAL:
+                stats.publish(channel, filled_bytes, packet_count, 0, 0, idle_polls)
+                published = now
+            if not completed:
+                idle_polls += 1
+                time.sleep(polling_period/10000)
+        stats.publish(channel, filled_bytes, packet_count, 0, 0, idle_polls)
+        write_dma(dma_ctrl, S2MM_CONTROL_REGISTER, RESET_DMA)
+        desc_bank.release()
+        print("")
+        print("- S2MM info --> Ended fill memory scatter-gather process")
+        print(f"- S2MM info --> Packets {packet_count} | Harvests {harvests} | AVG descriptors/harvest {packet_count/harvests if harvests else 0:.1f}")
+        print_cpu_report("S2MM", "sg", time.thread_time() - cpu_start, filled_bytes)
+        print(arrivals.report("S2MM", "Harvest"))
+        if doorbell is not None:
+            print(doorbell.report("S2MM"))
+    except KeyboardInterrupt:
+        print("")
+        print(f"--->    KeyboardInterrupt occurred for fill memory scatter-gather process")
+
+
+def do_write_memory_indexing(packet_rings, stats, do_write_memory_while, polling_period, file_name, doorbell=None, spools=None, consumer=0, sink_config=DEFAULT_SINK_CONFIG, file_type='b', compression_config=DEFAULT_COMPRESSION_CONFIG):
     try:
-        print(f"- S2MM info --> Started write memory process | Polling period: {polling_period/10} ms | File name: {file_name} ")
+        attach_consumer(packet_rings, doorbell, consumer)
+        dma_channels = len(packet_rings)
+        file_names   = [channel_file_name(file_name, channel, dma_channels) for channel in range(dma_channels)]
+        print(f"- S2MM info --> Started write memory process | Polling period: {polling_period/10} ms | File name: {', '.join(file_names)} | Disk writer: {sink_config[0]} | File type: {file_type} | Compression: {compression_config[0]}")
         print("")
         index                = 0
         total_written_bytes  = 0
@@ -298,57 +758,134 @@ def do_write_memory_indexing(data_buffer_array, total_transmitted_bytes, do_writ
         debug_time = 0
         total = 0
         # DEBUG TIME #
-        while data_buffer_array[0] == 0 :
-            time.sleep(polling_period/10000)
+        notify       = 'poll' if doorbell is None else 'event'
+        latency_sum  = 0.0
+        latency_max  = 0.0
+        max_lag      = 0
+        written_packets = 0
+        waits           = 0
+        stats_published = 0.0
+        # One descriptor per output file for the whole run, each peeked batch goes out in one gathered write
+        sinks     = [make_file_sink(name, sink_config, file_type) for name in file_names]
+        s2mm_view = memoryview(hw.axi_S2MM_0_virtual_addr)
+        compressor = make_compression_pool(compression_config, dma_channels)
+
+        def emit(channel, buffers):
+            # --compression: the blocks come back in order as COMPRESSED_HEADER frames
+            if compressor is None:
+                sinks[channel].write(buffers)
+                return
+            compressor.write(channel, buffers)
+            for ready_channel, frame in compressor.ready():
+                sinks[ready_channel].write((frame,))
+
+        while do_write_memory_while.value == 0 and not any(packet_ring.available() for packet_ring in packet_rings):
+            wait_for_packets(packet_rings, doorbell, polling_period)
         start_time = time.time()
-        while do_write_memory_while.value == 0 or (read_index.value != write_index.value):
-            now_time = time.time()                           # DEBUG TIME #
-            if read_index.value != write_index.value:
-                index = data_buffer_queue[read_index.value]
+        cpu_start  = time.thread_time()
+        while do_write_memory_while.value == 0 or any(packet_ring.available() for packet_ring in packet_rings):
+            idle = True
+            # Round robin over the engines, every published packet of a channel per pass
+            for channel, packet_ring in enumerate(packet_rings):
+                now_time = time.time()                           # DEBUG TIME #
+                descriptors = packet_ring.peek()
+                if not descriptors:
+                    continue
+                idle = False
+                max_lag   = max(max_lag, packet_ring.lag(consumer))
+                published = time.monotonic()
+                for offset, length, sequence, timestamp in descriptors:
+                    latency_sum += published - timestamp
+                    latency_max  = max(latency_max, published - timestamp)
                 indexing_time = time.time()                  # DEBUG TIME #
-                with open(file_name, 'ab') as file:
-                    file.write(axi_S2MM_0_virtual_addr[(index*64*1024) : (index*64*1024) + data_buffer_array[index]])
+                buffers = []
+                for offset, length, sequence, timestamp in descriptors:
+                    if offset & SPOOL_FLAG:
+                        # Packets the fill process spilled while the ring was full, they come next in the stream
+                        emit(channel, buffers)
+                        buffers = []
+                        for data in spools[channel].replay(offset):
+                            emit(channel, (data,))
+                            total_written_bytes += len(data)
+                            written_packets     += 1
+                        spools[channel].caught_up(timestamp)
+                        continue
+                    if offset & FRAMED_FLAG:
+                        buffers.extend(framed_packets(s2mm_view, offset))
+                        total_written_bytes += length
+                        written_packets     += framed_count(offset)
+                        continue
+                    buffers.append(s2mm_view[offset : offset + length])
+                    total_written_bytes += length
+                    written_packets     += 1
+                emit(channel, buffers)
+                buffers = None # the slices must not outlive the release of their slots
                 sendall_time = time.time()                   # DEBUG TIME #
-                read_index.value = (read_index.value + 1) % BUFFER_SIZE
-                total_written_bytes += data_buffer_array[index]
-                data_buffer_array[index] = 0
+                packet_ring.release(len(descriptors))
                 deindexing_time = time.time()                # DEBUG TIME #
                 indexing   += (indexing_time-now_time)       # DEBUG TIME #
                 sendall    += (sendall_time-indexing_time)   # DEBUG TIME #
                 deindexing += (deindexing_time-sendall_time) # DEBUG TIME #
-                counter    += 1                              # DEBUG TIME #
+                counter    += len(descriptors)               # DEBUG TIME #
                 debug_time  = time.time()                    # DEBUG TIME #
                 debug      += (debug_time-deindexing_time)   # DEBUG TIME #
                 total      += (debug_time-now_time)          # DEBUG TIME #
-            else:
-                time.sleep(polling_period/10000)
+            now = time.monotonic()
+            if now - stats_published >= STATS_PUBLISH_INTERVAL:
+                stats.publish(dma_channels + consumer, total_written_bytes, written_packets, 0, 0, waits)
+                stats_published = now
+            if idle:
+                waits += 1
+                if compressor is not None:
+                    compressor.flush()
+                    for ready_channel, frame in compressor.ready():
+                        sinks[ready_channel].write((frame,))
+                for sink in sinks:
+                    sink.flush() # a partly filled staging buffer does not wait for the next burst
+                wait_for_packets(packet_rings, doorbell, polling_period)
+        if compressor is not None:
+            for channel, frame in compressor.drain():
+                sinks[channel].write((frame,))
+            compressor.close()
+            print(compressor.report("S2MM"))
+        stats.publish(dma_channels + consumer, total_written_bytes, written_packets, 0, 0, waits)
+        s2mm_view.release()
         current_time = time.time()
-        print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
+        print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {transmitted_bytes(stats, dma_channels):.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
         print("")
         print("- S2MM info --> Ended write memory send memory process")
+        for sink in sinks:
+            sink.close()
+            print(sink.report("S2MM"))
+        print_latency_report("S2MM", notify, latency_sum, latency_max, counter, time.thread_time() - cpu_start, total_written_bytes)
+        print_lag_report("S2MM", consumer, max_lag)
+        if doorbell is not None:
+            print(doorbell.report("S2MM"))
+        for spool in spools or ():
+            if spool is not None:
+                print(spool.report("S2MM"))
+                spool.close()
         print("")
         print(f"#################     DEBUG     #################")
         print(f"packets sent        : {counter}")
-        print(f"avg indexing time   : {(indexing/counter)*1000:.3f} ms |  {100*(indexing/total):.2f} %")
-        print(f"avg save file time  : {(sendall/counter)*1000:.3f} ms |  {100*(sendall/total):.2f} %  -> {total_written_bytes/sendall/1e6:.3f} MBps")
-        print(f"avg deindexing time : {(deindexing/counter)*1000:.3f} ms |  {100*(deindexing/total):.2f} %")
-        print(f"avg debug time      : {(debug/counter)*1000:.3f} ms |  {100*(debug/total):.2f} %")
-        print(f"avg total time      : {(total/counter)*1000:.3f} ms |  {100*(total/total):.2f} %")
+        if counter:
+            print(f"avg indexing time   : {(indexing/counter)*1000:.3f} ms |  {100*(indexing/total):.2f} %")
+            print(f"avg save file time  : {(sendall/counter)*1000:.3f} ms |  {100*(sendall/total):.2f} %  -> {total_written_bytes/sendall/1e6:.3f} MBps")
+            print(f"avg deindexing time : {(deindexing/counter)*1000:.3f} ms |  {100*(deindexing/total):.2f} %")
+            print(f"avg debug time      : {(debug/counter)*1000:.3f} ms |  {100*(debug/total):.2f} %")
+            print(f"avg total time      : {(total/counter)*1000:.3f} ms |  {100*(total/total):.2f} %")
     except KeyboardInterrupt:
         print("--->    KeyboardInterrupt occurred for write memory send memory process")
         print("###     ")
-        print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
-
-# Pre-allocate headers for all possible packet sizes
-header_cache = {
-    size: struct.pack("!I", size) 
-    for size in range(1, 65536)
-}
+        print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {transmitted_bytes(stats, dma_channels):.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
 
-def do_send_socket_no_print(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, debug, data_buffer_queue, HOST, PORT_TCP, BUFFER_SIZE, write_index, read_index):
+def do_send_socket_no_print(packet_rings, stats, do_write_memory_while, polling_period, debug, HOST, PORT_TCP, doorbell=None, spools=None, consumer=0, compression_config=DEFAULT_COMPRESSION_CONFIG):
     try:
-        print(f"- S2MM info --> Started TCP send memory process | Polling period: {polling_period/10} ms")
+        attach_consumer(packet_rings, doorbell, consumer)
+        dma_channels = len(packet_rings)
+        print(f"- S2MM info --> Started TCP send memory process | Polling period: {polling_period/10} ms | DMA channels: {dma_channels} | Header: {'(length)' if dma_channels == 1 else '(channel, length)'} | Compression: {compression_config[0]}")
         print(f"- S2MM info --> Connecting to socket as client | HOST: {HOST} | PORT: {PORT_TCP}")
+        import socket
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
             # Disable Nagle + increase send buffer
             client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
@@ -374,53 +911,141 @@ def do_send_socket_no_print(data_buffer_array, total_transmitted_bytes, do_write
             total = 0
             # DEBUG TIME #
 
-            while data_buffer_array[0] == 0 :
-                time.sleep(polling_period/10000)
+            # Header packed in place and sent together with a view of the DMA buffer: no allocation or copy per packet
+            header_format = LENGTH_HEADER if dma_channels == 1 else CHANNEL_HEADER
+            header        = bytearray(header_format.size)
+            s2mm_view     = memoryview(hw.axi_S2MM_0_virtual_addr)
+
+            notify      = 'poll' if doorbell is None else 'event'
+            latency_sum = 0.0
+            latency_max = 0.0
+            max_lag     = 0
+            written_packets = 0
+            waits           = 0
+            stats_published = 0.0
+            # --compression: the framed stream goes out in (raw length, compressed length) blocks instead
+            compressor      = make_compression_pool(compression_config, dma_channels)
+
+            while do_write_memory_while.value == 0 and not any(packet_ring.available() for packet_ring in packet_rings):
+                wait_for_packets(packet_rings, doorbell, polling_period)
             start_time = time.time()
-            while do_write_memory_while.value == 0 or (read_index.value != write_index.value):
-                now_time = time.time()                           # DEBUG TIME #
-                if read_index.value != write_index.value:
-                    index = data_buffer_queue[read_index.value]
+            cpu_start  = time.thread_time()
+            while do_write_memory_while.value == 0 or any(packet_ring.available() for packet_ring in packet_rings):
+                idle = True
+                # Round robin over the engines, every published packet of a channel per pass
+                for channel, packet_ring in enumerate(packet_rings):
+                    now_time = time.time()                           # DEBUG TIME #
+                    descriptors = packet_ring.peek()
+                    if not descriptors:
+                        continue
+                    idle = False
+                    max_lag   = max(max_lag, packet_ring.lag(consumer))
+                    published = time.monotonic()
+                    for offset, length, sequence, timestamp in descriptors:
+                        latency_sum += published - timestamp
+                        latency_max  = max(latency_max, published - timestamp)
                     indexing_time = time.time()                  # DEBUG TIME #
-                    client.sendall(header_cache[data_buffer_array[index]] + axi_S2MM_0_virtual_addr[(index*64*1024) : (index*64*1024) + data_buffer_array[index]])
+                    if compressor is not None:
+                        parts, packets, payload = stream_parts(descriptors, channel, dma_channels, s2mm_view, spools)
+                        compressor.write(channel, parts)
+                        parts = None # the slices must not outlive the release of their slots
+                        for ready_channel, frame in compressor.ready():
+                            client.sendall(frame)
+                        total_written_bytes += payload
+                        written_packets     += packets
+                    else:
+                        for offset, length, sequence, timestamp in descriptors:
+                            if offset & SPOOL_FLAG:
+                                # Packets the fill process spilled while the ring was full, they come next in the stream
+                                for data in spools[channel].replay(offset):
+                                    if dma_channels == 1:
+                                        header_format.pack_into(header, 0, len(data))
+                                    else:
+                                        header_format.pack_into(header, 0, channel, len(data))
+                                    send_framed(client, header, data)
+                                    total_written_bytes += len(data)
+                                    written_packets     += 1
+                                spools[channel].caught_up(timestamp)
+                                continue
+                            if offset & FRAMED_FLAG:
+                                if dma_channels == 1:
+                                    # The aggregated packets already carry the stream framing, one gather send for all of them
+                                    send_gathered(client, list(framed_records(s2mm_view, offset)))
+                                else:
+                                    for data in framed_packets(s2mm_view, offset):
+                                        header_format.pack_into(header, 0, channel, len(data))
+                                        send_framed(client, header, data)
+                                total_written_bytes += length
+                                written_packets     += framed_count(offset)
+                                continue
+                            if dma_channels == 1:
+                                header_format.pack_into(header, 0, length)
+                            else:
+                                header_format.pack_into(header, 0, channel, length)
+                            send_framed(client, header, s2mm_view[offset : offset + length])
+                            total_written_bytes += length
+                            written_packets     += 1
                     sendall_time = time.time()                   # DEBUG TIME #
-                    read_index.value = (read_index.value + 1) % BUFFER_SIZE
-                    total_written_bytes += data_buffer_array[index]
-                    data_buffer_array[index] = 0
+                    packet_ring.release(len(descriptors))
                     deindexing_time = time.time()                # DEBUG TIME #
                     indexing   += (indexing_time-now_time)       # DEBUG TIME #
                     sendall    += (sendall_time-indexing_time)   # DEBUG TIME #
                     deindexing += (deindexing_time-sendall_time) # DEBUG TIME #
-                    counter    += 1                              # DEBUG TIME #
+                    counter    += len(descriptors)               # DEBUG TIME #
                     debug_time  = time.time()                    # DEBUG TIME #
                     debug      += (debug_time-deindexing_time)   # DEBUG TIME #
                     total      += (debug_time-now_time)          # DEBUG TIME #
-
-                else:
-                    time.sleep(polling_period/10000)
+                now = time.monotonic()
+                if now - stats_published >= STATS_PUBLISH_INTERVAL:
+                    stats.publish(dma_channels + consumer, total_written_bytes, written_packets, 0, 0, waits)
+                    stats_published = now
+                if idle:
+                    waits += 1
+                    if compressor is not None:
+                        compressor.flush()
+                        for ready_channel, frame in compressor.ready():
+                            client.sendall(frame)
+                    wait_for_packets(packet_rings, doorbell, polling_period)
+            if compressor is not None:
+                for ready_channel, frame in compressor.drain():
+                    client.sendall(frame)
+                compressor.close()
+                print(compressor.report("S2MM"))
+            stats.publish(dma_channels + consumer, total_written_bytes, written_packets, 0, 0, waits)
+            s2mm_view.release()
 
             current_time = time.time()
-            print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
+            print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {transmitted_bytes(stats, dma_channels):.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
             print("")
             print("- S2MM info --> Ended TCP send memory process")
+            print_latency_report("S2MM", notify, latency_sum, latency_max, counter, time.thread_time() - cpu_start, total_written_bytes)
+            print_lag_report("S2MM", consumer, max_lag)
+            if doorbell is not None:
+                print(doorbell.report("S2MM"))
+            for spool in spools or ():
+                if spool is not None:
+                    print(spool.report("S2MM"))
+                    spool.close()
             print("")
             print(f"#################     DEBUG     #################")
             print(f"packets sent        : {counter}")
-            print(f"avg indexing time   : {(indexing/counter)*1000:.3f} ms |  {100*(indexing/total):.2f} %")
-            print(f"avg sendall time    : {(sendall/counter)*1000:.3f} ms |  {100*(sendall/total):.2f} %  -> {total_written_bytes/sendall/1e6:.3f} MBps")
-            print(f"avg deindexing time : {(deindexing/counter)*1000:.3f} ms |  {100*(deindexing/total):.2f} %")
-            print(f"avg debug time      : {(debug/counter)*1000:.3f} ms |  {100*(debug/total):.2f} %")
-            print(f"avg total time      : {(total/counter)*1000:.3f} ms |  {100*(total/total):.2f} %")
+            if counter:
+                print(f"avg indexing time   : {(indexing/counter)*1000:.3f} ms |  {100*(indexing/total):.2f} %")
+                print(f"avg sendall time    : {(sendall/counter)*1000:.3f} ms |  {100*(sendall/total):.2f} %  -> {total_written_bytes/sendall/1e6:.3f} MBps")
+                print(f"avg deindexing time : {(deindexing/counter)*1000:.3f} ms |  {100*(deindexing/total):.2f} %")
+                print(f"avg debug time      : {(debug/counter)*1000:.3f} ms |  {100*(debug/total):.2f} %")
+                print(f"avg total time      : {(total/counter)*1000:.3f} ms |  {100*(total/total):.2f} %")
     except KeyboardInterrupt:
         print("--->    KeyboardInterrupt occurred for TCP send memory process")
         print("###     ")
-        print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
+        print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {transmitted_bytes(stats, dma_channels):.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
 
 
-def do_send_socket(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, debug, data_buffer_queue, HOST, PORT_TCP, BUFFER_SIZE, write_index, read_index):
+def do_send_socket(packet_ring, stats, do_write_memory_while, polling_period, debug, HOST, PORT_TCP, doorbell=None):
     try:
         print(f"- S2MM info --> Started TCP send memory process | Polling period: {polling_period/10} ms")
         print(f"- S2MM info --> Connecting to socket as client | HOST: {HOST} | PORT: {PORT_TCP}")
+        import socket
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
             # Disable Nagle + increase send buffer
             client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
@@ -430,12 +1055,11 @@ def do_send_socket(data_buffer_array, total_transmitted_bytes, do_write_memory_w
             packet_length                  = 0
             total_written_bytes            = 0
             PRINT_INTERVAL                 = 0.2  # Update stats every 100ms
-            while data_buffer_array[0] == 0 :
-                time.sleep(polling_period/10000)
+            while do_write_memory_while.value == 0 and not packet_ring.available():
+                wait_for_packets([packet_ring], doorbell, polling_period)
             start_time = time.time()
             current_time = start_time
             last_print   = start_time
-            index = 0
             ## start debug parameters
             start_time_cycle = 0
             got_index_time = 0
@@ -444,51 +1068,103 @@ def do_send_socket(data_buffer_array, total_transmitted_bytes, do_write_memory_w
             end_time_cycle   = 0
             packet_length_debug = 0
             increment_read_index_time = 0
+            header    = bytearray(LENGTH_HEADER.size)
+            s2mm_view = memoryview(hw.axi_S2MM_0_virtual_addr)
             ## end   debug parameters
-            with read_index.get_lock():
-                while do_write_memory_while.value == 0 or (read_index.value != write_index.value): #or not data_buffer_queue.empty():
-                    if read_index.value != write_index.value:
-                        start_time_cycle = time.time() # this is for debug
-                        #index = data_buffer_queue[read_idx.value]
-                        index = read_index.value
-                        got_index_time = time.time() # this is for debug
-                        #packet_length = struct.pack("!I", data_buffer_array[index])
-                        packet_length = header_cache[data_buffer_array[index]]
-                        calculated_packet_length_time = time.time() # this is for debug
-                        client.sendall(packet_length + axi_S2MM_0_virtual_addr[(index*65536) : (index*65536) + data_buffer_array[index]])
-                        end_send_all_time = time.time() # this is for debug
-                        read_index.value = (read_index.value + 1) % BUFFER_SIZE
-                        
-                        increment_read_index_time = time.time() # this is for debug
-                        total_written_bytes = total_written_bytes + data_buffer_array[index]
-                        packet_length_debug = data_buffer_array[index] #debug
-                        data_buffer_array[index] = 0
-                        current_time = time.time()
-                        if current_time - last_print > PRINT_INTERVAL:
-                            print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
-                            last_print = current_time
-                        end_time_cycle = time.time() # this is for debug
-                        print("###############################################")
-                        print(f"Total time        : {(end_time_cycle - start_time_cycle)*1000:.3f} ms -> {100*(end_time_cycle - start_time_cycle)/(end_time_cycle - start_time_cycle):.3f} %  |")
-                        print(f"Got index time    : {(got_index_time - start_time_cycle)*1000:.3f} ms -> {100*(got_index_time - start_time_cycle)/(end_time_cycle - start_time_cycle):.3f} %  |")
-                        print(f"Packet length time: {(calculated_packet_length_time - got_index_time)*1000:.3f} ms -> {100*(calculated_packet_length_time - got_index_time)/(end_time_cycle - start_time_cycle):.3f} %  |")
-                        print(f"Sendall time      : {(end_send_all_time - calculated_packet_length_time)*1000:.3f} ms -> {100*(end_send_all_time - calculated_packet_length_time)/(end_time_cycle - start_time_cycle):.3f} %  | {(packet_length_debug)/(end_send_all_time - calculated_packet_length_time)/1e6:.3f} MBps")
-                        print(f"Increment time    : {(increment_read_index_time - end_send_all_time)*1000:.3f} ms -> {100*(increment_read_index_time - end_send_all_time)/(end_time_cycle - start_time_cycle):.3f} %  |")
-                        print(f"Print time        : {(end_time_cycle - increment_read_index_time)*1000:.3f} ms -> {100*(end_time_cycle - increment_read_index_time)/(end_time_cycle - start_time_cycle):.3f} %  |")
-                        print(f"SUM = {(100*(got_index_time - start_time_cycle)/(end_time_cycle - start_time_cycle))+(100*(end_time_cycle - increment_read_index_time))+(100*(calculated_packet_length_time - got_index_time)/(end_time_cycle - start_time_cycle))+(100*(end_time_cycle - end_send_all_time)/(end_time_cycle - start_time_cycle))+(100*(end_send_all_time - calculated_packet_length_time)/(end_time_cycle - start_time_cycle)):.3f}")
+            while do_write_memory_while.value == 0 or packet_ring.available():
+                descriptors = packet_ring.peek(1)
+                if descriptors:
+                    start_time_cycle = time.time() # this is for debug
+                    offset, length, sequence, timestamp = descriptors[0]
+                    got_index_time = time.time() # this is for debug
+                    #packet_length = struct.pack("!I", length)
+                    LENGTH_HEADER.pack_into(header, 0, length)
+                    calculated_packet_length_time = time.time() # this is for debug
+                    if offset & FRAMED_FLAG:
+                        send_gathered(client, list(framed_records(s2mm_view, offset)))
                     else:
-                        time.sleep(polling_period/10000)
-                        current_time = time.time()
-            print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
+                        send_framed(client, header, s2mm_view[offset : offset + length])
+                    end_send_all_time = time.time() # this is for debug
+                    packet_ring.release(1)
+
+                    increment_read_index_time = time.time() # this is for debug
+                    total_written_bytes = total_written_bytes + length
+                    packet_length_debug = length #debug
+                    current_time = time.time()
+                    if current_time - last_print > PRINT_INTERVAL:
+                        print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {transmitted_bytes(stats, 1):.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
+                        last_print = current_time
+                    end_time_cycle = time.time() # this is for debug
+                    print("###############################################")
+                    print(f"Total time        : {(end_time_cycle - start_time_cycle)*1000:.3f} ms -> {100*(end_time_cycle - start_time_cycle)/(end_time_cycle - start_time_cycle):.3f} %  |")
+                    print(f"Got index time    : {(got_index_time - start_time_cycle)*1000:.3f} ms -> {100*(got_index_time - start_time_cycle)/(end_time_cycle - start_time_cycle):.3f} %  |")
+                    print(f"Packet length time: {(calculated_packet_length_time - got_index_time)*1000:.3f} ms -> {100*(calculated_packet_length_time - got_index_time)/(end_time_cycle - start_time_cycle):.3f} %  |")
+                    print(f"Sendall time      : {(end_send_all_time - calculated_packet_length_time)*1000:.3f} ms -> {100*(end_send_all_time - calculated_packet_length_time)/(end_time_cycle - start_time_cycle):.3f} %  | {(packet_length_debug)/(end_send_all_time - calculated_packet_length_time)/1e6:.3f} MBps")
+                    print(f"Increment time    : {(increment_read_index_time - end_send_all_time)*1000:.3f} ms -> {100*(increment_read_index_time - end_send_all_time)/(end_time_cycle - start_time_cycle):.3f} %  |")
+                    print(f"Print time        : {(end_time_cycle - increment_read_index_time)*1000:.3f} ms -> {100*(end_time_cycle - increment_read_index_time)/(end_time_cycle - start_time_cycle):.3f} %  |")
+                    print(f"SUM = {(100*(got_index_time - start_time_cycle)/(end_time_cycle - start_time_cycle))+(100*(end_time_cycle - increment_read_index_time))+(100*(calculated_packet_length_time - got_index_time)/(end_time_cycle - start_time_cycle))+(100*(end_time_cycle - end_send_all_time)/(end_time_cycle - start_time_cycle))+(100*(end_send_all_time - calculated_packet_length_time)/(end_time_cycle - start_time_cycle)):.3f}")
+                else:
+                    wait_for_packets([packet_ring], doorbell, polling_period)
+                    current_time = time.time()
+            s2mm_view.release()
+            current_time = time.time()
+            print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {transmitted_bytes(stats, 1):.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
             print("")
             print("- S2MM info --> Ended TCP send memory process")
     except KeyboardInterrupt:
         print("--->    KeyboardInterrupt occurred for TCP send memory process")
         print("###     ")
-        print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {total_transmitted_bytes.value:.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
+        print(f"- S2MM info --> Elapsed time {(current_time - start_time):.2f} s | Total transmitted bytes {transmitted_bytes(stats, 1):.2f} | Total written bytes {total_written_bytes:.2f} | AVG transmission speed {total_written_bytes / (current_time - start_time) / 1000000:.2f} MB/s", end='\r')
 
 
-def do_data_acquisition(polling_period, file_name, file_type, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug):
+def do_monitor_rings(packet_rings, stats, do_write_memory_while, polling_period, outputs, doorbell=None, consumer=0):
+    try:
+        attach_consumer(packet_rings, doorbell, consumer)
+        print(f"- Monitor info --> Started live monitor | Consumers: {', '.join(f'{index}:{output}' for index, output in enumerate(outputs))}")
+        packets      = 0
+        bytes_seen   = 0
+        start_time   = time.time()
+        last_print   = start_time
+        last_packets = 0
+        last_bytes   = 0
+        waits        = 0
+        dma_channels = len(packet_rings)
+        while do_write_memory_while.value == 0 or any(packet_ring.available() for packet_ring in packet_rings):
+            idle = True
+            for packet_ring in packet_rings:
+                descriptors = packet_ring.peek()
+                if not descriptors:
+                    continue
+                idle = False
+                for offset, length, sequence, timestamp in descriptors:
+                    if offset & FRAMED_FLAG:
+                        packets    += framed_count(offset)
+                        bytes_seen += length
+                    elif not offset & SPOOL_FLAG:
+                        packets    += 1
+                        bytes_seen += length
+                packet_ring.release(len(descriptors))
+            current_time = time.time()
+            if current_time - last_print > MONITOR_INTERVAL:
+                # Lag of every consumer of every channel, the slowest one holds the buffers
+                lags = " | ".join(f"{outputs[index]} lag " + "/".join(str(packet_ring.lag(index)) for packet_ring in packet_rings) for index in range(len(outputs)))
+                stats.publish(dma_channels + consumer, bytes_seen, packets, 0, 0, waits)
+                fill = range(dma_channels)
+                print(f"- Monitor info --> {(packets - last_packets)/(current_time - last_print):.0f} packets/s | {(bytes_seen - last_bytes)/(current_time - last_print)/1e6:.2f} MB/s | {lags} | Filled {stats.total('bytes', fill)} bytes | Dropped {stats.total('drops', fill)} | Backpressure {stats.total('backpressure', fill)}")
+                last_print   = current_time
+                last_packets = packets
+                last_bytes   = bytes_seen
+            if idle:
+                waits += 1
+                wait_for_packets(packet_rings, doorbell, polling_period)
+        stats.publish(dma_channels + consumer, bytes_seen, packets, 0, 0, waits)
+        print(f"- Monitor info --> Ended live monitor | Packets {packets} | Bytes {bytes_seen} | Elapsed time {time.time() - start_time:.2f} s")
+    except KeyboardInterrupt:
+        print("--->    KeyboardInterrupt occurred for live monitor process")
+
+
+def do_data_acquisition(polling_period, file_name, file_type, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug, wait_config, s2mm_mode, dma_channels=1, notify='poll', backpressure='block', spool_dir='/tmp', outputs=('file',), pipeline='process', scheduling=None, sink_config=DEFAULT_SINK_CONFIG, compression_config=DEFAULT_COMPRESSION_CONFIG):
+    # The stages of do_benchmark without the MM2S load, the data comes from the detector until Ctrl+C
     try:
 
         print(r""" This dog is just for fun. If you feel sad look at him.
@@ -504,34 +1180,64 @@ def do_data_acquisition(polling_period, file_name, file_type, max_packet_size, f
 
                 """)
 
-        data_buffer_array       = Array('i', [0, 0, 0, 0])
-
+        import signal
+        from multiprocessing import Value
+        Worker = pipeline_worker(pipeline)
 
-        manager = Manager()
-        data_buffer_array_order = manager.list()
-        #data_buffer_array_order = Array('i', [])
-
-        total_transmitted_bytes = Value('i', 0)
+        # One lock-free descriptor ring per DMA engine, between its fill process and the writer
+        packet_rings            = [make_packet_ring(s2mm_mode, len(outputs)) for channel in range(dma_channels)]
+        doorbell                = Doorbell(len(outputs)) if notify == 'event' else None # fill processes wake the writer when they publish
+        spools                  = [SpillSpool(os.path.join(spool_dir, f"axi_dma_spool_{os.getpid()}_{channel}.bin")) if backpressure == 'spill' else None for channel in range(dma_channels)]
+        stats                   = make_stats(dma_channels, outputs) # 64-bit counters, each stage publishes its own
         do_write_memory_while   = Value('i', 0)
         do_fill_memory_while    = Value('i', 0)
-        stop                    = Value('i', 0)
 
-        do_configure()
+        do_configure(dma_channels, wait_config[0])
 
-        if fill_process_type == "standard" :
-            p1 = Process(target=do_fill_memory , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, stop, debug, data_buffer_array_order, ))
-            p1.start()
-        elif fill_process_type == "buffered" :
-            p1 = Process(target=do_fill_memory_high_speed , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, stop, debug, data_buffer_array_order, ))
+        # Ctrl+C only reaches this process: the stages are stopped through their flags, so the rings are drained and the files closed
+        previous_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        cpu_start  = os.times()
+        start_time = time.perf_counter()
+        fill_processes = []
+        for channel in range(dma_channels):
+            if s2mm_mode == 'sg':
+                p1 = stage_worker(Worker, scheduling, 'fill', do_fill_memory_sg, (packet_rings[channel], stats, do_fill_memory_while, polling_period, max_packet_size, debug, channel, stage_copy(doorbell)))
+            else:
+                p1 = stage_worker(Worker, scheduling, 'fill', do_fill_memory_high_speed_socket, (packet_rings[channel], stats, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit if fill_process_type == 'buffered' else 0, debug, wait_config, channel, stage_copy(doorbell), backpressure, spools[channel]))
             p1.start()
-        else :
-            print("***  ERROR  *** | Please choise 'standard' or 'buffered' options")
-
-        p2 = Process(target=do_write_memory, args=(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, file_name, file_type, stop, debug, data_buffer_array_order, ))
-        p2.start()
-
-        p1.join()
-        p2.join()
+            fill_processes.append(p1)
+
+        consumer_processes = make_consumer_processes(outputs, packet_rings, stats, do_write_memory_while, polling_period, file_name, debug, doorbell, spools, pipeline, scheduling, sink_config, file_type, compression_config)
+        for p2 in consumer_processes:
+            p2.start()
+        signal.signal(signal.SIGINT, previous_handler)
+
+        print("--->    Data acquisition running, press Ctrl+C to stop")
+        try:
+            while any(p1.is_alive() for p1 in fill_processes):
+                time.sleep(MONITOR_INTERVAL)
+        except KeyboardInterrupt:
+            print("")
+            print("--->    Stopping the data acquisition")
+        # Fill processes first: they may still publish (last spool segment) and the writer drains until it returns
+        do_fill_memory_while.value = 1
+        for p1 in fill_processes:
+            p1.join()
+        do_write_memory_while.value = 1
+        if doorbell is not None:
+            doorbell.ring()
+        for p2 in consumer_processes:
+            p2.join()
+        print(stats.report("S2MM"))
+        print_pipeline_report(pipeline, cpu_start, start_time, transmitted_bytes(stats, dma_channels))
+        stats.close()
+        for packet_ring in packet_rings:
+            packet_ring.close()
+        if doorbell is not None:
+            doorbell.close()
+        for spool in spools:
+            if spool is not None:
+                spool.remove()
         print("")
         print("")
     except KeyboardInterrupt:
@@ -541,7 +1247,7 @@ def do_data_acquisition(polling_period, file_name, file_type, max_packet_size, f
 
 
 
-def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name, file_type, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug):
+def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name, file_type, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug, wait_config, s2mm_mode, dma_channels=1, notify='poll', backpressure='block', spool_dir='/tmp', outputs=('file',), pipeline='process', scheduling=None, sink_config=DEFAULT_SINK_CONFIG, compression_config=DEFAULT_COMPRESSION_CONFIG):
     try:
 
         print(r""" This giraffe is just for fun. If you feel sad look at its funny eyes.
@@ -572,16 +1278,18 @@ def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name,
 
         do_configure()
         '''
-        BUFFER_SIZE             = 240
-        data_buffer_array       = Array('i', BUFFER_SIZE)
-        write_index             = Value('i', 0)
-        read_index              = Value('i', 0)
-        data_buffer_queue       = RawArray('i', BUFFER_SIZE)
-        total_transmitted_bytes = Value('i', 0)
+        from multiprocessing import Value
+        Worker = pipeline_worker(pipeline)
+
+        # One lock-free descriptor ring per DMA engine, between its fill process and the writer
+        packet_rings            = [make_packet_ring(s2mm_mode, len(outputs)) for channel in range(dma_channels)]
+        doorbell                = Doorbell(len(outputs)) if notify == 'event' else None # fill processes wake the writer when they publish
+        spools                  = [SpillSpool(os.path.join(spool_dir, f"axi_dma_spool_{os.getpid()}_{channel}.bin")) if backpressure == 'spill' else None for channel in range(dma_channels)]
+        stats                   = make_stats(dma_channels, outputs) # 64-bit counters, each stage publishes its own
         do_write_memory_while   = Value('i', 0)
         do_fill_memory_while    = Value('i', 0)
 
-        do_configure()
+        do_configure(dma_channels, wait_config[0])
 
         '''
         if fill_process_type == "standard" :
@@ -594,21 +1302,46 @@ def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name,
             print("***  ERROR  *** | Please choise 'standard' or 'buffered' options")
         '''
 
-        p1 = Process(target=do_fill_memory_high_speed_socket , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, data_buffer_queue, BUFFER_SIZE, write_index))
-        p1.start()
+        cpu_start  = os.times()
+        start_time = time.perf_counter()
+        fill_processes = []
+        for channel in range(dma_channels):
+            if s2mm_mode == 'sg':
+                p1 = stage_worker(Worker, scheduling, 'fill', do_fill_memory_sg, (packet_rings[channel], stats, do_fill_memory_while, polling_period, max_packet_size, debug, channel, stage_copy(doorbell)))
+            else:
+                p1 = stage_worker(Worker, scheduling, 'fill', do_fill_memory_high_speed_socket, (packet_rings[channel], stats, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit if fill_process_type == 'buffered' else 0, debug, wait_config, channel, stage_copy(doorbell), backpressure, spools[channel]))
+            p1.start()
+            fill_processes.append(p1)
 
         #p2 = Process(target=do_write_memory, args=(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, file_name, file_type, stop, debug, data_buffer_array_order, ))
-        p2 = Process(target=do_write_memory_indexing, args=(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, data_buffer_queue, BUFFER_SIZE, write_index, read_index, file_name, ))
-        p2.start()
-
-        p3 = Process(target=do_load_fifo_rate_not_verbose, args=(NumberOfEvents, period, packet_size, ))
-        p3.start()
-        p3.join()
-        do_write_memory_while.value = 1
+        consumer_processes = make_consumer_processes(outputs, packet_rings, stats, do_write_memory_while, polling_period, file_name, debug, doorbell, spools, pipeline, scheduling, sink_config, file_type, compression_config)
+        for p2 in consumer_processes:
+            p2.start()
+
+        load_processes = [stage_worker(Worker, scheduling, 'load', do_load_fifo_rate_not_verbose, (NumberOfEvents, period, packet_size, wait_config, channel, )) for channel in range(dma_channels)]
+        for p3 in load_processes:
+            p3.start()
+        for p3 in load_processes:
+            p3.join()
+        # Fill processes first: they may still publish (last spool segment) and the writer drains until it returns
         do_fill_memory_while.value = 1
-
-        p1.join()
-        p2.join()
+        for p1 in fill_processes:
+            p1.join()
+        do_write_memory_while.value = 1
+        if doorbell is not None:
+            doorbell.ring()
+        for p2 in consumer_processes:
+            p2.join()
+        print(stats.report("S2MM"))
+        print_pipeline_report(pipeline, cpu_start, start_time, transmitted_bytes(stats, dma_channels))
+        stats.close()
+        for packet_ring in packet_rings:
+            packet_ring.close()
+        if doorbell is not None:
+            doorbell.close()
+        for spool in spools:
+            if spool is not None:
+                spool.remove()
         print("")
         print("")
     except KeyboardInterrupt:
@@ -620,7 +1353,7 @@ def do_benchmark(NumberOfEvents, period, packet_size, polling_period, file_name,
 
 
 
-def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug, file_path):
+def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_packet_size, fill_process_type, timeout_period, data_buffer_limit, debug, file_path, wait_config, s2mm_mode, dma_channels=1, notify='poll', backpressure='block', spool_dir='/tmp', outputs=('tcp',), pipeline='process', scheduling=None, sink_config=DEFAULT_SINK_CONFIG, compression_config=DEFAULT_COMPRESSION_CONFIG):
     try:
 
         print(r""" The parrot is just for fun. Be carefull. It was a  pirate...
@@ -638,44 +1371,67 @@ def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_pa
  Remember that YOU have to start manually the receiving server before this benchmark!
                 """)
 
-        BUFFER_SIZE       = 240
-        data_buffer_array = Array('i', BUFFER_SIZE)
-        write_index       = Value('i', 0)
-        read_index        = Value('i', 0)
-        data_buffer_queue = RawArray('i', BUFFER_SIZE)
+        from multiprocessing import Value
+        Worker = pipeline_worker(pipeline)
+
+        # One lock-free descriptor ring per DMA engine, between its fill process and the sender
+        packet_rings       = [make_packet_ring(s2mm_mode, len(outputs)) for channel in range(dma_channels)]
+        doorbell           = Doorbell(len(outputs)) if notify == 'event' else None # fill processes wake the sender when they publish
+        spools             = [SpillSpool(os.path.join(spool_dir, f"axi_dma_spool_{os.getpid()}_{channel}.bin")) if backpressure == 'spill' else None for channel in range(dma_channels)]
 
         #manager = Manager()
         #data_buffer_array_order = manager.list()
         #data_buffer_queue = Queue(maxsize=240)
         
-        total_transmitted_bytes = Value('i', 0)
+        stats                   = make_stats(dma_channels, outputs) # 64-bit counters, each stage publishes its own
         do_write_memory_while   = Value('i', 0)
         do_fill_memory_while    = Value('i', 0)
 
 
-        #HOST = '127.0.0.1'
-        HOST = '192.168.2.1'
-        PORT_TCP = 5001
-
-        do_configure()
+        do_configure(dma_channels, wait_config[0])
 
 
-        p1 = Process(target=do_fill_memory_high_speed_socket , args=(data_buffer_array, total_transmitted_bytes, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit, debug, data_buffer_queue, BUFFER_SIZE, write_index))
-        p1.start()
+        cpu_start  = os.times()
+        start_time = time.perf_counter()
+        fill_processes = []
+        for channel in range(dma_channels):
+            if s2mm_mode == 'sg':
+                p1 = stage_worker(Worker, scheduling, 'fill', do_fill_memory_sg, (packet_rings[channel], stats, do_fill_memory_while, polling_period, max_packet_size, debug, channel, stage_copy(doorbell)))
+            else:
+                p1 = stage_worker(Worker, scheduling, 'fill', do_fill_memory_high_speed_socket, (packet_rings[channel], stats, do_fill_memory_while, polling_period, max_packet_size, timeout_period, data_buffer_limit if fill_process_type == 'buffered' else 0, debug, wait_config, channel, stage_copy(doorbell), backpressure, spools[channel]))
+            p1.start()
+            fill_processes.append(p1)
 
-        #p2 = Process(target=do_send_socket, args=(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, debug, data_buffer_queue, HOST, PORT_TCP, BUFFER_SIZE, write_index, read_index, ))
-        p2 = Process(target=do_send_socket_no_print, args=(data_buffer_array, total_transmitted_bytes, do_write_memory_while, polling_period, debug, data_buffer_queue, HOST, PORT_TCP, BUFFER_SIZE, write_index, read_index, ))
-        p2.start()
+        #p2 = Process(target=do_send_socket, args=(packet_rings[0], total_transmitted_bytes, do_write_memory_while, polling_period, debug, TCP_HOST, TCP_PORT, ))
+        consumer_processes = make_consumer_processes(outputs, packet_rings, stats, do_write_memory_while, polling_period, file_path, debug, doorbell, spools, pipeline, scheduling, sink_config, 'b', compression_config)
+        for p2 in consumer_processes:
+            p2.start()
 
         time.sleep(1)
-        p3 = Process(target=do_load_fifo_rate_not_verbose, args=(NumberOfEvents, period, packet_size, ))
-        p3.start()
-        p3.join()
-        do_write_memory_while.value = 1
+        load_processes = [stage_worker(Worker, scheduling, 'load', do_load_fifo_rate_not_verbose, (NumberOfEvents, period, packet_size, wait_config, channel, )) for channel in range(dma_channels)]
+        for p3 in load_processes:
+            p3.start()
+        for p3 in load_processes:
+            p3.join()
+        # Fill processes first: they may still publish (last spool segment) and the writer drains until it returns
         do_fill_memory_while.value = 1
-
-        p1.join()
-        p2.join()
+        for p1 in fill_processes:
+            p1.join()
+        do_write_memory_while.value = 1
+        if doorbell is not None:
+            doorbell.ring()
+        for p2 in consumer_processes:
+            p2.join()
+        print(stats.report("S2MM"))
+        print_pipeline_report(pipeline, cpu_start, start_time, transmitted_bytes(stats, dma_channels))
+        stats.close()
+        for packet_ring in packet_rings:
+            packet_ring.close()
+        if doorbell is not None:
+            doorbell.close()
+        for spool in spools:
+            if spool is not None:
+                spool.remove()
         print("")
         print("")
     except KeyboardInterrupt:
@@ -685,32 +1441,41 @@ def do_benchmark_tcp(NumberOfEvents, period, packet_size, polling_period, max_pa
 
 
 
-def do_configure():
+def do_configure(dma_channels=1, completion_mode='spin'):
 
     print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
     print("++                  BEGIN CONFIGURATION PROCEDURE                ++")
     print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
-    dma_s2mm_status(axi_dma_0_ctrl_addr)
-    dma_mm2s_status(axi_dma_0_ctrl_addr)
-    print("Start AXI DMA configuration")
-    write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RESET_DMA)
-    write_dma(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RESET_DMA)
-    dma_s2mm_status(axi_dma_0_ctrl_addr)
-    dma_mm2s_status(axi_dma_0_ctrl_addr)
-    time.sleep(0.1)
-    write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
-    write_dma(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ)
-    write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RUN_DMA)
-    write_dma(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RUN_DMA)
-    write_dma(axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER  , S2MM_OFFSET)
-    write_dma(axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET)
-    #write_dma(axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER  , 4)
-    #write_dma(axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER, 4)
-    dma_s2mm_status(axi_dma_0_ctrl_addr)
-    dma_mm2s_status(axi_dma_0_ctrl_addr)
+    for channel in range(dma_channels):
+        dma_ctrl = dma_channel_ctrl(channel)
+        dma_s2mm_status(dma_ctrl)
+        dma_mm2s_status(dma_ctrl)
+        print(f"Start AXI DMA {channel} configuration")
+        # Interrupts only for --completion_mode irq: the axi_mem interrupt handler acknowledges IOC,
+        # which the spin and backoff waits look for in the status register
+        irq_enable = ENABLE_ALL_IRQ if completion_mode == 'irq' else 0
+        # Reset, IRQ enable, run and addresses in a single kernel entry
+        batch = RegisterBatch(hw, DMA_CTRL_REGIONS[channel])
+        batch.write(S2MM_CONTROL_REGISTER, RESET_DMA).write(MM2S_CONTROL_REGISTER, RESET_DMA)
+        batch.read(S2MM_STATUS_REGISTER).read(MM2S_STATUS_REGISTER)
+        batch.delay(0.1)
+        batch.write_many((
+            (S2MM_CONTROL_REGISTER      , irq_enable),
+            (MM2S_CONTROL_REGISTER      , irq_enable),
+            (S2MM_CONTROL_REGISTER      , RUN_DMA | irq_enable),
+            (MM2S_CONTROL_REGISTER      , RUN_DMA | irq_enable),
+            (S2MM_DST_ADDRESS_REGISTER  , S2MM_PHYS_0 + channel*S2MM_CHANNEL_STRIDE),
+            (MM2S_SRC_ADDRESS_REGISTER  , MM2S_PHYS_0),
+        ))
+        s2mm_reset_status, mm2s_reset_status = batch.run()
+        print(f"- Configure info --> Status after reset: S2MM 0x{s2mm_reset_status:08x} | MM2S 0x{mm2s_reset_status:08x}")
+        #write_dma(dma_ctrl, S2MM_BUFF_LENGTH_REGISTER  , 4)
+        #write_dma(dma_ctrl, MM2S_TRNSFR_LENGTH_REGISTER, 4)
+        dma_s2mm_status(dma_ctrl)
+        dma_mm2s_status(dma_ctrl)
     print("FIFO STATUS")
-    read_dma_status(axi_gpio_2_ctrl_addr, 0x0)
-    #read_dma_status(axi_gpio_2_ctrl_addr, 0x8)
+    read_dma_status(hw.axi_gpio_2_ctrl_addr, 0x0)
+    #read_dma_status(hw.axi_gpio_2_ctrl_addr, 0x8)
     print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
     print("++                   END CONFIGURATION PROCEDURE                 ++")
     print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
@@ -719,56 +1484,67 @@ def do_configure():
 
 
 
-def do_read_word(byte):
+def do_read_word(byte, wait_config=DEFAULT_WAIT_CONFIG):
     #print("Source memory block data:      ", end="")
-    #print_mem(axi_S2MM_0_virtual_addr, byte)
+    #print_mem(hw.axi_S2MM_0_virtual_addr, byte)
 
     #print("Clearing the destination register block...")
-    #axi_S2MM_0_virtual_addr.write(bytes([0] * byte))
+    #hw.axi_S2MM_0_virtual_addr.write(bytes([0] * byte))
 
     #print("Memory before reading the word:   ", end="")
-    #print_mem(axi_S2MM_0_virtual_addr, byte)
+    #print_mem(hw.axi_S2MM_0_virtual_addr, byte)
 
+    waiter = make_wait_strategy(wait_config, IRQ_S2MM_DEVICE)
     start_time = time.time()
 
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
-    #write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RESET_DMA     ) # Reset the DMA
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RESET_DMA     ) # Reset the DMA
 
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
-    #write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ) # Enable all interrupts.
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , ENABLE_ALL_IRQ) # Enable all interrupts.
 
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
-    #write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RUN_DMA       ) # Run DMA
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER      , RUN_DMA       ) # Run DMA
 
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
-    #write_dma(axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER  , S2MM_OFFSET   ) # Writing source address of the data from MM2S in DDR...
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER  , S2MM_PHYS_0   ) # Writing source address of the data from MM2S in DDR...
 
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
-    #write_dma(axi_dma_0_ctrl_addr, S2MM_STATUS_REGISTER      , CLEAR_IOC_IRQ     )
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, S2MM_STATUS_REGISTER      , CLEAR_IOC_IRQ     )
 
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
-    write_dma(axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER  , byte          ) # Writing MM2S transfer length of 4 bytes -> 32 bit -> 1 word
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
+    write_dma(hw.axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER  , byte          ) # Writing MM2S transfer length of 4 bytes -> 32 bit -> 1 word
 
 
     
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
-    dma_s2mm_sync(axi_dma_0_ctrl_addr)                                         # Waiting for MM2S synchronization...
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
+    completed = dma_s2mm_sync(hw.axi_dma_0_ctrl_addr, waiter)                     # Waiting for MM2S synchronization...
 
     end_time = time.time()
-
+    print(waiter.report("S2MM"))
+    waiter.close()
+    if not completed:
+        print(f"***  ERROR  *** | S2MM transfer did not complete within {wait_config[3]} ms")
+        return
+    invalidate_s2mm(0, byte)
+
+    text_sink = HexTextSink("output.txt")
+    bin_sink  = FileSink("output.bin")
     start_time_txt = time.time()
-    save_mem_to_file_hex(axi_S2MM_0_virtual_addr, 0, byte, "output.txt")
+    save_mem_to_file_hex(hw.axi_S2MM_0_virtual_addr, 0, byte, text_sink)
     end_time_txt = time.time()
 
     start_time_bin = time.time()
-    save_mem_to_file_bin(axi_S2MM_0_virtual_addr, 0, byte, "output.bin")
+    save_mem_to_file_bin(hw.axi_S2MM_0_virtual_addr, 0, byte, bin_sink)
     end_time_bin = time.time()
+    text_sink.close()
+    bin_sink.close()
 
     print("Memory after reading the word:   ", end="")
-    #print_mem(axi_S2MM_0_virtual_addr, byte)
+    #print_mem(hw.axi_S2MM_0_virtual_addr, byte)
     print("FIFO STATUS")
-    read_dma_status(axi_gpio_2_ctrl_addr, 0x0)
-    #read_dma_status(axi_gpio_2_ctrl_addr, 0x8)
+    read_dma_status(hw.axi_gpio_2_ctrl_addr, 0x0)
+    #read_dma_status(hw.axi_gpio_2_ctrl_addr, 0x8)
     print("=============================")
     delta_time = end_time - start_time
     data_throughput = byte/delta_time
@@ -796,104 +1572,117 @@ def do_ready_to_receive(byte):
     print("*")
 
     #print("-->  Reset the DMA.")
-    #write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER, RESET_DMA)
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER, RESET_DMA)
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
 
     #print("-->  Enable all interrupts.")
-    #write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER, ENABLE_ALL_IRQ)
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER, ENABLE_ALL_IRQ)
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
 
     #print("-->  Writing the destination address for the data from S2MM in DDR...")
-    write_dma(axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER, S2MM_OFFSET)
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
+    write_dma(hw.axi_dma_0_ctrl_addr, S2MM_DST_ADDRESS_REGISTER, S2MM_PHYS_0)
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
 
     #print("-->  Run the S2MM channel.")
-    #write_dma(axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER, RUN_DMA)
-    #dma_s2mm_status(axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, S2MM_CONTROL_REGISTER, RUN_DMA)
+    #dma_s2mm_status(hw.axi_dma_0_ctrl_addr)
     print("***  WAITING FOR A PACKET")
-    while True:
-
-        #print("-->  Clear all the interrupts...")
-        #write_dma(axi_dma_0_ctrl_addr, S2MM_STATUS_REGISTER    , CLEAR_IOC_IRQ  )
-
-        if ((int(read_dma(axi_gpio_2_ctrl_addr, 0x0)))>10):
-            start_time = time.time()
-            #print(f"-->  Writing S2MM transfer length of {byte} bytes...")
-            write_dma(axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER, byte)
-
-            #print("-->  Waiting for S2MM synchronization...")
-            dma_s2mm_sync(axi_dma_0_ctrl_addr)
-            end_time = time.time()
-
-            received_bytes = read_dma(axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER)
-            print(f"***  Total number of bytes received during transaction {received_bytes} bytes")
-
-
-
-            print("***  Writing to files")
-            #print("***  Destination memory block: ", end="")
-            #print_mem(axi_S2MM_0_virtual_addr, byte)
-            start_time_txt = time.time()
-            save_mem_to_file_hex(axi_S2MM_0_virtual_addr, 0, received_bytes, "output.txt")
-            end_time_txt = time.time()
-            start_time_bin = time.time()
-            save_mem_to_file_bin(axi_S2MM_0_virtual_addr, 0, received_bytes, "output.bin")
-            end_time_bin = time.time()
-            print(f"S2MM Data throughput: {(received_bytes/(end_time - start_time))/1000000} MB/s, {8*(received_bytes/(end_time - start_time))/1000000000} Gb/s")
-            print(f"Time elapsed to write txt file -> {(end_time_txt - start_time_txt)*1000} ms -> {(received_bytes/(end_time_txt - start_time_txt))/1000000} MB/s")
-            print(f"Time elapsed to write bin file -> {(end_time_bin - start_time_bin)*1000} ms -> {(received_bytes/(end_time_bin - start_time_bin))/1000000} MB/s")
-            print("***  DONE")
-            print("=======================================================================")
-            print("***  WAITING FOR A PACKET")
-        else:
-            time.sleep(0.01)
+    text_sink = HexTextSink("output.txt") # both files stay open until the acquisition is stopped
+    bin_sink  = FileSink("output.bin")
+    try:
+        while True:
+
+            #print("-->  Clear all the interrupts...")
+            #write_dma(hw.axi_dma_0_ctrl_addr, S2MM_STATUS_REGISTER    , CLEAR_IOC_IRQ  )
+
+            if ((int(read_dma(hw.axi_gpio_2_ctrl_addr, 0x0)))>10):
+                start_time = time.time()
+                #print(f"-->  Writing S2MM transfer length of {byte} bytes...")
+                write_dma(hw.axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER, byte)
+
+                #print("-->  Waiting for S2MM synchronization...")
+                dma_s2mm_sync(hw.axi_dma_0_ctrl_addr)
+                end_time = time.time()
+
+                received_bytes = read_dma(hw.axi_dma_0_ctrl_addr, S2MM_BUFF_LENGTH_REGISTER)
+                invalidate_s2mm(0, received_bytes)
+                print(f"***  Total number of bytes received during transaction {received_bytes} bytes")
+
+
+
+                print("***  Writing to files")
+                #print("***  Destination memory block: ", end="")
+                #print_mem(hw.axi_S2MM_0_virtual_addr, byte)
+                start_time_txt = time.time()
+                save_mem_to_file_hex(hw.axi_S2MM_0_virtual_addr, 0, received_bytes, text_sink)
+                end_time_txt = time.time()
+                start_time_bin = time.time()
+                save_mem_to_file_bin(hw.axi_S2MM_0_virtual_addr, 0, received_bytes, bin_sink)
+                end_time_bin = time.time()
+                print(f"S2MM Data throughput: {(received_bytes/(end_time - start_time))/1000000} MB/s, {8*(received_bytes/(end_time - start_time))/1000000000} Gb/s")
+                print(f"Time elapsed to write txt file -> {(end_time_txt - start_time_txt)*1000} ms -> {(received_bytes/(end_time_txt - start_time_txt))/1000000} MB/s")
+                print(f"Time elapsed to write bin file -> {(end_time_bin - start_time_bin)*1000} ms -> {(received_bytes/(end_time_bin - start_time_bin))/1000000} MB/s")
+                print("***  DONE")
+                print("=======================================================================")
+                print("***  WAITING FOR A PACKET")
+            else:
+                time.sleep(0.01)
+    finally:
+        text_sink.close()
+        bin_sink.close()
 
 
 
 
-def do_load_fifo(NumberOfBytes):
+def do_load_fifo(NumberOfBytes, wait_config=DEFAULT_WAIT_CONFIG):
     print("=======================================================================")
     print("=     Loading the FIFO memory with a configurable number of bytes     =")
     print("=======================================================================")
 
     #print("-->  Source memory before writing:   ")
-    #print_mem(axi_MM2S_0_virtual_addr, NumberOfBytes)
+    #print_mem(hw.axi_MM2S_0_virtual_addr, NumberOfBytes)
 
     for i in range(NumberOfBytes + 1):
-        struct.pack_into('>I', axi_MM2S_0_virtual_addr, i * 4, i)
+        struct.pack_into('>I', hw.axi_MM2S_0_virtual_addr, i * 4, i)
+    flush_mm2s(0, (NumberOfBytes + 1) * 4)
 
     print("-->  Source memory after writing:   ")
-    #print_mem(axi_MM2S_0_virtual_addr, NumberOfBytes)
+    #print_mem(hw.axi_MM2S_0_virtual_addr, NumberOfBytes)
 
     #print("Status before reset")
-    #dma_mm2s_status(axi_dma_0_ctrl_addr)
-    #write_dma(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RESET_DMA     ) # Reset the DMA
-    #write_dma(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ) # Enable all interrupts.
+    #dma_mm2s_status(hw.axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RESET_DMA     ) # Reset the DMA
+    #write_dma(hw.axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , ENABLE_ALL_IRQ) # Enable all interrupts.
 
     #print("Status after reset and before run")
-    #dma_mm2s_status(axi_dma_0_ctrl_addr)
-    #write_dma(axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RUN_DMA       ) # Run DMA
+    #dma_mm2s_status(hw.axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, MM2S_CONTROL_REGISTER      , RUN_DMA       ) # Run DMA
 
     print("-->  Writing the start address for the data from MM2S in DDR...")
-    write_dma(axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET   )
-    dma_mm2s_status(axi_dma_0_ctrl_addr)
+    write_dma(hw.axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_PHYS_0   )
+    dma_mm2s_status(hw.axi_dma_0_ctrl_addr)
     
     #print("-->  Clear all the interrupts...")
-    #write_dma(axi_dma_0_ctrl_addr, MM2S_STATUS_REGISTER      , CLEAR_IOC_IRQ  )
-    #dma_mm2s_status(axi_dma_0_ctrl_addr)
+    #write_dma(hw.axi_dma_0_ctrl_addr, MM2S_STATUS_REGISTER      , CLEAR_IOC_IRQ  )
+    #dma_mm2s_status(hw.axi_dma_0_ctrl_addr)
 
     print(f"-->  Writing S2MM transfer length of {NumberOfBytes} bytes...")
     start_time = time.time()
-    write_dma(axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER, NumberOfBytes ) # Writing MM2S transfer length of 4 bytes -> 32 bit -> 1 word
-    #dma_mm2s_status(axi_dma_0_ctrl_addr)
+    write_dma(hw.axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER, NumberOfBytes ) # Writing MM2S transfer length of 4 bytes -> 32 bit -> 1 word
+    #dma_mm2s_status(hw.axi_dma_0_ctrl_addr)
 
-    dma_mm2s_sync(axi_dma_0_ctrl_addr)                                          # Waiting for MM2S synchronization...
+    waiter = make_wait_strategy(wait_config, IRQ_MM2S_DEVICE)
+    completed = dma_mm2s_sync(hw.axi_dma_0_ctrl_addr, waiter)                      # Waiting for MM2S synchronization...
     end_time = time.time()
+    print(waiter.report("MM2S"))
+    waiter.close()
+    if not completed:
+        print(f"***  ERROR  *** | MM2S transfer did not complete within {wait_config[3]} ms")
 
 
     print("---->   FIFO STATUS   <----")
-    read_dma_status(axi_gpio_2_ctrl_addr, 0x0)
-    #read_dma_status(axi_gpio_2_ctrl_addr, 0x8)
+    read_dma_status(hw.axi_gpio_2_ctrl_addr, 0x0)
+    #read_dma_status(hw.axi_gpio_2_ctrl_addr, 0x8)
 
     print("=============================")
     delta_time = end_time - start_time
@@ -903,7 +1692,7 @@ def do_load_fifo(NumberOfBytes):
     print(f"Data throughput:   {data_throughput/1000000} MB/s, {8*data_throughput/1000000000} Gb/s")
 
 
-def do_load_fifo_rate(NumberOfRepetitions):
+def do_load_fifo_rate(NumberOfRepetitions, wait_config=DEFAULT_WAIT_CONFIG):
     print("==========================================================")
     print(f"Loading {NumberOfRepetitions} emulated data packets of 50000 bytes each")
     
@@ -912,15 +1701,20 @@ def do_load_fifo_rate(NumberOfRepetitions):
     print(f"dead time between events is set to {dead_time*1000} ms")
 
     for i in range(NumberOfBytes + 1):
-        struct.pack_into('>I', axi_MM2S_0_virtual_addr, i * 4, i)
+        struct.pack_into('>I', hw.axi_MM2S_0_virtual_addr, i * 4, i)
+    flush_mm2s(0, (NumberOfBytes + 1) * 4)
 
+    waiter = make_wait_strategy(wait_config, IRQ_MM2S_DEVICE)
     start_time = time.time()
 
     for j in range(NumberOfRepetitions):
         
-        write_dma(axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET   )
-        write_dma(axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER, NumberOfBytes )
-        dma_mm2s_sync(axi_dma_0_ctrl_addr)
+        write_dma(hw.axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_PHYS_0   )
+        write_dma(hw.axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER, NumberOfBytes )
+        if not dma_mm2s_sync(hw.axi_dma_0_ctrl_addr, waiter):
+            print("")
+            print(f"***  ERROR  *** | MM2S transfer {j+1} did not complete within {wait_config[3]} ms")
+            break
         if j < (NumberOfRepetitions - 1):
             print(f"------>     sent {j+1} packets", end='\r')
         else:
@@ -932,27 +1726,37 @@ def do_load_fifo_rate(NumberOfRepetitions):
     print(f"------>     elapsed time = {end_time - start_time} s")
     print(f"------>     event rate   = {NumberOfRepetitions/(end_time - start_time)} Hz")
     print(f"------>     data rate    = {(50000*NumberOfRepetitions)/(end_time - start_time)/1000000} MB/s")
+    print(waiter.report("MM2S"))
+    waiter.close()
     print("==========================================================")
 
-def do_load_fifo_rate_not_verbose(NumberOfRepetitions, period, PacketSize):
+def do_load_fifo_rate_not_verbose(NumberOfRepetitions, period, PacketSize, wait_config=DEFAULT_WAIT_CONFIG, channel=0):
 
     dead_time      = period/10000
+    dma_ctrl       = dma_channel_ctrl(channel)
+    waiter         = make_wait_strategy(wait_config, IRQ_MM2S_DEVICE)
 
-    print(f"- MM2S info --> Started process | Loading {NumberOfRepetitions} data packets of {PacketSize} bytes each. Dead time is {period/10} ms")
+    print(f"- MM2S info --> Started process | DMA channel: {channel} | Loading {NumberOfRepetitions} data packets of {PacketSize} bytes each. Dead time is {period/10} ms")
     print("")
 
     #time.sleep(1.0)
 
     for i in range(PacketSize + 1):
-        struct.pack_into('>I', axi_MM2S_0_virtual_addr, i * 4, i)
+        struct.pack_into('>I', hw.axi_MM2S_0_virtual_addr, i * 4, i)
+    flush_mm2s(0, (PacketSize + 1) * 4)
 
     start_time = time.time()
+    cpu_start  = time.thread_time()
+    sends      = JitterStats()
 
     for j in range(NumberOfRepetitions):
         
-        write_dma(axi_dma_0_ctrl_addr, MM2S_SRC_ADDRESS_REGISTER  , MM2S_OFFSET   )
-        write_dma(axi_dma_0_ctrl_addr, MM2S_TRNSFR_LENGTH_REGISTER, PacketSize )
-        dma_mm2s_sync(axi_dma_0_ctrl_addr)
+        write_dma(dma_ctrl, MM2S_SRC_ADDRESS_REGISTER  , MM2S_PHYS_0   )
+        write_dma(dma_ctrl, MM2S_TRNSFR_LENGTH_REGISTER, PacketSize )
+        if not dma_mm2s_sync(dma_ctrl, waiter):
+            print(f"- MM2S info --> Transfer {j+1} did not complete within {wait_config[3]} ms, stopping")
+            break
+        sends.tick()
         #if j < (NumberOfRepetitions - 1):
             #print(f"------>     sent {j+1} packets", end='\r')
         #else:
@@ -963,11 +1767,73 @@ def do_load_fifo_rate_not_verbose(NumberOfRepetitions, period, PacketSize):
 
     print("")
     print(f"- MM2S info --> Elapsed time {end_time - start_time:.2f} s | Event rate {NumberOfRepetitions/(end_time - start_time):.2f} Hz | Data rate {(PacketSize*NumberOfRepetitions)/(end_time - start_time)/1000000:.2f} MB/s")
+    print_cpu_report("MM2S", waiter.mode, time.thread_time() - cpu_start, PacketSize*(waiter.waits - waiter.timeouts))
+    print(waiter.report("MM2S"))
+    print(sends.report("MM2S", "Send"))
+    waiter.close()
     #print("==========================================================")
 
 
 
 
+def do_copy_benchmark(PacketSize, NumberOfPackets):
+    """Copy speed of the S2MM buffer out of user space through each cache policy of /dev/axi_mem."""
+    print("==========================================================")
+    print(f"Buffer copy benchmark | {NumberOfPackets} packets of {PacketSize} bytes | cached includes the invalidate ioctl per packet")
+    cache_sync = CacheSync(hw)
+    reference = None
+    for label in ('uncached', 'wc', 'cached'):
+        try:
+            buffer_map = mmap.mmap(hw.device_fd(), 16*64*1024, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=S2MM_OFFSET_0 | BUFFER_CACHE_ALIASES[label])
+        except OSError as error:
+            print(f"- Copy info --> {label:<8}: mapping refused ({error})")
+            continue
+        start_time = time.perf_counter()
+        for i in range(NumberOfPackets):
+            offset = (i % 16)*64*1024
+            if label == 'cached':
+                cache_sync.invalidate(S2MM_OFFSET_0 + offset, PacketSize)
+            buffer_map[offset : offset + PacketSize]
+        elapsed = time.perf_counter() - start_time
+        buffer_map.close()
+        if reference is None:
+            reference = elapsed
+        print(f"- Copy info --> {label:<8}: {PacketSize*NumberOfPackets/elapsed/1000000:8.2f} MB/s | {elapsed/NumberOfPackets*1e6:8.2f} us/packet | x{reference/elapsed:.2f}")
+    print("==========================================================")
+
+
+def parse_stage_values(parser, option, text, convert):
+    values = {}
+    for item in text.split(','):
+        stage, _, value = item.partition('=')
+        if stage not in PIPELINE_STAGES or not value:
+            parser.error(f"{option} takes stage=value pairs, stages {', '.join(PIPELINE_STAGES)}")
+        try:
+            values[stage] = convert(value)
+        except ValueError:
+            parser.error(f"{option}: invalid value {value} for stage {stage}")
+    return values
+
+def parse_scheduling(parser, args):
+    # {'mlock': bool, stage: {'cpus': set, 'fifo_priority': int, 'nice': int}}, None when nothing was asked
+    scheduling = {'mlock': args.mlock}
+    for option, key, text, convert in (('--cpu_affinity', 'cpus', args.cpu_affinity, lambda value: {int(cpu) for cpu in value.split('+')}),
+                                       ('--rt_priority', 'fifo_priority', args.rt_priority, int),
+                                       ('--nice', 'nice', args.nice, int)):
+        if text:
+            for stage, value in parse_stage_values(parser, option, text, convert).items():
+                scheduling.setdefault(stage, {})[key] = value
+    return scheduling if len(scheduling) > 1 or args.mlock else None
+
+def print_startup_timing(command_start, command_end):
+    mapping_time = sum(seconds for name, seconds in hw.timings)
+    print(f"- Startup info --> Module load {(MODULE_LOAD_END - MODULE_LOAD_START)*1000:.2f} ms | Argument parsing {(command_start - MODULE_LOAD_END)*1000:.2f} ms | Command {(command_end - command_start - mapping_time)*1000:.2f} ms | Mappings {mapping_time*1000:.2f} ms")
+    for name, seconds in hw.timings:
+        print(f"- Startup info --> Mapped {name:<24}: {seconds*1000:.3f} ms")
+
+
+MODULE_LOAD_END = time.perf_counter()
+
 def main():
 
     parser = argparse.ArgumentParser(description="Python3 driver For the Eclypse Z7 board. Developed at INFN Turin.")
@@ -978,17 +1844,50 @@ def main():
     parser.add_argument('--benchmark', action='store_true', help='Perform a transmission speed benchmark. Example usage: python3 eclypse_driver.py --benchmark --number_of_packets 1000 --packet_period 3 --packet_size 60000 --polling_period 20 --file_name test.bin --file_type b --max_packet_size 65535')
     parser.add_argument('--packet_period', type=int, default=10, help='period between MM2S transfers to be used in benchmark in hundreds of us - default=10')
     parser.add_argument('--packet_size', type=int, default=50000, help='number of byte in a packet to be used in benchmark - default=50000')
-    parser.add_argument('--max_packet_size', type=int, default=65000, help='Max number of bytes that the driver can receive in a single transaction - default=65000')
+    parser.add_argument('--max_packet_size', type=int, default=65000, help='Max number of bytes that the driver can receive in a single transaction, --s2mm_mode simple packs the transfers in the S2MM region so it can exceed 64 KB - default=65000')
     parser.add_argument('--number_of_packets', type=int, default=100, help='Number of packets to be used in the benchmark - default=100')
     parser.add_argument('--polling_period', type=int, default=10, help='Polling period of the S2MM python driver value expressed in hundreds of us - default=10')
     parser.add_argument('--file_name', type=str, default="output_default_file_name.bin", help='Provide filename to be used for benchmark please - default="output_default_file_name.bin"')
-    parser.add_argument('--file_type', type=str, choices=['b', 't'], default='b', help='Select file type, b for binary, t for text. To be noted that text type is extremely slow - default="b"')
+    parser.add_argument('--file_type', type=str, choices=['b', 't', 'm'], default='b', help='Select file type, b for binary, t for text (hex, a space every 4 bytes, a line per buffer), m for binary written through a preallocated memory mapping of the file (--file_extent_mb) - default="b"')
+    parser.add_argument('--convert_text', type=str, default=None, help='Convert a binary recording offline to the --file_type t format, written next to it with a .txt extension. Example usage: --convert_text test.bin --line_bytes 60000')
+    parser.add_argument('--line_bytes', type=int, default=65536, help='--convert_text: bytes per text line, binary recordings do not keep the packet boundaries - default=65536')
+    parser.add_argument('--convert_framed', action='store_true', help='--convert_text: the input has a 4 byte big-endian length before every packet (spool files, a recorded TCP stream), write one line per packet')
+    parser.add_argument('--compression', type=str, choices=COMPRESSION_CODECS, default='none', help='Compress the file and TCP outputs of --benchmark/--benchmark_tcp/--acquisition in blocks, each written as a codec byte (1 zlib, 2 lzma), a 4 byte raw length, a 4 byte compressed length (big-endian) and the compressed block; dma_utils.decompress_blocks reads them back - default="none"')
+    parser.add_argument('--compression_level', type=int, default=-1, help='zlib level 0-9 or lzma preset 0-9, -1 for the codec default - default=-1')
+    parser.add_argument('--compression_workers', type=int, default=2, help='Compression pool size of each consumer - default=2')
+    parser.add_argument('--compression_pool', type=str, choices=COMPRESSION_POOLS, default='thread', help='Compress in threads (zlib and lzma release the GIL) or in processes - default="thread"')
+    parser.add_argument('--compression_block', type=int, default=1048576, help='Raw bytes per compressed block, smaller blocks lower the latency and the ratio - default=1048576')
+    parser.add_argument('--file_extent_mb', type=int, default=256, help='--file_type m: MB reserved with posix_fallocate and mapped at a time - default=256')
     parser.add_argument('--fill_process_type', type=str, choices=['standard', 'buffered'], default='buffered', help='Select fill memory function - default="buffered"')
     parser.add_argument('--timeout_period', type=int, default=1000, help='Timeout time for buffered fill memory dump to file in ms - default=1000')
     parser.add_argument('--data_buffer_limit', type=int, default=2097152, help='Max number of bytes that the driver can buffer in a single transaction - default=2097152 -> 2 MB')
     parser.add_argument('--debug', action='store_true', help='Enable debug messages')
-
-    parser.add_argument('--acquisition', action='store_true', help='Start the data taking. Example usage: eclypse_driver.py --acquisition --polling_period 20 --file_name test.bin --file_type b --max_packet_size 65535')
+    parser.add_argument('--s2mm_mode', type=str, choices=['simple', 'sg'], default='simple', help='S2MM transfer mode for the benchmarks: one register-programmed transfer per packet, or a scatter-gather descriptor ring filled by the hardware (needs an AXI DMA built with SG) - default="simple"')
+    parser.add_argument('--timing', action='store_true', help='Print how long module load, argument parsing, each hardware mapping and the command took. Use "python3 -X importtime zynq_axi_driver.py ..." for the import breakdown')
+    parser.add_argument('--dma_channels', type=int, choices=range(1, MAX_DMA_CHANNELS + 1), default=1, help='Number of AXI DMA engines driven in parallel by the benchmarks, each with its own fill process and buffer ring. With more than one the output file gets a _chN suffix per engine and the TCP header becomes (channel, length) - default=1')
+    parser.add_argument('--completion_mode', type=str, choices=WAIT_MODES, default='spin', help='Wait for DMA completion by spinning on the status register, spinning then sleeping with exponential backoff, or sleeping on the axi_mem interrupt channels (needs the module loaded with s2mm_irq/mm2s_irq) - default="spin"')
+    parser.add_argument('--wait_spin_count', type=int, default=1000, help='Status register reads between clock checks, and before the first sleep in backoff mode - default=1000')
+    parser.add_argument('--wait_sleep_max', type=int, default=1000, help='Max backoff sleep in us - default=1000')
+    parser.add_argument('--buffer_cache', type=str, choices=list(BUFFER_CACHE_ALIASES), default='default', help='Cache policy of the S2MM/MM2S buffer mappings: the axi_mem buf_cache module parameter, uncached, write-combine, or cached with an invalidate/flush ioctl around every transfer (needs the buffers in System RAM) - default="default"')
+    parser.add_argument('--copy_benchmark', action='store_true', help='Measure the copy speed out of the S2MM buffer for each cache policy, using --packet_size and --number_of_packets')
+    parser.add_argument('--notify', type=str, choices=NOTIFY_MODES, default='poll', help='How the writer/sender waits on empty packet rings: sleep one polling period, or block on an eventfd the fill processes kick when they publish - default="poll"')
+    parser.add_argument('--backpressure', type=str, choices=BACKPRESSURE_POLICIES, default='block', help='--s2mm_mode simple, when the packet ring is full: stop draining the FPGA FIFO until the writer catches up, keep draining and drop the packets, or keep draining into a spool file the writer replays in order - default="block"')
+    parser.add_argument('--spool_dir', type=str, default='/tmp', help='Directory of the --backpressure spill spool files - default="/tmp"')
+    parser.add_argument('--outputs', type=str, default=None, help=f'Comma separated consumers of the acquired packets for --benchmark/--benchmark_tcp/--acquisition, each one sees every packet: {",".join(OUTPUTS)} (monitor prints the rate and the lag of every consumer). Example: --outputs file,tcp,monitor - default="file" for --benchmark and --acquisition, "tcp" for --benchmark_tcp')
+    parser.add_argument('--pipeline', type=str, choices=PIPELINE_MODES, default='process', help='Run the fill, writer/sender and load stages of --benchmark/--benchmark_tcp/--acquisition as processes, or as threads of one process sharing the mappings and the packet rings - default="process"')
+    parser.add_argument('--cpu_affinity', type=str, default=None, help=f'Pin pipeline stages of --benchmark/--benchmark_tcp/--acquisition to CPUs, stages {"/".join(PIPELINE_STAGES)}, several CPUs joined with +. Example: --cpu_affinity fill=1,writer=0,load=0')
+    parser.add_argument('--rt_priority', type=str, default=None, help='SCHED_FIFO priority (1-99) per pipeline stage, needs CAP_SYS_NICE. Example: --rt_priority fill=50,load=40')
+    parser.add_argument('--nice', type=str, default=None, help='Nice value per pipeline stage, negative values need CAP_SYS_NICE. Example: --nice writer=-5')
+    parser.add_argument('--mlock', action='store_true', help='Lock the memory of every pipeline stage with mlockall, so no stage page faults in the middle of the run')
+    parser.add_argument('--wait_timeout', type=int, default=0, help='Deadline for a single DMA transfer in ms, 0 waits forever - default=0')
+    parser.add_argument('--disk_writer', type=str, choices=DISK_WRITERS, default='direct', help='File output of --benchmark/--benchmark_tcp/--acquisition: the writer writes the ring slots itself, or copies them into staging buffers written by a background thread so disk stalls do not hold the ring - default="direct"')
+    parser.add_argument('--staging_buffer_size', type=int, default=4194304, help='Size of one --disk_writer async staging buffer in bytes - default=4194304 -> 4 MB')
+    parser.add_argument('--staging_buffers', type=int, default=2, help='Number of --disk_writer async staging buffers, at least 2 - default=2')
+    parser.add_argument('--fsync', type=str, choices=FSYNC_POLICIES, default='none', help='--disk_writer async durability: leave write back to the kernel, fsync every --fsync_interval seconds, or fsync every --fsync_mb MB - default="none"')
+    parser.add_argument('--fsync_interval', type=float, default=1.0, help='Seconds between two fsync with --fsync periodic - default=1.0')
+    parser.add_argument('--fsync_mb', type=int, default=64, help='MB written between two fsync with --fsync bytes - default=64')
+
+    parser.add_argument('--acquisition', action='store_true', help='Start the data taking with the --benchmark stages and options, without the MM2S load, until Ctrl+C. Example usage: zynq_axi_driver.py --acquisition --polling_period 20 --file_name test.bin --file_type b --max_packet_size 65535')
 
     parser.add_argument('--benchmark_tcp', action='store_true', help='Perform a transmission speed benchmark. Example usage: python3 eclypse_driver.py --benchmark --number_of_packets 1000 --packet_period 3 --packet_size 60000 --polling_period 20 --file_name test.bin --file_type b --max_packet_size 65535')
 
@@ -1014,7 +1913,7 @@ def main():
     parser.add_argument('--s2mm_adr', action='store_true', help='Set S2MM start address')
     parser.add_argument('--mm2s_adr_read', action='store_true', help='Read MM2S start address')
     parser.add_argument('--s2mm_adr_read', action='store_true', help='Read S2MM start address')
-    parser.add_argument('-c', '--configure_axi', action='store_true', help='Configuration procedure for the AXI S2MM and MM2S')
+    parser.add_argument('-c', '--configure_axi', action='store_true', help='Configuration procedure for the AXI S2MM and MM2S, the interrupts are enabled only with --completion_mode irq')
     parser.add_argument('--read_word', type=int, help='Read a configurable number of bytes from the S2MM link')
     parser.add_argument('--other', action='store_true', help='Perform the other action-> remember to type "--other ok"')
     parser.add_argument('--read_led_status', action='store_true', help='Perform the other action-> remember to type "--other ok"')
@@ -1022,20 +1921,52 @@ def main():
     parser.add_argument('--read_fifo_status_1', action='store_true', help='Perform the other action-> remember to type "--other ok"')
     parser.add_argument('--read_fifo_status_2', action='store_true', help='Perform the other action-> remember to type "--other ok"')
     args = parser.parse_args()
-
-
-    if args.led :
+    command_start = time.perf_counter()
+    wait_config = (args.completion_mode, args.wait_spin_count, args.wait_sleep_max, args.wait_timeout)
+    if args.completion_mode == 'irq' and args.dma_channels > 1:
+        parser.error("--completion_mode irq only supports --dma_channels 1, the axi_mem module exposes a single interrupt channel per direction")
+    if args.max_packet_size > S2MM_CHANNEL_STRIDE // 2:
+        parser.error(f"--max_packet_size can be at most {S2MM_CHANNEL_STRIDE // 2} bytes, half of the S2MM slice of a DMA channel")
+    if args.fill_process_type == 'buffered' and args.s2mm_mode == 'simple':
+        reservation_limit = S2MM_CHANNEL_STRIDE // (2 if args.backpressure == 'block' else 3)
+        if fill_reservation(args.max_packet_size, args.data_buffer_limit) > reservation_limit:
+            parser.error(f"--fill_process_type buffered reserves --data_buffer_limit + --max_packet_size per descriptor, together they can be at most {reservation_limit - LENGTH_HEADER.size - FRAMED_ALIGN} bytes")
+    outputs = tuple(args.outputs.split(',')) if args.outputs else None
+    compression_config = (args.compression, args.compression_level, args.compression_workers, args.compression_pool, args.compression_block)
+    if args.compression != 'none' and args.file_type != 'b':
+        parser.error("--compression writes binary blocks, use --file_type b")
+    sink_config = (args.disk_writer, args.staging_buffer_size, args.staging_buffers, args.fsync, args.fsync_interval, args.fsync_mb*1024*1024, args.file_extent_mb*1024*1024)
+    if args.file_type != 'b' and args.disk_writer != 'direct':
+        parser.error("--disk_writer async stages binary output, use --file_type b (m copies into its own mapping of the file, t converts and writes in large chunks)")
+    if args.fsync != 'none' and args.disk_writer != 'async':
+        parser.error("--fsync needs --disk_writer async")
+    if args.staging_buffers < 2:
+        parser.error("--staging_buffers must be at least 2, one is filled while the other is written")
+    scheduling = parse_scheduling(parser, args)
+    if outputs and any(output not in OUTPUTS for output in outputs):
+        parser.error(f"--outputs takes a comma separated list of {', '.join(OUTPUTS)}")
+    if args.backpressure != 'block':
+        if args.s2mm_mode == 'sg':
+            parser.error("--backpressure drop/spill needs --s2mm_mode simple, in scatter-gather mode the engine stalls on the descriptors the writer did not release")
+        if args.max_packet_size > S2MM_CHANNEL_STRIDE // 3:
+            parser.error(f"--backpressure drop/spill keeps a scratch buffer at the end of the S2MM slice, --max_packet_size can be at most {S2MM_CHANNEL_STRIDE // 3} bytes")
+    set_buffer_cache(args.buffer_cache)
+
+
+    if args.convert_text:
+        do_convert_text(args.convert_text, args.line_bytes, args.convert_framed)
+    elif args.led :
         led_config(args.led)
     elif args.benchmark:
-        do_benchmark(args.number_of_packets, args.packet_period, args.packet_size, args.polling_period, args.file_name, args.file_type, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug)
+        do_benchmark(args.number_of_packets, args.packet_period, args.packet_size, args.polling_period, args.file_name, args.file_type, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug, wait_config, args.s2mm_mode, args.dma_channels, args.notify, args.backpressure, args.spool_dir, outputs or ('file',), args.pipeline, scheduling, sink_config, compression_config)
     elif args.benchmark_tcp:
-        do_benchmark_tcp(args.number_of_packets, args.packet_period, args.packet_size, args.polling_period, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug, args.file_name)
+        do_benchmark_tcp(args.number_of_packets, args.packet_period, args.packet_size, args.polling_period, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug, args.file_name, wait_config, args.s2mm_mode, args.dma_channels, args.notify, args.backpressure, args.spool_dir, outputs or ('tcp',), args.pipeline, scheduling, sink_config, compression_config)
     elif args.acquisition:
-        do_data_acquisition(args.polling_period, args.file_name, args.file_type, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug)
+        do_data_acquisition(args.polling_period, args.file_name, args.file_type, args.max_packet_size, args.fill_process_type, args.timeout_period, args.data_buffer_limit, args.debug, wait_config, args.s2mm_mode, args.dma_channels, args.notify, args.backpressure, args.spool_dir, outputs or ('file',), args.pipeline, scheduling, sink_config, compression_config)
     elif args.load_fifo_rate:
-        do_load_fifo_rate(args.load_fifo_rate)
+        do_load_fifo_rate(args.load_fifo_rate, wait_config)
     elif args.load_fifo:
-        do_load_fifo(args.load_fifo)
+        do_load_fifo(args.load_fifo, wait_config)
     elif args.mm2s_status:
         do_mm2s_status()
     elif args.s2mm_status:
@@ -1079,7 +2010,7 @@ def main():
     elif args.s2mm_crtl_read:
         do_read_s2mm_crtl()
     elif args.configure_axi:
-        do_configure()
+        do_configure(completion_mode=args.completion_mode)
     elif args.s_mm_receive:
         do_ready_to_receive(args.s_mm_receive)
     elif args.read_led_status:
@@ -1091,17 +2022,18 @@ def main():
     elif args.read_fifo_status_2:
         do_read_fifo_status_2()
     elif args.read_word:
-        do_read_word(args.read_word)
+        do_read_word(args.read_word, wait_config)
+    elif args.copy_benchmark:
+        do_copy_benchmark(args.packet_size, args.number_of_packets)
     elif args.other :
         debug()
     else :
         print("Please provide an argument or call --help")
 
-    axi_dma_0_ctrl_addr.close()
-    axi_gpio_2_ctrl_addr.close()
-    axi_MM2S_0_virtual_addr.close()
-    axi_S2MM_0_virtual_addr.close()
-    os.close(ddr_memory)
+    command_end = time.perf_counter()
+    if args.timing:
+        print_startup_timing(command_start, command_end)
+    hw.close()
 
 
 if __name__ == "__main__":